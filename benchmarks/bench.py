@@ -0,0 +1,353 @@
+"""Benchmarks for the reminder tick, task persistence and conversation handlers.
+
+Generates synthetic task stores and drives the bot's code paths with a
+fake bot, then prints one JSON document with the results:
+
+    python benchmarks/bench.py --reminders 1000 100000 --chats 10000 -o bench.json
+    python benchmarks/bench.py --coalesce -o bench-coalesce.json
+    python benchmarks/bench.py --compare old.json new.json
+
+Everything runs in a temporary directory, so the real data/ is untouched.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Share of each reminder kind in generated stores
+TYPE_MIX = {'one_time': 0.3, 'everyday': 0.5, 'custom': 0.2}
+# Share of recurring reminders at the 09:00 peak minute
+PEAK_SHARE = 0.2
+PEAK_MINUTE = 9 * 60
+
+
+def generate_tasks(reminders, chats, seed=0):
+    """Build a chat_id -> [task dict] store in the JSON shape used on disk."""
+    rng = random.Random(seed)
+    days = ['Mo', 'Tu', 'We', 'Th', 'Fr', 'Sa', 'Su']
+    today = datetime.now(timezone.utc).date()
+    kinds = list(TYPE_MIX)
+    weights = list(TYPE_MIX.values())
+    store = {}
+
+    for i in range(reminders):
+        chat_id = str(rng.randrange(chats) + 1)
+        minute = PEAK_MINUTE if rng.random() < PEAK_SHARE else rng.randrange(24 * 60)
+        task = {
+            'message': f"Reminder {i}",
+            'time': f"{minute // 60:02d}:{minute % 60:02d}",
+        }
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'one_time':
+            task['type'] = 'one_time'
+            task['date'] = (today + timedelta(days=rng.randrange(30))).isoformat()
+        else:
+            task['type'] = 'daily'
+            task['frequency'] = kind
+            if kind == 'custom':
+                task['days'] = sorted(rng.sample(days, rng.randrange(1, 6)), key=days.index)
+        store.setdefault(chat_id, []).append(task)
+    return store
+
+
+class FakeBot:
+    """Stand-in for telegram.Bot that only counts messages."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+
+
+class FakeApplication:
+    """Stand-in for telegram.ext.Application with the per-user data the handlers touch."""
+
+    def __init__(self):
+        self.user_data = defaultdict(dict)
+
+    def drop_user_data(self, user_id):
+        self.user_data.pop(user_id, None)
+
+
+def fake_context(application, user_id):
+    """CallbackContext replacement; like the real one, user_data is looked up per update."""
+    return SimpleNamespace(application=application, user_data=application.user_data[user_id], args=[])
+
+
+def fake_update(chat_id, text=None, callback_data=None):
+    """Minimal Update replacement with what the handlers touch."""
+    async def reply(*args, **kwargs):
+        return None
+
+    message = SimpleNamespace(
+        text=text, reply_text=reply, edit_text=reply, message_thread_id=None
+    )
+    callback_query = None
+    if callback_data is not None:
+        callback_query = SimpleNamespace(
+            data=callback_data, answer=reply, edit_message_text=reply,
+            message=message, from_user=SimpleNamespace(id=int(chat_id))
+        )
+    return SimpleNamespace(
+        message=message if callback_data is None else None,
+        effective_message=message,
+        effective_chat=SimpleNamespace(id=int(chat_id)),
+        effective_user=SimpleNamespace(id=int(chat_id)),
+        callback_query=callback_query,
+    )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+async def timed_async(coro):
+    start = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - start, result
+
+
+def bench_storage(store, modules):
+    """Snapshot save, cold load and per-mutation journal cost."""
+    task_manager = modules['task_manager']
+    models = modules['models']
+    journal = task_manager.journal
+
+    tasks = {}
+    for chat_id, chat_tasks in store.items():
+        tasks[chat_id] = []
+        for task in chat_tasks:
+            task = models.Task.from_dict(task)
+            task.id = journal.allocate_id()
+            tasks[chat_id].append(task)
+    save_seconds, _ = timed(task_manager.save_tasks, tasks)
+    snapshot_bytes = os.path.getsize(journal.snapshot_path)
+
+    journal.close()
+    load_seconds, loaded = timed(task_manager.load_tasks)
+
+    # Memory is measured in a separate load, tracing slows everything down
+    journal.close()
+    tracemalloc.start()
+    traced = task_manager.load_tasks()
+    store_bytes, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    # Journal one add per flush, like a quiet bot would
+    mutations = 200
+    sample = models.Task.from_dict({'message': 'x', 'type': 'daily', 'frequency': 'everyday', 'time': '10:00'})
+    start = time.perf_counter()
+    for _ in range(mutations):
+        sample.id = journal.allocate_id()
+        journal.append({'op': 'add', 'chat': '1', 'task': sample})
+        journal.flush()
+    mutation_seconds = (time.perf_counter() - start) / mutations
+
+    return loaded, {
+        'save_seconds': save_seconds,
+        'snapshot_bytes': snapshot_bytes,
+        'load_seconds': load_seconds,
+        'load_peak_bytes': load_peak,
+        'store_bytes': store_bytes,
+        'mutation_seconds': mutation_seconds,
+    }
+
+
+async def bench_tick(tasks, modules, coalesce=False):
+    """Index build, tick latency at a quiet and a peak minute, and send throughput."""
+    task_manager = modules['task_manager']
+    scheduler = modules['scheduler']
+    reminder = modules['reminder']
+    dispatcher = modules['dispatcher'].dispatcher
+
+    task_manager.tasks.load(tasks)
+    index_seconds, _ = timed(scheduler.index.rebuild, task_manager.tasks)
+
+    bot = FakeBot()
+    dispatcher.coalesce = coalesce
+    dispatcher.start(bot)
+    # Measure our own overhead rather than Telegram's limits
+    dispatcher.set_global_rate(1e9)
+    modules['dispatcher'].PRIVATE_CHAT_SEND_RATE = 1e9
+    modules['dispatcher'].GROUP_CHAT_SEND_RATE = 1e9
+    dispatcher._chat_buckets.clear()
+    context = SimpleNamespace(bot=bot)
+
+    results = {'index_build_seconds': index_seconds}
+    now = datetime.now(timezone.utc)
+    for name, minute in (('quiet', (PEAK_MINUTE + 7 * 60 + 13) % (24 * 60)), ('peak', PEAK_MINUTE)):
+        moment = now.replace(hour=minute // 60, minute=minute % 60, second=0, microsecond=0)
+        due = len(scheduler.index.due(moment))
+        reminder.datetime = SimpleNamespace(now=lambda tz=None, moment=moment: moment)
+        # The moments aren't consecutive; time the tick itself rather than a catch-up
+        reminder.outbox.cursor = None
+        tick_seconds, _ = await timed_async(reminder.check_reminders(context))
+        results[f'{name}_due'] = due
+        results[f'{name}_tick_seconds'] = tick_seconds
+
+    start = time.perf_counter()
+    await dispatcher.stop(timeout=600)
+    drain_seconds = time.perf_counter() - start
+    reminder.datetime = datetime
+    # Messages, i.e. send_message calls; fewer than reminders when coalescing
+    results['sent'] = bot.sent
+    results['sends_per_second'] = bot.sent / drain_seconds if drain_seconds else None
+    return results
+
+
+async def bench_handlers(modules, chat_id='424242', existing=200):
+    """Latency of each conversation step and of /list and /delete in a busy chat."""
+    handlers = modules['handlers']
+    application = FakeApplication()
+    # Every step adds a reminder at 08:30 in the same chat; time the handlers, not the quotas
+    quota = handlers.quota
+    quota.rate = quota.max_per_chat = quota.max_per_chat_slot = quota.max_per_slot = 0
+
+    steps = [
+        ('add_task', handlers.add_task, fake_update(chat_id, '/add')),
+        ('task_message', handlers.task_message, fake_update(chat_id, 'Water the plants')),
+        ('date_type', handlers.date_type, fake_update(chat_id, callback_data='daily')),
+        ('date_input', handlers.date_input, fake_update(chat_id, callback_data='custom')),
+        ('custom_days', handlers.custom_days, fake_update(chat_id, 'Mo,We,Fr')),
+        ('time_input', handlers.time_input, fake_update(chat_id, '08:30')),
+    ]
+    results = {}
+    for _ in range(existing):
+        for name, handler, update in steps:
+            seconds, _ = await timed_async(handler(update, fake_context(application, int(chat_id))))
+            results.setdefault(name, []).append(seconds)
+
+    results = {f'{name}_seconds': sum(values) / len(values) for name, values in results.items()}
+    results['list_tasks_seconds'], _ = await timed_async(
+        handlers.list_tasks(fake_update(chat_id, '/list'), fake_context(application, int(chat_id)))
+    )
+    results['delete_task_seconds'], _ = await timed_async(
+        handlers.delete_task(fake_update(chat_id, '/delete'), fake_context(application, int(chat_id)))
+    )
+    results['chat_tasks'] = modules['task_manager'].tasks.chat_task_count(chat_id)
+    return results
+
+
+def load_modules():
+    sys.path.insert(0, REPO_ROOT)
+    import task_manager, models, scheduler, reminder, dispatcher, handlers
+    return {
+        'task_manager': task_manager, 'models': models, 'scheduler': scheduler,
+        'reminder': reminder, 'dispatcher': dispatcher, 'handlers': handlers,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(reminder_counts, chats, coalesce=False):
+    modules = load_modules()
+    runs = []
+    for reminders in reminder_counts:
+        chat_count = min(chats, reminders)
+        store = generate_tasks(reminders, chat_count)
+        tasks, storage = bench_storage(store, modules)
+        del store
+        tick = asyncio.run(bench_tick(tasks, modules, coalesce))
+
+        runs.append({
+            'reminders': reminders,
+            'chats': chat_count,
+            'storage': storage,
+            'tick': tick,
+        })
+        print(f"{reminders} reminders done", file=sys.stderr)
+
+    handler_results = asyncio.run(bench_handlers(modules))
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'coalesce': coalesce,
+        'runs': runs,
+        'handlers': handler_results,
+    }
+
+
+def _flatten(data, prefix=''):
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(_flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, list):
+        for item in data:
+            flat.update(_flatten(item, f"{prefix}{item.get('reminders', '')}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix.rstrip('.')] = data
+    return flat
+
+
+def compare(old_path, new_path):
+    """Print new/old ratios for every numeric result present in both files."""
+    with open(old_path) as f:
+        old = _flatten(json.load(f))
+    with open(new_path) as f:
+        new = _flatten(json.load(f))
+    comparison = {
+        key: {'old': old[key], 'new': new[key], 'ratio': new[key] / old[key] if old[key] else None}
+        for key in sorted(old.keys() & new.keys())
+    }
+    json.dump(comparison, sys.stdout, indent=2)
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reminders', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--chats', type=int, default=10000)
+    parser.add_argument('--coalesce', action='store_true', help="combine reminders due together per chat")
+    parser.add_argument('-o', '--output', help="write results to this file instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory() as workdir:
+        # The bot keeps its store in ./data, so run in a scratch directory
+        os.chdir(workdir)
+        os.environ.setdefault('DEFAULT_TIMEZONE', 'UTC')
+        results = run(args.reminders, args.chats, args.coalesce)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+"""End-to-end load test against a local fake Telegram Bot API server.
+
+Starts a stand-in for the Bot API (getUpdates, sendMessage, editMessageText,
+answerCallbackQuery and the few calls made on startup), points the
+Application from main.py at it, and has simulated users run the add, list
+and delete flows over long polling while seeded reminders fire. Prints
+one JSON document with update throughput, reply latency and reminder
+delivery lateness:
+
+    python benchmarks/load.py --users 2000 --reminders 5000
+    python benchmarks/load.py --latency 0.05 --rate-limit 0.01 --error-rate 0.01 -o load.json
+
+Reply latency is measured from the update being queued on the fake server
+to the bot's first reply to that chat. Reminder lateness is measured from
+the start of the minute a reminder is due; the bot is started so its
+reminder job runs just after a minute begins. Everything runs in a
+temporary directory, so the real data/ is untouched.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import Counter, deque
+from datetime import datetime, timezone
+from itertools import islice
+from urllib.parse import parse_qsl
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOKEN = '123456:LOADTEST'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Load test bot', 'username': 'load_test_bot'}
+# Reminder chats are numbered from here, user chats from 1
+REMINDER_CHAT_BASE = 10 ** 9
+# Calls the fault injection leaves alone, so the bot can start and poll
+UNFAULTED_METHODS = {'getMe', 'getUpdates', 'deleteWebhook'}
+
+
+def percentile(values, share):
+    """Nearest-rank percentile of a list of numbers, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.5),
+        'p99': percentile(values, 0.99),
+        'max': max(values) if values else None,
+    }
+
+
+class FakeBotApi:
+    """Minimal Bot API over HTTP/1.1 keep-alive, with latency and fault injection.
+
+    `latency` is the mean of an exponentially distributed delay added to
+    every call; `rate_limit` and `error_rate` are the shares of calls
+    answered with 429 (retry_after seconds) and 500 respectively.
+    """
+
+    def __init__(self, latency=0.0, rate_limit=0.0, retry_after=1, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.updates = deque()
+        self._new_updates = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        # Chat id -> future resolved with the next reply to that chat
+        self.waiters = {}
+        # Chat id -> reply_markup of the last message sent to it
+        self.keyboards = {}
+        # Reminder text -> UTC timestamp it was due at
+        self.reminder_due = {}
+        self.reminder_lateness = {}
+        self.calls = Counter()
+        self.faults = Counter()
+        self._server = None
+        # Connection handler tasks and their writers, closed on stop
+        self._connections = {}
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Wake pending getUpdates calls and drop idle keep-alive connections
+            self._new_updates.set()
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def _message(self, chat_id, text=None, **fields):
+        message = {
+            'message_id': self._next_message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': f"User {chat_id}"},
+            **fields,
+        }
+        if text is not None:
+            message['text'] = text
+        self._next_message_id += 1
+        return message
+
+    def push_update(self, update):
+        update['update_id'] = self._next_update_id
+        self._next_update_id += 1
+        self.updates.append(update)
+        self._new_updates.set()
+
+    def push_text(self, chat_id, text):
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f"User {chat_id}"}
+        fields = {'from': user}
+        if text.startswith('/'):
+            command = text.split(None, 1)[0]
+            fields['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        self.push_update({'message': self._message(chat_id, text, **fields)})
+
+    def push_callback(self, chat_id, message, data):
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f"User {chat_id}"}
+        self.push_update({'callback_query': {
+            'id': str(self._next_update_id), 'from': user, 'chat_instance': str(chat_id),
+            'message': message, 'data': data,
+        }})
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        # Updates before the offset have been received
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(islice(self.updates, limit))
+
+    def _reply(self, method, params):
+        chat_id = int(params['chat_id'])
+        if method == 'sendMessage':
+            result = self._message(chat_id, params.get('text'), **{'from': BOT_USER})
+            due = self.reminder_due.get(params.get('text'))
+            if due is not None:
+                self.reminder_lateness.setdefault(params['text'], time.time() - due)
+        else:
+            result = self._message(chat_id, params.get('text'), **{'from': BOT_USER})
+            result['message_id'] = int(params.get('message_id') or result['message_id'])
+        if params.get('reply_markup'):
+            self.keyboards[chat_id] = json.loads(params['reply_markup'])
+        waiter = self.waiters.pop(chat_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(result)
+        return result
+
+    async def call(self, method, params):
+        """Return (HTTP status, response body) for one Bot API call."""
+        self.calls[method] += 1
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': await self._get_updates(params)}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': BOT_USER}
+
+        if self.latency:
+            await asyncio.sleep(self.rng.expovariate(1 / self.latency))
+        if method not in UNFAULTED_METHODS:
+            roll = self.rng.random()
+            if roll < self.rate_limit:
+                self.faults['rate_limited'] += 1
+                return 429, {
+                    'ok': False, 'error_code': 429,
+                    'description': f"Too Many Requests: retry after {self.retry_after}",
+                    'parameters': {'retry_after': self.retry_after},
+                }
+            if roll < self.rate_limit + self.error_rate:
+                self.faults['server_error'] += 1
+                return 500, {'ok': False, 'error_code': 500, 'description': "Internal Server Error"}
+
+        if method in ('sendMessage', 'editMessageText'):
+            return 200, {'ok': True, 'result': self._reply(method, params)}
+        return 200, {'ok': True, 'result': True}
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                path = request_line.decode('latin-1').split()[1].split('?')[0]
+                if headers.get('content-type', '').startswith('application/json'):
+                    params = json.loads(body or b'{}')
+                else:
+                    params = dict(parse_qsl(body.decode()))
+                status, payload = await self.call(path.rsplit('/', 1)[-1], params)
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(data)}\r\n'
+                    f'Connection: keep-alive\r\n\r\n'.encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+
+
+class User:
+    """One simulated user running the add, list and delete flows in their own chat."""
+
+    def __init__(self, api, chat_id, rng, think_time, step_timeout):
+        self.api = api
+        self.chat_id = chat_id
+        self.rng = rng
+        self.think_time = think_time
+        self.step_timeout = step_timeout
+        self.latencies = []
+        self.timeouts = 0
+
+    async def _step(self, push, *args):
+        """Send one update and wait for the bot's reply, returning it or None."""
+        if self.think_time:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think_time))
+        waiter = asyncio.get_running_loop().create_future()
+        self.api.waiters[self.chat_id] = waiter
+        start = time.perf_counter()
+        push(self.chat_id, *args)
+        try:
+            reply = await asyncio.wait_for(waiter, self.step_timeout)
+        except asyncio.TimeoutError:
+            self.api.waiters.pop(self.chat_id, None)
+            self.timeouts += 1
+            return None
+        self.latencies.append(time.perf_counter() - start)
+        return reply
+
+    def _delete_button(self):
+        keyboard = self.api.keyboards.get(self.chat_id, {}).get('inline_keyboard', [])
+        for row in keyboard:
+            for button in row:
+                if button.get('callback_data', '').startswith('delete_'):
+                    return button['callback_data']
+        return None
+
+    async def run(self):
+        text, callback = self.api.push_text, self.api.push_callback
+        minute = self.rng.randrange(24 * 60)
+
+        # Guided /add of an everyday reminder; a timed-out step ends the session
+        if await self._step(text, '/add') is None:
+            return
+        prompt = await self._step(text, f"Load test reminder for chat {self.chat_id}")
+        if prompt is None:
+            return
+        for data in ('daily', 'everyday'):
+            if await self._step(callback, prompt, data) is None:
+                return
+        if await self._step(text, f"{minute // 60:02d}:{minute % 60:02d}") is None:
+            return
+
+        if await self._step(text, '/list') is None:
+            return
+        menu = await self._step(text, '/delete')
+        button = self._delete_button()
+        if menu is not None and button is not None:
+            await self._step(callback, menu, button)
+
+
+def seed_reminders(api, reminders, minutes, first_minute):
+    """File `reminders` one-time reminders due over `minutes` minutes, one per chat."""
+    from models import Task
+    from task_manager import add_task_record
+    from scheduler import index
+
+    due_minutes = [first_minute + 60 * (i % minutes) for i in range(reminders)]
+    for i, due in enumerate(due_minutes):
+        chat_id = str(REMINDER_CHAT_BASE + i)
+        moment = datetime.fromtimestamp(due, timezone.utc)
+        text = f"Load test reminder {i}"
+        task = Task.from_dict({
+            'message': text, 'type': 'one_time',
+            'date': moment.date().isoformat(), 'time': moment.strftime('%H:%M'),
+        })
+        add_task_record(chat_id, task)
+        index.add(chat_id, task)
+        api.reminder_due[text] = due
+
+
+async def run(args):
+    api = FakeBotApi(args.latency, args.rate_limit, args.retry_after, args.error_rate, args.seed)
+    port = await api.start()
+
+    sys.path.insert(0, REPO_ROOT)
+    import main
+    from dispatcher import dispatcher
+    import dispatcher as dispatcher_module
+    # Per-update and per-request logging would dominate the run
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    # The reminder job first runs a second after it is added; build the
+    # application just before a minute begins so lateness isn't dominated
+    # by where in the minute the job runs
+    first_minute = (int(time.time()) // 60 + 1) * 60
+    seed_reminders(api, args.reminders, args.reminder_minutes, first_minute)
+    if args.reminders:
+        await asyncio.sleep(max(0.0, first_minute - 0.5 - time.time()))
+
+    application = main.build_application(TOKEN, f"http://127.0.0.1:{port}/bot")
+    await application.initialize()
+    await main.post_init(application)
+    if args.unthrottled:
+        # Measure the bot rather than Telegram's send limits
+        dispatcher.set_global_rate(1e9)
+        dispatcher_module.PRIVATE_CHAT_SEND_RATE = 1e9
+        dispatcher_module.GROUP_CHAT_SEND_RATE = 1e9
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+
+    rng = random.Random(args.seed)
+    users = [User(api, chat_id, random.Random(rng.random()), args.think_time, args.step_timeout)
+             for chat_id in range(1, args.users + 1)]
+
+    async def start_user(user):
+        await asyncio.sleep(rng.uniform(0, args.ramp))
+        await user.run()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(start_user(user) for user in users))
+    users_seconds = time.perf_counter() - started
+
+    # Let the remaining reminders fire and go out
+    deadline = first_minute + 60 * args.reminder_minutes + args.drain_timeout
+    while len(api.reminder_lateness) < args.reminders and time.time() < deadline:
+        await asyncio.sleep(0.5)
+
+    await application.updater.stop()
+    await application.stop()
+    await main.post_stop(application)
+    await application.shutdown()
+    await api.stop()
+
+    latencies = [latency for user in users for latency in user.latencies]
+    return {
+        'users': args.users,
+        'reminders': args.reminders,
+        'settings': {
+            'latency': args.latency, 'rate_limit': args.rate_limit, 'retry_after': args.retry_after,
+            'error_rate': args.error_rate, 'think_time': args.think_time, 'unthrottled': args.unthrottled,
+        },
+        'updates': {
+            'handled': len(latencies),
+            'timed_out': sum(user.timeouts for user in users),
+            'seconds': users_seconds,
+            'per_second': len(latencies) / users_seconds if users_seconds else None,
+            'latency_seconds': summarize(latencies),
+        },
+        'reminders_delivered': len(api.reminder_lateness),
+        'reminder_lateness_seconds': summarize(list(api.reminder_lateness.values())),
+        'api_calls': dict(api.calls),
+        'injected_faults': dict(api.faults),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--reminders', type=int, default=1000)
+    parser.add_argument('--reminder-minutes', type=int, default=1, help="spread reminders over this many minutes")
+    parser.add_argument('--latency', type=float, default=0.0, help="mean Bot API latency in seconds")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after of injected 429s, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of calls answered with 500")
+    parser.add_argument('--think-time', type=float, default=0.2, help="mean pause between a user's steps")
+    parser.add_argument('--ramp', type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument('--step-timeout', type=float, default=30.0, help="seconds a user waits for a reply")
+    parser.add_argument('--drain-timeout', type=float, default=120.0,
+                        help="seconds after the last reminder minute to wait for deliveries")
+    parser.add_argument('--unthrottled', action='store_true', help="lift the bot's own send rate limits")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help="keep the bot's info logging")
+    parser.add_argument('-o', '--output', help="write results to this file instead of stdout")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory() as workdir:
+        # The bot keeps its store in ./data, so run in a scratch directory
+        os.chdir(workdir)
+        os.environ.setdefault('DEFAULT_TIMEZONE', 'UTC')
+        os.environ['BOT_ROLE'] = 'all'
+        os.environ.pop('METRICS_PORT', None)
+        results = asyncio.run(run(args))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 # Conversation states
-MESSAGE, DATE_TYPE, DATE, TIME, CUSTOM_DAYS = range(5)
+MESSAGE, DATE_TYPE, DATE, TIME, CUSTOM_DAYS, IMPORT_FILE = range(6)
 
 # Task type constants
 ONE_TIME = 'one_time'
 DAILY = 'daily'
+# Reminders following a cron rule, e.g. every 15 minutes
+CRON = 'cron'
 
 # Day name mappings
 DAY_NAMES = {
@@ -20,4 +22,95 @@ DAY_NAMES = {
 VALID_DAYS = ['Mo', 'Tu', 'We', 'Th', 'Fr', 'Sa', 'Su']
 
 # Weekday mapping (for reminder checking)
-WEEKDAY_MAP = {0: 'Mo', 1: 'Tu', 2: 'We', 3: 'Th', 4: 'Fr', 5: 'Sa', 6: 'Su'}
\ No newline at end of file
+WEEKDAY_MAP = {0: 'Mo', 1: 'Tu', 2: 'We', 3: 'Th', 4: 'Fr', 5: 'Sa', 6: 'Su'}
+
+# Telegram send limits (messages per second)
+GLOBAL_SEND_RATE = 30
+PRIVATE_CHAT_SEND_RATE = 1
+GROUP_CHAT_SEND_RATE = 20 / 60
+
+# Reminder dispatch settings
+DISPATCH_CONCURRENCY = 16
+MAX_SEND_ATTEMPTS = 8
+# Retry delays for network errors double from the base up to the cap (seconds)
+RETRY_BACKOFF_BASE = 2
+RETRY_BACKOFF_MAX = 300
+# Telegram's limit on the text of one message (UTF-16 code units)
+MAX_MESSAGE_LENGTH = 4096
+
+# What to send for minutes missed while the bot was down or a tick ran
+# late (CATCH_UP_POLICY): every missed reminder, only the latest one of
+# each task, or none
+CATCH_UP_ALL = 'all'
+CATCH_UP_LATEST = 'latest'
+CATCH_UP_DROP = 'drop'
+# Missed reminders older than this many minutes are dropped
+CATCH_UP_MAX_AGE = 24 * 60
+# Most missed reminders handed to the dispatcher per tick, so live ones aren't stuck behind them
+CATCH_UP_BURST = 300
+# Seconds between sweeps for one-time reminders too old to be sent
+EXPIRY_SWEEP_INTERVAL = 60 * 60
+
+
+# Process roles (BOT_ROLE): one process doing everything, a front process
+# handling updates only, or a shard worker sending reminders only
+ROLE_ALL = 'all'
+ROLE_FRONTEND = 'frontend'
+ROLE_WORKER = 'worker'
+
+# Shard worker settings (seconds, except CLAIM_WINDOW in minutes)
+HEARTBEAT_INTERVAL = 5
+WORKER_TTL = 15
+SHARD_TICK_INTERVAL = 5
+# Due reminders stay claimable this long, so a dead worker's chats are
+# picked up by the others before their reminders are skipped
+CLAIM_WINDOW = 2
+
+
+# Log level of the bot's own loggers (LOG_LEVEL)
+LOG_LEVEL = 'INFO'
+# Fraction of delivered reminders and send retries logged one by one; the
+# rest only show up in the per-tick delivery summary
+LOG_SAMPLE_RATE = 0.01
+
+
+# Updates handled at once (different chats only; each chat's run in order)
+UPDATE_WORKERS = 64
+# Updates accepted at once, handled or waiting for their chat, before new ones queue
+MAX_PENDING_UPDATES = 4096
+
+
+# Conversations idle this long (seconds) are ended and their drafts evicted
+CONVERSATION_TIMEOUT = 15 * 60
+# Most conversations in progress at once; new ones are refused past this
+MAX_CONVERSATIONS = 10000
+# Seconds between sweeps for abandoned drafts
+DRAFT_SWEEP_INTERVAL = 60
+
+
+# Reminder quotas (0 disables a limit): reminders per chat and in total,
+# and reminders firing in the same UTC minute, per chat and in total
+MAX_TASKS_PER_CHAT = 1000
+MAX_TASKS = 1000000
+MAX_TASKS_PER_CHAT_SLOT = 50
+MAX_TASKS_PER_SLOT = 10000
+# Cron rules are never filed under a fixed minute; instead the times a day
+# they can fire are added up, per chat and in total (one a minute per chat,
+# and MAX_TASKS_PER_SLOT a minute overall, on average)
+MAX_RULE_FIRES_PER_CHAT = 24 * 60
+MAX_RULE_FIRES = MAX_TASKS_PER_SLOT * 24 * 60
+# /add and /import commands per chat and minute, and how many may come in a burst
+CREATE_RATE = 20
+CREATE_BURST = 10
+
+
+# Paginated /list and /delete
+PAGE_SIZE = 10
+# Longest reminder text shown in /list, in UTF-16 code units as Telegram counts them;
+# keeps a full page under Telegram's 4096
+LIST_PREVIEW_LENGTH = 300
+
+# Largest file accepted by /import, in bytes
+IMPORT_MAX_BYTES = 5 * 1024 * 1024
+# Invalid rows listed in the /import summary
+IMPORT_ERRORS_SHOWN = 10
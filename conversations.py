@@ -0,0 +1,147 @@
+import os
+import time
+import logging
+import functools
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ConversationHandler, ContextTypes
+
+import metrics
+from constants import CONVERSATION_TIMEOUT, MAX_CONVERSATIONS
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+class DraftTracker:
+    """Last activity of every conversation in progress, oldest first.
+
+    Keys are (chat_id, user_id), the same as the ConversationHandler's.
+    """
+
+    def __init__(self, ttl, cap):
+        self.ttl = ttl
+        self.cap = cap
+        self._active = OrderedDict()
+
+    def touch(self, key):
+        self._active[key] = time.monotonic()
+        self._active.move_to_end(key)
+
+    def finish(self, key):
+        self._active.pop(key, None)
+
+    def expired(self, now=None):
+        """Keys idle for longer than the TTL."""
+        cutoff = (time.monotonic() if now is None else now) - self.ttl
+        keys = []
+        for key, last_seen in self._active.items():
+            if last_seen > cutoff:
+                break
+            keys.append(key)
+        return keys
+
+    @property
+    def full(self):
+        return len(self._active) >= self.cap
+
+    def __contains__(self, key):
+        return key in self._active
+
+    def __len__(self):
+        return len(self._active)
+
+
+drafts = DraftTracker(
+    int(os.getenv('CONVERSATION_TIMEOUT', CONVERSATION_TIMEOUT)),
+    int(os.getenv('MAX_CONVERSATIONS', MAX_CONVERSATIONS)),
+)
+
+metrics.registry.register(metrics.Gauge(
+    'conversations_live', 'Conversations in progress.', callback=lambda: len(drafts)
+))
+conversations_expired = metrics.registry.register(metrics.Counter(
+    'conversations_expired_total', 'Abandoned conversations whose drafts were evicted.'
+))
+conversations_rejected = metrics.registry.register(metrics.Counter(
+    'conversations_rejected_total', 'Conversations not started because MAX_CONVERSATIONS were live.'
+))
+
+
+def draft_key(update):
+    chat = update.effective_chat
+    user = update.effective_user
+    return (chat.id if chat else None, user.id if user else None)
+
+
+def get_draft(update, context):
+    """The half-finished reminder of this conversation.
+
+    It is kept in the user's data under the chat id, like the
+    ConversationHandler's (chat, user) key, so the same user's
+    conversations in other chats have their own.
+    """
+    return context.user_data.setdefault(update.effective_chat.id, {})
+
+
+def clear_draft(application, key):
+    """Remove the draft of a (chat_id, user_id) conversation, and the user's data if nothing else is left."""
+    chat_id, user_id = key
+    user_data = application.user_data.get(user_id)
+    if user_data is None:
+        return
+    user_data.pop(chat_id, None)
+    if not user_data:
+        application.drop_user_data(user_id)
+
+
+def sweep(application):
+    """Evict the drafts of conversations idle for longer than the TTL."""
+    expired = drafts.expired()
+    for key in expired:
+        drafts.finish(key)
+        if key[1] is not None:
+            clear_draft(application, key)
+    if expired:
+        conversations_expired.inc(amount=len(expired))
+        logger.info(f"Evicted {len(expired)} abandoned conversations")
+    return len(expired)
+
+
+async def sweep_drafts(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job: evict abandoned drafts."""
+    sweep(context.application)
+
+
+def track_draft(callback):
+    """Track a conversation callback's activity, refusing new conversations past the cap."""
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        key = draft_key(update)
+        if key not in drafts and drafts.full:
+            sweep(context.application)
+            if drafts.full:
+                conversations_rejected.inc()
+                await update.effective_message.reply_text(
+                    "⏳ Too many reminders are being set up right now. Please try again in a few minutes."
+                )
+                return ConversationHandler.END
+
+        drafts.touch(key)
+        state = await callback(update, context)
+        if state == ConversationHandler.END:
+            drafts.finish(key)
+        return state
+    return wrapper
+
+
+async def conversation_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Drop the draft of a conversation the ConversationHandler timed out."""
+    key = draft_key(update)
+    if key in drafts:
+        # Not evicted by the sweeper already
+        drafts.finish(key)
+        conversations_expired.inc()
+    if key[1] is not None:
+        clear_draft(context.application, key)
@@ -0,0 +1,425 @@
+import os
+import asyncio
+import logging
+import random
+import time
+from datetime import timedelta
+
+from telegram.error import (
+    RetryAfter, TelegramError, NetworkError, BadRequest, Forbidden, ChatMigrated
+)
+
+import metrics
+from log_config import sampled
+from constants import (
+    GLOBAL_SEND_RATE, PRIVATE_CHAT_SEND_RATE, GROUP_CHAT_SEND_RATE,
+    DISPATCH_CONCURRENCY, MAX_SEND_ATTEMPTS, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX,
+    MAX_MESSAGE_LENGTH
+)
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Idle per-chat buckets are pruned once this many are tracked
+MAX_TRACKED_CHATS = 10000
+
+# First line of a message combining several reminders
+COALESCED_HEADER = "⏰ Reminders:\n\n"
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """Take one token; the balance may go negative to queue later callers."""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """Block the bucket for the given number of seconds."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    @property
+    def idle(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class DeliveryStats:
+    """Running delivery counters and lateness (seconds after the due time)."""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        # Counters at the last summary, and the worst lateness since
+        self._summarized = (0, 0, 0)
+        self._summary_max_lateness = 0.0
+
+    def record_sent(self, lateness):
+        self.sent += 1
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.total_lateness += lateness
+        self._summary_max_lateness = max(self._summary_max_lateness, lateness)
+
+    def take_summary(self):
+        """(sent, failed, retried, max lateness) since the previous call."""
+        sent, failed, retried = self._summarized
+        summary = (
+            self.sent - sent, self.failed - failed, self.retried - retried, self._summary_max_lateness
+        )
+        self._summarized = (self.sent, self.failed, self.retried)
+        self._summary_max_lateness = 0.0
+        return summary
+
+    @property
+    def mean_lateness(self):
+        return self.total_lateness / self.sent if self.sent else 0.0
+
+    def as_dict(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'last_lateness': self.last_lateness,
+            'max_lateness': self.max_lateness,
+            'mean_lateness': self.mean_lateness,
+        }
+
+
+class ReminderJob:
+    """A message with one or more reminders waiting to be delivered.
+
+    `keys` are the outbox keys of the reminders it carries.
+    """
+
+    __slots__ = ('chat_id', 'text', 'thread_id', 'due_at', 'keys', 'attempts')
+
+    def __init__(self, chat_id, text, thread_id=None, due_at=None, keys=()):
+        self.chat_id = chat_id
+        self.text = text
+        self.thread_id = thread_id
+        self.due_at = due_at if due_at is not None else time.time()
+        self.keys = keys
+        self.attempts = 0
+
+
+def retry_after_seconds(error):
+    """Return RetryAfter.retry_after in seconds, whatever type the library uses."""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with jitter before retry number `attempts`."""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def message_length(text):
+    """Length of a text as Telegram counts it, in UTF-16 code units."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def coalesce_entries(entries, limit=MAX_MESSAGE_LENGTH):
+    """Combine outbox entries for the same chat and thread into as few messages as fit.
+
+    Yields (chat_id, thread_id, text, due_at, keys). A lone reminder keeps
+    its plain text; several are listed under COALESCED_HEADER and split into
+    more messages when they would exceed `limit`.
+    """
+    groups = {}
+    for entry in entries:
+        groups.setdefault((entry.chat_id, entry.thread_id), []).append(entry)
+
+    header_length = message_length(COALESCED_HEADER)
+    for (chat_id, thread_id), group in groups.items():
+        if len(group) == 1:
+            entry = group[0]
+            yield chat_id, thread_id, entry.text, entry.due_at, (entry.key,)
+            continue
+
+        lines, keys, length, due_at = [], [], header_length, None
+        for entry in group:
+            line = f"• {entry.text}\n"
+            line_length = message_length(line)
+            if header_length + line_length > limit:
+                # Too long to share a message, send it on its own
+                yield chat_id, thread_id, entry.text, entry.due_at, (entry.key,)
+                continue
+            if length + line_length > limit:
+                yield chat_id, thread_id, COALESCED_HEADER + ''.join(lines), due_at, tuple(keys)
+                lines, keys, length, due_at = [], [], header_length, None
+            lines.append(line)
+            keys.append(entry.key)
+            length += line_length
+            due_at = entry.due_at if due_at is None else min(due_at, entry.due_at)
+        if keys:
+            yield chat_id, thread_id, COALESCED_HEADER + ''.join(lines), due_at, tuple(keys)
+
+
+def is_dead_chat_error(error):
+    """Whether an error means the chat can't receive messages at all.
+
+    ChatMigrated is not one: the group lives on under a new id.
+    """
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and 'chat not found' in str(error).lower()
+
+
+class Dispatcher:
+    """Send reminders concurrently while respecting Telegram's rate limits.
+
+    A global bucket caps the bot's overall send rate and one bucket per chat
+    caps each chat (groups are limited harder than private chats). Jobs whose
+    chat is throttled are requeued for later instead of holding a worker, and
+    RetryAfter errors pause the chat for the requested time before retrying.
+    Network errors are retried with exponential backoff.
+
+    With an outbox, the keys of every job are completed in it once it is
+    sent or given up on, chats that can't be delivered to are marked dead
+    there, and reminders still pending in it are resubmitted on start.
+
+    Reminders for a group that was upgraded to a supergroup are resent to
+    the new chat id, and `on_chat_migrated(old_chat_id, new_chat_id)` is
+    called, if set, so the chat's reminders can be moved there.
+
+    With `coalesce` (COALESCE_REMINDERS=1) reminders submitted together for
+    the same chat and thread go out as one message.
+    """
+
+    def __init__(self, concurrency=DISPATCH_CONCURRENCY, coalesce=None):
+        self.concurrency = concurrency
+        if coalesce is None:
+            coalesce = os.getenv('COALESCE_REMINDERS', '').lower() in ('1', 'true', 'yes')
+        self.coalesce = coalesce
+        self.stats = DeliveryStats()
+        self._global_bucket = TokenBucket(GLOBAL_SEND_RATE, GLOBAL_SEND_RATE)
+        self._chat_buckets = {}
+        self._queue = None
+        self._workers = []
+        self._pending = 0
+        self._bot = None
+        self.outbox = None
+        self.on_chat_migrated = None
+
+    def start(self, bot, outbox=None):
+        """Start the worker coroutines on the running event loop."""
+        self._bot = bot
+        self.outbox = outbox
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        if outbox is not None:
+            entries = outbox.pending_entries()
+            if entries:
+                logger.info("Resubmitting %d reminders from the outbox", len(entries))
+            self.submit_entries(entries)
+
+    async def stop(self, timeout=10):
+        """Give queued reminders a chance to go out, then stop the workers."""
+        if self._queue is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.pending:
+            logger.warning("Stopping dispatcher with %d reminders undelivered", self.pending)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def set_global_rate(self, rate):
+        """Change the overall send rate, e.g. when it is shared between workers."""
+        self._global_bucket = TokenBucket(rate, max(1, rate))
+
+    def submit(self, chat_id, text, thread_id=None, due_at=None, keys=()):
+        """Queue a message for delivery; `keys` are the outbox keys it carries."""
+        self._pending += 1
+        self._queue.put_nowait(ReminderJob(chat_id, text, thread_id, due_at, keys))
+
+    def submit_entries(self, entries):
+        """Queue fired outbox entries, combined per chat and thread when coalescing."""
+        if not self.coalesce:
+            for entry in entries:
+                self.submit(entry.chat_id, entry.text, entry.thread_id, entry.due_at, (entry.key,))
+            return
+        for chat_id, thread_id, text, due_at, keys in coalesce_entries(entries):
+            self.submit(chat_id, text, thread_id, due_at, keys)
+
+    @property
+    def pending(self):
+        """Reminders queued, being sent or waiting to be retried."""
+        return self._pending
+
+    def log_summary(self):
+        """Log what was delivered since the previous summary, if anything.
+
+        Single deliveries and retries are only logged at LOG_SAMPLE_RATE.
+        """
+        sent, failed, retried, max_lateness = self.stats.take_summary()
+        if sent or failed or retried:
+            logger.info(
+                "Delivered %d reminders (%d failed, %d retries, %d pending), at most %.1fs late",
+                sent, failed, retried, self.pending, max_lateness
+            )
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_TRACKED_CHATS:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.idle
+                }
+            # Negative ids are groups, supergroups and channels
+            rate = GROUP_CHAT_SEND_RATE if str(chat_id).startswith('-') else PRIVATE_CHAT_SEND_RATE
+            bucket = TokenBucket(rate)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _requeue_later(self, job, delay):
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                done = await self._deliver(job)
+            except Exception as e:
+                logger.error("Unexpected error delivering reminder to %s: %s", job.chat_id, e)
+                self._finish(job)
+                done = True
+            if done:
+                self._pending -= 1
+
+    def _finish(self, job):
+        """The job was sent or given up on."""
+        if self.outbox is not None:
+            for key in job.keys:
+                self.outbox.complete(key)
+
+    def _give_up(self, job, error, message, *args):
+        self.stats.failed += 1
+        metrics.reminders_failed.inc(type(error).__name__)
+        logger.error(message, *args)
+        self._finish(job)
+
+    async def _deliver(self, job):
+        """Try to send a job; return False if it was requeued for later."""
+        if self.outbox is not None and self.outbox.is_dead(job.chat_id):
+            metrics.reminders_skipped.inc('dead_chat')
+            self._finish(job)
+            return True
+
+        chat_bucket = self._chat_bucket(job.chat_id)
+        chat_wait = chat_bucket.wait_time()
+        if chat_wait > 0:
+            # Don't hold a worker while this chat is throttled
+            self._requeue_later(job, chat_wait)
+            return False
+        chat_bucket.consume()
+
+        global_wait = self._global_bucket.wait_time()
+        self._global_bucket.consume()
+        if global_wait > 0:
+            await asyncio.sleep(global_wait)
+
+        job.attempts += 1
+        started = time.monotonic()
+        try:
+            kwargs = {}
+            if job.thread_id is not None:
+                kwargs["message_thread_id"] = job.thread_id
+            await self._bot.send_message(chat_id=job.chat_id, text=job.text, **kwargs)
+        except RetryAfter as e:
+            metrics.send_duration.observe(time.monotonic() - started)
+            delay = retry_after_seconds(e)
+            chat_bucket.pause(delay)
+            if job.attempts < MAX_SEND_ATTEMPTS:
+                self.stats.retried += 1
+                metrics.reminders_retried.inc(type(e).__name__)
+                if sampled():
+                    logger.warning("Flood limit for %s, retrying in %ss", job.chat_id, delay)
+                self._requeue_later(job, delay)
+                return False
+            self._give_up(job, e, "Giving up on reminder to %s after %d attempts", job.chat_id, job.attempts)
+        except ChatMigrated as e:
+            metrics.send_duration.observe(time.monotonic() - started)
+            old_chat_id, job.chat_id = job.chat_id, str(e.new_chat_id)
+            logger.info("Chat %s was migrated to %s, resending there", old_chat_id, job.chat_id)
+            if self.on_chat_migrated is not None:
+                self.on_chat_migrated(old_chat_id, job.chat_id)
+            if job.attempts < MAX_SEND_ATTEMPTS:
+                self.stats.retried += 1
+                metrics.reminders_retried.inc(type(e).__name__)
+                self._queue.put_nowait(job)
+                return False
+            self._give_up(job, e, "Giving up on reminder to %s after %d attempts", job.chat_id, job.attempts)
+        except TelegramError as e:
+            metrics.send_duration.observe(time.monotonic() - started)
+            if is_dead_chat_error(e):
+                if self.outbox is not None:
+                    self.outbox.mark_dead(job.chat_id)
+                self._give_up(job, e, "Chat %s can't receive reminders, marking it dead: %s", job.chat_id, e)
+            elif isinstance(e, NetworkError) and not isinstance(e, BadRequest) and job.attempts < MAX_SEND_ATTEMPTS:
+                delay = backoff_delay(job.attempts)
+                self.stats.retried += 1
+                metrics.reminders_retried.inc(type(e).__name__)
+                if sampled():
+                    logger.warning(
+                        "Error sending reminder to %s: %s, retrying in %.1fs", job.chat_id, e, delay
+                    )
+                self._requeue_later(job, delay)
+                return False
+            else:
+                self._give_up(job, e, "Error sending reminder to %s: %s", job.chat_id, e)
+        else:
+            metrics.send_duration.observe(time.monotonic() - started)
+            lateness = max(0.0, time.time() - job.due_at)
+            self.stats.record_sent(lateness)
+            metrics.reminders_sent.inc(amount=max(1, len(job.keys)))
+            metrics.send_lateness.observe(lateness)
+            if logger.isEnabledFor(logging.DEBUG) and sampled():
+                logger.debug(
+                    "Sent reminder to %s (thread: %s), %.1fs late", job.chat_id, job.thread_id, lateness
+                )
+            if self.outbox is not None:
+                # A dead chat probed after DEAD_CHAT_RETRY is alive again
+                self.outbox.revive(job.chat_id)
+            self._finish(job)
+        return True
+
+
+# Shared dispatcher, started from main.py once the bot is initialized
+dispatcher = Dispatcher()
+metrics.registry.register(metrics.Gauge(
+    'reminders_pending', 'Reminders queued or waiting to be retried.',
+    callback=lambda: dispatcher.pending
+))
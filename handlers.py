@@ -1,14 +1,33 @@
 import logging
-from datetime import datetime
+import io
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ConversationHandler, ContextTypes
 
-from constants import MESSAGE, DATE_TYPE, DATE, TIME, CUSTOM_DAYS, ONE_TIME, DAILY, DAY_NAMES, VALID_DAYS
-from task_manager import tasks, save_tasks
+from constants import (
+    MESSAGE, DATE_TYPE, DATE, TIME, CUSTOM_DAYS, IMPORT_FILE, ONE_TIME, DAILY, DAY_NAMES,
+    LIST_PREVIEW_LENGTH, IMPORT_MAX_BYTES, IMPORT_ERRORS_SHOWN
+)
+from task_manager import (
+    tasks, add_task_record, add_task_records, remove_task_record, get_chat_timezone, set_chat_timezone,
+    move_chat_records
+)
+from scheduler import index
+from outbox import outbox
+from conversations import track_draft, drafts, draft_key, get_draft, clear_draft
+from quick_add import parse_quick_add, QUICK_ADD_USAGE
+from models import Task, TaskType, Frequency, parse_date, parse_time, invalid_days
+from recurrence import describe_rule
+from timezones import default_timezone_name, is_valid_timezone
+from pagination import render_cache, page_count, page_bounds, navigation_row, preview
+from quotas import quota, QuotaExceeded
+from transfer import build_tasks, parse_csv, parse_ical, export_csv, export_ical
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
+# Reply to /add and /import past the chat's creation rate
+THROTTLED_TEXT = "⏳ You're adding reminders too quickly. Please wait a minute and try again."
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a welcome message when the command /start is issued."""
     user = update.effective_user
@@ -25,26 +44,92 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         f"Welcome to your personal Reminder Bot! 🎯\n"
         f"I can help you remember your tasks and send you daily reminders.\n"
         f"Use the buttons below or these commands:\n"
-        f"• Add a new task: /add\n"
+        f"• Add a new task: /add, or in one go: /add Mo,We,Fr 09:00 Standup\n"
+        f"  or on a schedule: /add every 2 hours between 9 and 18 Drink water\n"
         f"• See all your tasks: /list\n"
         f"• Remove a task: /delete\n"
+        f"• Set your time zone: /timezone\n"
+        f"• Import or export reminders: /import, /export\n"
         f"Let's get started!"
     )
     
     await update.message.reply_text(welcome_text, reply_markup=reply_markup)
 
+def describe_task(task):
+    """Describe when a task fires, e.g. 'every Monday, Friday'."""
+    if task.type == TaskType.CRON:
+        return describe_rule(task.rule)
+    if task.type == TaskType.ONE_TIME:
+        return f"on {task.date_str}"
+    if task.frequency == Frequency.EVERYDAY:
+        return "every day"
+    days_full = [DAY_NAMES[day] for day in task.day_codes]
+    return f"every {', '.join(days_full)}"
+
+def describe_schedule(task):
+    """Describe when a task fires including the time, e.g. 'every day at 09:00'."""
+    if task.type == TaskType.CRON:
+        return describe_task(task)
+    return f"{describe_task(task)} at {task.time}"
+
+def save_new_task(update: Update, task):
+    """Store a task created in this chat (and forum topic) and schedule it.
+
+    Raises QuotaExceeded if the chat can't have another reminder then.
+    """
+    # Use the chat id instead of the user id
+    chat_id = str(update.effective_chat.id)
+    quota.check(chat_id, [task])
+
+    # Capture message_thread_id if available (for forum topics)
+    if update.effective_message and hasattr(update.effective_message, 'message_thread_id'):
+        task.thread_id = update.effective_message.message_thread_id
+
+    task.user_id = update.effective_user.id
+    add_task_record(chat_id, task)
+    index.add(chat_id, task)
+
+@track_draft
 async def add_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Start the add task conversation."""
+    """Add a reminder given in one go (/add <when> <time> <message>), or start the add task conversation."""
+    if not quota.allow_command(update.effective_chat.id):
+        await update.message.reply_text(THROTTLED_TEXT)
+        return ConversationHandler.END
+
+    # Everything after the command, with the message's own spacing
+    parts = (update.message.text or '').split(None, 1)
+    quick_text = parts[1] if len(parts) > 1 and parts[0].startswith('/') else ''
+
+    notice = ""
+    if quick_text:
+        try:
+            task = parse_quick_add(quick_text)
+        except ValueError as e:
+            notice = f"⚠️ I couldn't read that reminder: {e}.\nExamples:\n{QUICK_ADD_USAGE}\n\n"
+        else:
+            try:
+                save_new_task(update, task)
+            except QuotaExceeded as e:
+                await update.message.reply_text(str(e))
+                return ConversationHandler.END
+            await update.message.reply_text(
+                f"✅ Task added successfully!\n\n"
+                f"I'll remind you: \"{task.message}\"\n"
+                f"⏰ {describe_schedule(task)}"
+            )
+            return ConversationHandler.END
+
     # Add a cancel button
     keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.message.reply_text(
-        "Let's add a new reminder! First, what would you like me to remind you about?",
+        f"{notice}Let's add a new reminder! First, what would you like me to remind you about?",
         reply_markup=reply_markup
     )
     return MESSAGE
 
+@track_draft
 async def task_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Store the task message and ask for date type."""
     # Check if this is a cancel button click
@@ -53,7 +138,7 @@ async def task_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         await update.callback_query.message.edit_text("Reminder creation cancelled.")
         return ConversationHandler.END
     
-    context.user_data['message'] = update.message.text
+    get_draft(update, context)['message'] = update.message.text
     
     # Create inline keyboard with date type options with improved UI
     keyboard = [
@@ -71,6 +156,7 @@ async def task_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     )
     return DATE_TYPE
 
+@track_draft
 async def date_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Store the date type and ask for specific details."""
     query = update.callback_query
@@ -82,7 +168,7 @@ async def date_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return ConversationHandler.END
     
     task_type = query.data
-    context.user_data['type'] = task_type
+    get_draft(update, context)['type'] = task_type
     
     if task_type == ONE_TIME:
         # Add cancel button
@@ -111,6 +197,7 @@ async def date_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
         return DATE
 
+@track_draft
 async def date_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Process date input or daily frequency selection."""
     # Handle callback query (for daily frequency)
@@ -124,7 +211,7 @@ async def date_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             return ConversationHandler.END
         
         frequency = query.data
-        context.user_data['frequency'] = frequency
+        get_draft(update, context)['frequency'] = frequency
         
         if frequency == 'custom':
             # Add cancel button
@@ -155,10 +242,10 @@ async def date_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         
         try:
             # Validate date format
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+            date_obj = parse_date(date_str)
             
             # Store the date
-            context.user_data['date'] = date_str
+            get_draft(update, context)['date'] = date_str
             
             # Add cancel button
             keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel")]]
@@ -181,6 +268,7 @@ async def date_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             )
             return DATE
 
+@track_draft
 async def custom_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Process custom days for recurring reminders."""
     # Check if it's a callback query for cancel
@@ -195,21 +283,21 @@ async def custom_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     days = [day.strip() for day in days_input.split(',')]
     
     # Check if all days are valid
-    invalid_days = [day for day in days if day not in VALID_DAYS]
-    if invalid_days:
+    invalid = invalid_days(days)
+    if invalid:
         # Add cancel button
         keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await update.message.reply_text(
-            f"Invalid day(s): {', '.join(invalid_days)}. "
+            f"Invalid day(s): {', '.join(invalid)}. "
             f"Please use: Mo, Tu, We, Th, Fr, Sa, Su",
             reply_markup=reply_markup
         )
         return CUSTOM_DAYS
     
     # Store the days
-    context.user_data['days'] = days
+    get_draft(update, context)['days'] = days
     
     # Add cancel button
     keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel")]]
@@ -221,6 +309,7 @@ async def custom_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     )
     return TIME
 
+@track_draft
 async def time_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Check if it's a callback query for cancel
     if update.callback_query and update.callback_query.data == "cancel":
@@ -228,59 +317,45 @@ async def time_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.callback_query.message.edit_text("Reminder creation cancelled.")
         return ConversationHandler.END
 
-    # Use the chat id instead of the user id
-    chat_id = str(update.effective_chat.id)
-    
-    # Capture message_thread_id if available (for forum topics)
-    thread_id = None
-    if update.effective_message and hasattr(update.effective_message, 'message_thread_id'):
-        thread_id = update.effective_message.message_thread_id
-
     time_str = update.message.text
 
     try:
         # Validate time format
-        time_obj = datetime.strptime(time_str, '%H:%M').time()
+        time_obj = parse_time(time_str)
 
-        # Create task data and store thread id if available
+        # Create task data
+        draft = get_draft(update, context)
         task_data = {
-            'message': context.user_data['message'],
-            'type': context.user_data['type'],
+            'message': draft['message'],
+            'type': draft['type'],
             'time': time_str
         }
-        if thread_id is not None:
-            task_data['message_thread_id'] = thread_id
 
         if task_data['type'] == ONE_TIME:
-            task_data['date'] = context.user_data['date']
+            task_data['date'] = draft['date']
         else:  # DAILY
-            task_data['frequency'] = context.user_data['frequency']
+            task_data['frequency'] = draft['frequency']
             if task_data['frequency'] == 'custom':
-                task_data['days'] = context.user_data['days']
-
-        if chat_id not in tasks:
-            tasks[chat_id] = []
+                task_data['days'] = draft['days']
 
-        tasks[chat_id].append(task_data)
-        save_tasks(tasks)
-
-        # Format task description for confirmation
-        if task_data['type'] == ONE_TIME:
-            task_desc = f"on {task_data['date']}"
-        else:  # DAILY
-            if task_data['frequency'] == 'everyday':
-                task_desc = "every day"
-            else:  # custom
-                days_full = [DAY_NAMES[day] for day in task_data['days']]
-                task_desc = f"every {', '.join(days_full)}"
+        task = Task.from_dict(task_data)
+        try:
+            save_new_task(update, task)
+        except QuotaExceeded as e:
+            await update.message.reply_text(str(e))
+            if e.reason in ('chat_slot', 'slot'):
+                # Another time may still fit
+                return TIME
+            clear_draft(context.application, draft_key(update))
+            return ConversationHandler.END
 
         await update.message.reply_text(
             f"✅ Task added successfully!\n\n"
             f"I'll remind you: \"{task_data['message']}\"\n"
-            f"⏰ {task_desc} at {time_str}"
+            f"⏰ {describe_task(task)} at {time_str}"
         )
 
-        context.user_data.clear()
+        clear_draft(context.application, draft_key(update))
         return ConversationHandler.END
 
     except ValueError:
@@ -294,90 +369,159 @@ async def time_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
         return TIME
 
-async def list_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """List all tasks for the user."""
-    user_id = str(update.effective_user.id)
-    user_tasks = tasks.get(user_id, [])
-    
-    if not user_tasks:
-        await update.message.reply_text("You don't have any reminders set up.")
-        return
-    
+def render_list_page(user_tasks, page):
+    """Render one page of the /list view as (text, reply_markup)."""
+    pages = page_count(len(user_tasks))
+    start, end = page_bounds(page)
+
     # Format and display tasks
-    response = "📝 Your reminders:\n\n"
-    
-    for i, task in enumerate(user_tasks):
+    response = "📝 Your reminders:\n\n" if pages == 1 else f"📝 Your reminders (page {page + 1}/{pages}):\n\n"
+
+    for i, task in enumerate(user_tasks[start:end], start):
         # Format task description
-        if task['type'] == ONE_TIME:
-            task_desc = f"on {task['date']}"
+        if task.type == TaskType.CRON:
+            task_desc = describe_rule(task.rule)
+        elif task.type == TaskType.ONE_TIME:
+            task_desc = f"on {task.date_str} at {task.time}"
         else:  # DAILY
-            if task['frequency'] == 'everyday':
-                task_desc = "every day"
+            if task.frequency == Frequency.EVERYDAY:
+                task_desc = f"every day at {task.time}"
             else:  # custom
-                days_full = [DAY_NAMES[day] for day in task['days']]
-                task_desc = f"every {', '.join(days_full)}"
-        
-        response += f"{i+1}. \"{task['message']}\"\n"
-        response += f"   ⏰ {task_desc} at {task['time']}\n\n"
-    
-    await update.message.reply_text(response)
+                days_full = [DAY_NAMES[day] for day in task.day_codes]
+                task_desc = f"every {', '.join(days_full)} at {task.time}"
+
+        # Truncate long messages so a full page fits in one Telegram message
+        message = preview(task.message, LIST_PREVIEW_LENGTH)
+
+        response += f"{i+1}. \"{message}\"\n"
+        response += f"   ⏰ {task_desc}\n\n"
+
+    navigation = navigation_row('list', page, pages)
+    reply_markup = InlineKeyboardMarkup([navigation]) if navigation else None
+    return response, reply_markup
+
+def render_delete_page(user_tasks, page):
+    """Render one page of the /delete view as (text, reply_markup)."""
+    pages = page_count(len(user_tasks))
+    start, end = page_bounds(page)
 
-async def delete_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show list of tasks for deletion."""
-    user_id = str(update.effective_user.id)
-    user_tasks = tasks.get(user_id, [])
-    
-    if not user_tasks:
-        await update.message.reply_text("You don't have any reminders to delete.")
-        return
-    
     # Create inline keyboard with improved task options
     keyboard = []
-    for i, task in enumerate(user_tasks):
+    for i, task in enumerate(user_tasks[start:end], start):
         # Format task description
-        if task['type'] == ONE_TIME:
-            task_desc = f"📅 {task['date']}"
+        if task.type == TaskType.CRON:
+            task_desc = f"🔁 {task.rule}"
+        elif task.type == TaskType.ONE_TIME:
+            task_desc = f"📅 {task.date_str}"
         else:  # DAILY
-            if task['frequency'] == 'everyday':
+            if task.frequency == Frequency.EVERYDAY:
                 task_desc = "🔄 Every day"
             else:  # custom
-                days_full = [DAY_NAMES[day] for day in task['days']]
+                days_full = [DAY_NAMES[day] for day in task.day_codes]
                 days_text = ', '.join(days_full)
                 task_desc = f"🔄 Every {days_text}"
-        
+
         # Truncate message if too long for button
-        message = task['message']
-        if len(message) > 30:
-            message = message[:27] + "..."
-            
-        button_text = f"🗑️ {i+1}. \"{message}\" • {task_desc} • ⏰ {task['time']}"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"delete_{i}")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(
-        "Select a reminder to delete:",
-        reply_markup=reply_markup
-    )
+        message = preview(task.message, 30)
+
+        button_text = f"🗑️ {i+1}. \"{message}\" • {task_desc}"
+        if task.time is not None:
+            button_text += f" • ⏰ {task.time}"
+        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"delete_{task.id}")])
+
+    navigation = navigation_row('delete', page, pages)
+    if navigation:
+        keyboard.append(navigation)
+
+    text = "Select a reminder to delete:" if pages == 1 else f"Select a reminder to delete (page {page + 1}/{pages}):"
+    return text, InlineKeyboardMarkup(keyboard)
+
+PAGE_RENDERERS = {'list': render_list_page, 'delete': render_delete_page}
+
+def list_scope(update):
+    """Return the (chat_id, thread_id) whose reminders /list and /delete show.
+
+    Inside a forum topic only that topic's reminders are shown, elsewhere
+    all of the chat's reminders.
+    """
+    chat_id = str(update.effective_chat.id)
+    message = update.effective_message
+    if message is not None and getattr(message, 'is_topic_message', False):
+        return chat_id, message.message_thread_id
+    return chat_id, None
+
+def get_page(kind, chat_id, thread_id, page):
+    """Return a rendered page from the chat's render cache, rendering it on a miss."""
+    if thread_id is None:
+        scope_tasks = tasks.chat_tasks(chat_id)
+    else:
+        scope_tasks = tasks.thread_tasks(chat_id, thread_id)
+    page = min(page, page_count(len(scope_tasks)) - 1)
+    rendered = render_cache.get(chat_id, (kind, thread_id, page))
+    if rendered is None:
+        rendered = PAGE_RENDERERS[kind](scope_tasks, page)
+        render_cache.put(chat_id, (kind, thread_id, page), rendered)
+    return rendered
+
+def has_tasks(chat_id, thread_id):
+    if thread_id is None:
+        return bool(tasks.chat_tasks(chat_id))
+    return bool(tasks.thread_tasks(chat_id, thread_id))
+
+async def list_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """List the chat's tasks, one page at a time."""
+    chat_id, thread_id = list_scope(update)
+
+    if not has_tasks(chat_id, thread_id):
+        await update.message.reply_text("You don't have any reminders set up.")
+        return
+
+    text, reply_markup = get_page('list', chat_id, thread_id, 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def delete_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show list of tasks for deletion, one page at a time."""
+    chat_id, thread_id = list_scope(update)
+
+    if not has_tasks(chat_id, thread_id):
+        await update.message.reply_text("You don't have any reminders to delete.")
+        return
+
+    text, reply_markup = get_page('delete', chat_id, thread_id, 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def handle_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show another page of the /list or /delete view."""
+    query = update.callback_query
+    await query.answer()
+    chat_id, thread_id = list_scope(update)
+
+    # Callback data is page_<kind>_<page>
+    _, kind, page = query.data.split('_')
+
+    if not has_tasks(chat_id, thread_id):
+        await query.edit_message_text("You don't have any reminders set up.")
+        return
+
+    text, reply_markup = get_page(kind, chat_id, thread_id, int(page))
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 async def handle_delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Process delete task selection with improved UX."""
     query = update.callback_query
     await query.answer()
-    user_id = str(query.from_user.id)
-    
-    # Extract task index from callback data
-    task_index = int(query.data.split('_')[1])
-    
-    # Delete the task
-    if user_id in tasks and 0 <= task_index < len(tasks[user_id]):
-        # Get task details for confirmation message
-        task = tasks[user_id][task_index]
-        task_message = task['message']
-        
+    chat_id = str(update.effective_chat.id)
+
+    # Extract task id from callback data
+    task_id = int(query.data.split('_')[1])
+
+    # Only tasks of the chat the button was pressed in can be deleted
+    task = tasks.get(task_id)
+    if task is not None and task.chat_id == chat_id:
         # Delete the task
-        del tasks[user_id][task_index]
-        save_tasks(tasks)
+        index.remove(chat_id, task)
+        remove_task_record(task_id)
+        task_message = task.message
         
         await query.edit_message_text(
             f"✅ Reminder deleted successfully!\n\n"
@@ -386,8 +530,139 @@ async def handle_delete_callback(update: Update, context: ContextTypes.DEFAULT_T
     else:
         await query.edit_message_text(f"❌ Failed to delete reminder. Please try again.")
 
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show or change the time zone used for this chat's reminders."""
+    chat_id = str(update.effective_chat.id)
+
+    if not context.args:
+        current = get_chat_timezone(chat_id) or default_timezone_name()
+        await update.message.reply_text(
+            f"🌍 Your reminders use the {current} time zone.\n"
+            f"To change it, send /timezone followed by a zone name (e.g., /timezone Europe/Berlin)."
+        )
+        return
+
+    timezone_name = context.args[0]
+    if not is_valid_timezone(timezone_name):
+        await update.message.reply_text(
+            f"Unknown time zone: {timezone_name}. "
+            f"Please use a name like Europe/Berlin or America/New_York."
+        )
+        return
+
+    set_chat_timezone(chat_id, timezone_name)
+    # Reminders already set keep their local time in the new zone
+    index.reindex_chat(chat_id, tasks.chat_tasks(chat_id))
+
+    await update.message.reply_text(f"✅ Time zone set to {timezone_name}.")
+
+@track_draft
+async def import_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Start an import by asking for the file."""
+    if not quota.allow_command(update.effective_chat.id):
+        await update.message.reply_text(THROTTLED_TEXT)
+        return ConversationHandler.END
+
+    # Add a cancel button
+    keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await update.message.reply_text(
+        "📥 Send me a CSV or iCalendar (.ics) file with your reminders.\n\n"
+        "A CSV file needs a header row with the columns message, date, days and time:\n"
+        "• one-time reminders have a date (YYYY-MM-DD)\n"
+        "• recurring reminders have days (e.g., Mo,We,Fr) or neither for every day\n"
+        "• time is HH:MM\n\n"
+        "Files from /export can be imported as they are.",
+        reply_markup=reply_markup
+    )
+    return IMPORT_FILE
+
+@track_draft
+async def import_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Parse an uploaded CSV or iCalendar file and add all its reminders at once."""
+    document = update.message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text(
+            f"This file is too large. Please send at most {IMPORT_MAX_BYTES // (1024 * 1024)} MB."
+        )
+        return IMPORT_FILE
+
+    chat_id = str(update.effective_chat.id)
+    thread_id = getattr(update.effective_message, 'message_thread_id', None)
+
+    file = await document.get_file()
+    data = await file.download_as_bytearray()
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+
+    file_name = (document.file_name or '').lower()
+    if file_name.endswith(('.ics', '.ical')) or document.mime_type == 'text/calendar':
+        rows = parse_ical(lines, get_chat_timezone(chat_id))
+    else:
+        rows = parse_csv(lines)
+
+    errors = []
+    try:
+        new_tasks = list(build_tasks(rows, errors))
+    except UnicodeDecodeError:
+        await update.message.reply_text("I couldn't read this file. Please send it as UTF-8 text.")
+        return IMPORT_FILE
+
+    for task in new_tasks:
+        task.thread_id = thread_id
+        task.user_id = update.effective_user.id
+    if new_tasks:
+        try:
+            quota.check(chat_id, new_tasks)
+        except QuotaExceeded as e:
+            await update.message.reply_text(f"{e}\nNothing was imported from this file ({len(new_tasks)} reminders).")
+            clear_draft(context.application, draft_key(update))
+            return ConversationHandler.END
+        # One journal record and one index pass for the whole file
+        add_task_records(chat_id, new_tasks)
+        for task in new_tasks:
+            index.add(chat_id, task)
+
+    response = f"✅ Imported {len(new_tasks)} reminder(s)."
+    if errors:
+        response += f"\n\n⚠️ Skipped {len(errors)} invalid row(s):\n"
+        response += "\n".join(f"• line {line}: {reason}" for line, reason in errors[:IMPORT_ERRORS_SHOWN])
+        if len(errors) > IMPORT_ERRORS_SHOWN:
+            response += f"\n• and {len(errors) - IMPORT_ERRORS_SHOWN} more"
+    await update.message.reply_text(response)
+
+    clear_draft(context.application, draft_key(update))
+    return ConversationHandler.END
+
+async def export_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the chat's reminders as a CSV file, or iCalendar with /export ics."""
+    chat_id = str(update.effective_chat.id)
+    chat_tasks = tasks.chat_tasks(chat_id)
+
+    if not chat_tasks:
+        await update.message.reply_text("You don't have any reminders to export.")
+        return
+
+    if context.args and context.args[0].lower() in ('ics', 'ical'):
+        lines = export_ical(chat_tasks, get_chat_timezone(chat_id))
+        file_name = 'reminders.ics'
+    else:
+        lines = export_csv(chat_tasks)
+        file_name = 'reminders.csv'
+
+    document = io.BytesIO()
+    for line in lines:
+        document.write(line.encode())
+    document.seek(0)
+
+    await update.message.reply_document(
+        document=document, filename=file_name,
+        caption=f"📤 {len(chat_tasks)} reminder(s). Send this file to /import to restore them."
+    )
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel the current operation."""
+    drafts.finish(draft_key(update))
     # Check if it's a callback query
     if update.callback_query:
         await update.callback_query.answer()
@@ -395,9 +670,32 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     else:
         await update.message.reply_text("Operation cancelled.")
     
-    context.user_data.clear()
+    clear_draft(context.application, draft_key(update))
     return ConversationHandler.END
 
+async def revive_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Deliver reminders to a chat marked dead again once it talks to the bot."""
+    if update.effective_chat is not None:
+        outbox.revive(str(update.effective_chat.id))
+
+def move_chat(old_chat_id, new_chat_id):
+    """Move a chat's reminders to the id of the supergroup it was upgraded to."""
+    moved = move_chat_records(old_chat_id, new_chat_id)
+    for task in moved:
+        index.remove(old_chat_id, task)
+        index.add(task.chat_id, task)
+    if moved:
+        logger.info("Moved %d reminders of chat %s to %s", len(moved), old_chat_id, new_chat_id)
+    outbox.revive(str(new_chat_id))
+
+async def migrate_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Follow a group upgraded to a supergroup, which gets a new chat id."""
+    message = update.effective_message
+    if message.migrate_to_chat_id:
+        move_chat(str(message.chat_id), str(message.migrate_to_chat_id))
+    elif message.migrate_from_chat_id:
+        move_chat(str(message.migrate_from_chat_id), str(message.chat_id))
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log the error and send a message to the user."""
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
@@ -0,0 +1,75 @@
+import os
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+
+from constants import LOG_LEVEL, LOG_SAMPLE_RATE
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Libraries logging a line per request or per job at INFO
+NOISY_LOGGERS = ('httpx', 'apscheduler')
+
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', LOG_SAMPLE_RATE))
+
+_listener = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records as they are, leaving all formatting to the listener thread.
+
+    The stock QueueHandler formats each record before queueing it, on the
+    caller's thread. Log arguments here are plain values that don't change
+    after the call, so the record can be formatted later.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def sampled(rate=None):
+    """Whether to log this occurrence of a frequent event, at LOG_SAMPLE_RATE."""
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    return rate >= 1 or random.random() < rate
+
+
+def configure_logging():
+    """Send log records through a queue to a handler on a background thread.
+
+    Logging calls on the event loop only put the record on the queue; the
+    listener thread formats and writes it. Records still queued are written
+    at exit. LOG_LEVEL sets the level; the per-request lines of httpx and
+    the per-job lines of APScheduler (every tick and conversation timeout)
+    are only kept at DEBUG.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv('LOG_LEVEL', LOG_LEVEL).upper()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    if level != 'DEBUG':
+        for name in NOISY_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write the records still queued and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,35 +1,83 @@
 import os
+import asyncio
 import logging
 from dotenv import load_dotenv
-from telegram import Update
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, ConversationHandler,
-    CallbackQueryHandler, filters
+    CallbackQueryHandler, TypeHandler, filters
 )
+from telegram import Update
+
+# Load environment variables (before our modules read them at import time)
+load_dotenv()
 
 # Import our modules
-from constants import MESSAGE, DATE_TYPE, DATE, TIME, CUSTOM_DAYS
-from task_manager import tasks
+from constants import (
+    MESSAGE, DATE_TYPE, DATE, TIME, CUSTOM_DAYS, IMPORT_FILE, DRAFT_SWEEP_INTERVAL,
+    EXPIRY_SWEEP_INTERVAL, ROLE_ALL, ROLE_FRONTEND, ROLE_WORKER
+)
+from task_manager import tasks, writer
 from handlers import (
     start, add_task, task_message, date_type, date_input, 
     custom_days, time_input, list_tasks, delete_task, 
-    handle_delete_callback, cancel, error_handler
+    handle_delete_callback, handle_page_callback, set_timezone, import_tasks, import_file,
+    export_tasks, revive_chat, migrate_chat, move_chat, cancel, error_handler
 )
-from reminder import check_reminders
-
-# Load environment variables
-load_dotenv()
-
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
+from reminder import (
+    check_reminders, expire_fired_reminders, resume_reminders, sweep_expired_tasks, expiry_horizon
 )
+from conversations import drafts, conversation_timeout, sweep_drafts
+from dispatcher import dispatcher
+from outbox import outbox
+from sharding import run_worker
+from metrics import metrics_server
+from update_processor import update_processor
+import serving
+from log_config import configure_logging
+
+# Enable logging, written from a background thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
-def main() -> None:
-    """Start the bot."""
+def bot_role():
+    """Role of this process, from BOT_ROLE (all, frontend or worker)."""
+    return os.getenv('BOT_ROLE', ROLE_ALL)
+
+async def post_init(application: Application) -> None:
+    """Start background services once the bot is initialized."""
+    if bot_role() == ROLE_ALL:
+        outbox.load(os.path.join('data', 'outbox.journal'))
+        resume_reminders()
+        # Reminders of a group found upgraded while sending follow it
+        dispatcher.on_chat_migrated = move_chat
+        dispatcher.start(application.bot, outbox)
+    writer.start()
+    # METRICS_PORT exposes Prometheus metrics on METRICS_HOST (localhost by default)
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        await metrics_server.start(os.getenv('METRICS_HOST', '127.0.0.1'), int(metrics_port))
+
+async def post_stop(application: Application) -> None:
+    """Let queued reminders go out and flush the task store before exiting."""
+    await dispatcher.stop()
+    await outbox.close()
+    await writer.stop()
+    await metrics_server.stop()
+
+def build_application(token, base_url=None) -> Application:
+    """Create the Application with all handlers and jobs registered."""
     # Create the Application and pass it your bot's token
-    application = Application.builder().token(os.getenv('BOT_TOKEN')).build()
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        # Different chats are handled concurrently, each chat's updates in order
+        .concurrent_updates(update_processor)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
     
     # Add conversation handler for adding tasks
     add_task_conv = ConversationHandler(
@@ -56,30 +104,79 @@ def main() -> None:
             TIME: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, time_input),
                 CallbackQueryHandler(cancel, pattern=r'^cancel$')
-            ]
+            ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)]
+        },
+        fallbacks=[CommandHandler('cancel', cancel)],
+        per_message=False,
+        conversation_timeout=drafts.ttl
+    )
+    
+    # Add conversation handler for importing tasks from a file
+    import_conv = ConversationHandler(
+        entry_points=[CommandHandler('import', import_tasks)],
+        states={
+            IMPORT_FILE: [
+                MessageHandler(filters.Document.ALL, import_file),
+                CallbackQueryHandler(cancel, pattern=r'^cancel$')
+            ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)]
         },
         fallbacks=[CommandHandler('cancel', cancel)],
-        per_message=False
+        per_message=False,
+        conversation_timeout=drafts.ttl
     )
     
     # Register handlers
+    # Any update from a chat shows it can receive reminders again
+    application.add_handler(TypeHandler(Update, revive_chat), group=-1)
+    application.add_handler(MessageHandler(filters.StatusUpdate.MIGRATE, migrate_chat))
     application.add_handler(CommandHandler('start', start))
     application.add_handler(add_task_conv)
+    application.add_handler(import_conv)
     application.add_handler(CommandHandler('list', list_tasks))
     application.add_handler(MessageHandler(filters.Regex(r'^📋 My Reminders$'), list_tasks))
     application.add_handler(CommandHandler('delete', delete_task))
     application.add_handler(MessageHandler(filters.Regex(r'^🗑️ Delete Reminder$'), delete_task))
-    application.add_handler(CallbackQueryHandler(handle_delete_callback, pattern=r'^delete_'))
+    application.add_handler(CallbackQueryHandler(handle_delete_callback, pattern=r'^delete_\d+$'))
+    application.add_handler(CallbackQueryHandler(handle_page_callback, pattern=r'^page_(list|delete)_\d+$'))
+    application.add_handler(CommandHandler('timezone', set_timezone))
+    application.add_handler(CommandHandler('export', export_tasks))
     
     # Add error handler
     application.add_error_handler(error_handler)
     
     # Add job to check reminders every minute
     job_queue = application.job_queue
-    job_queue.run_repeating(check_reminders, interval=60, first=1)
-    
-    # Start the Bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Evict drafts of conversations abandoned midway
+    job_queue.run_repeating(sweep_drafts, interval=DRAFT_SWEEP_INTERVAL, first=DRAFT_SWEEP_INTERVAL)
+    if bot_role() == ROLE_FRONTEND:
+        # Shard workers send the reminders; only clean up fired one-time tasks
+        job_queue.run_repeating(expire_fired_reminders, interval=60, first=1)
+    else:
+        job_queue.run_repeating(check_reminders, interval=60, first=1)
+    # Purge one-time reminders that can no longer be sent, e.g. after a long outage
+    job_queue.run_repeating(
+        sweep_expired_tasks, interval=EXPIRY_SWEEP_INTERVAL, first=60,
+        data=expiry_horizon(bot_role() == ROLE_ALL)
+    )
+
+    return application
+
+def main() -> None:
+    """Start the bot."""
+    # BOT_API_URL points the bot at a local stand-in for the Bot API
+    base_url = os.getenv('BOT_API_URL')
+
+    if bot_role() == ROLE_WORKER:
+        # Shard workers only send reminders for their partition of chats
+        asyncio.run(run_worker(os.getenv('BOT_TOKEN'), base_url))
+        return
+
+    application = build_application(os.getenv('BOT_TOKEN'), base_url)
+
+    # Start the Bot (webhook or long polling, see serving.run)
+    serving.run(application)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
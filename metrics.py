@@ -0,0 +1,236 @@
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+LATENESS_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+# Bucket upper bounds for the distribution of task counts per chat
+CHAT_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# How often the event loop lag probe wakes up, in seconds
+LAG_PROBE_INTERVAL = 0.5
+
+
+def _format_labels(labels):
+    labels = list(labels)
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{value}"' for key, value in labels)
+    return f'{{{pairs}}}'
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        # Unlabelled counters are reported as 0 before their first increment
+        self._values = {} if label_names else {(): 0}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self._values.items()):
+            labels = _format_labels(zip(self.label_names, label_values))
+            lines.append(f'{self.name}{labels} {value}')
+        return lines
+
+
+class Gauge:
+    """Value that is set, or computed by a callback when scraped."""
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        value = self.callback() if self.callback else self.value
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge', f'{self.name} {value}']
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds.
+
+    Observing is a bisect and two additions, cheap enough for the send path.
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self._counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_sum {self._sum}')
+        lines.append(f'{self.name}_count {self._count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f"Error rendering metric {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+tick_duration = registry.register(Histogram(
+    'reminder_tick_duration_seconds', 'Time spent in one scheduler tick.', DURATION_BUCKETS
+))
+send_duration = registry.register(Histogram(
+    'reminder_send_duration_seconds', 'Duration of one send_message call.', DURATION_BUCKETS
+))
+send_lateness = registry.register(Histogram(
+    'reminder_delivery_lateness_seconds', 'Delay between a reminder being due and it being sent.',
+    LATENESS_BUCKETS
+))
+reminders_sent = registry.register(Counter(
+    'reminders_sent_total', 'Reminders delivered.'
+))
+reminders_failed = registry.register(Counter(
+    'reminders_failed_total', 'Reminders given up on, by error type.', ('error',)
+))
+reminders_retried = registry.register(Counter(
+    'reminders_retried_total', 'Send attempts retried, by error type.', ('error',)
+))
+reminders_skipped = registry.register(Counter(
+    'reminders_skipped_total', 'Reminders not sent, by reason.', ('reason',)
+))
+save_duration = registry.register(Histogram(
+    'task_store_save_duration_seconds', 'Time to write queued journal records and snapshots.',
+    DURATION_BUCKETS
+))
+loop_lag = registry.register(Histogram(
+    'event_loop_lag_seconds', 'How late the event loop woke a sleeping probe.', DURATION_BUCKETS
+))
+
+
+class ChatSizeGauge:
+    """Distribution of task counts per chat, computed when scraped."""
+
+    name = 'chat_tasks'
+
+    def __init__(self, get_tasks):
+        self.get_tasks = get_tasks
+
+    def render(self):
+        tasks = self.get_tasks()
+        counts = [0] * (len(CHAT_SIZE_BUCKETS) + 1)
+        total = 0
+        for chat_tasks in tasks.values():
+            counts[bisect_left(CHAT_SIZE_BUCKETS, len(chat_tasks))] += 1
+            total += len(chat_tasks)
+
+        lines = [
+            '# HELP tasks_total Reminders in the task store.',
+            '# TYPE tasks_total gauge',
+            f'tasks_total {total}',
+            '# HELP chats_total Chats in the task store.',
+            '# TYPE chats_total gauge',
+            f'chats_total {len(tasks)}',
+            '# HELP chat_tasks Chats by number of reminders they hold.',
+            '# TYPE chat_tasks histogram',
+        ]
+        cumulative = 0
+        for bound, count in zip(CHAT_SIZE_BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'chat_tasks_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'chat_tasks_sum {total}')
+        lines.append(f'chat_tasks_count {len(tasks)}')
+        return lines
+
+
+async def _probe_loop_lag():
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        loop_lag.observe(max(0.0, time.monotonic() - start - LAG_PROBE_INTERVAL))
+
+
+async def _handle_request(reader, writer):
+    try:
+        request_line = await reader.readline()
+        # Skip the headers
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', registry.render().encode()
+        else:
+            status, body = '404 Not Found', b'Not found\n'
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+class MetricsServer:
+    """Serve GET /metrics on a local port and run the event loop lag probe."""
+
+    def __init__(self):
+        self._server = None
+        self._probe = None
+
+    async def start(self, host, port):
+        self._server = await asyncio.start_server(_handle_request, host, port)
+        self._probe = asyncio.create_task(_probe_loop_lag())
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self._probe is not None:
+            self._probe.cancel()
+            await asyncio.gather(self._probe, return_exceptions=True)
+            self._probe = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+metrics_server = MetricsServer()
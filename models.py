@@ -0,0 +1,197 @@
+import sys
+from datetime import date, datetime
+from enum import IntEnum
+
+from constants import ONE_TIME, DAILY, CRON, VALID_DAYS
+from recurrence import compile_rule
+
+# Bit for each weekday, Monday = bit 0 (matches datetime.weekday())
+DAY_BITS = {day: 1 << i for i, day in enumerate(VALID_DAYS)}
+ALL_DAYS = (1 << len(VALID_DAYS)) - 1
+
+
+class TaskType(IntEnum):
+    ONE_TIME = 0
+    DAILY = 1
+    CRON = 2
+
+    @property
+    def code(self):
+        return _TYPE_CODES[self]
+
+    @classmethod
+    def from_code(cls, code):
+        return _TYPES_BY_CODE[code]
+
+
+class Frequency(IntEnum):
+    NONE = 0
+    EVERYDAY = 1
+    CUSTOM = 2
+
+    @property
+    def code(self):
+        return _FREQUENCY_CODES[self]
+
+    @classmethod
+    def from_code(cls, code):
+        return _FREQUENCIES_BY_CODE[code]
+
+
+_TYPE_CODES = {TaskType.ONE_TIME: ONE_TIME, TaskType.DAILY: DAILY, TaskType.CRON: CRON}
+_TYPES_BY_CODE = {code: task_type for task_type, code in _TYPE_CODES.items()}
+_FREQUENCY_CODES = {Frequency.EVERYDAY: 'everyday', Frequency.CUSTOM: 'custom'}
+_FREQUENCIES_BY_CODE = {code: frequency for frequency, code in _FREQUENCY_CODES.items()}
+
+
+def intern_chat_id(chat_id):
+    """Return a shared string for a chat id so every task of a chat reuses it."""
+    return sys.intern(str(chat_id))
+
+
+def days_to_mask(days):
+    """Convert day codes like ['Mo', 'Fr'] to a 7-bit weekday mask."""
+    mask = 0
+    for day in days:
+        mask |= DAY_BITS[day]
+    return mask
+
+
+def mask_to_days(mask):
+    """Convert a weekday mask back to day codes in week order."""
+    return [day for day in VALID_DAYS if mask & DAY_BITS[day]]
+
+
+def parse_date(date_str):
+    """Validate a YYYY-MM-DD date, raising ValueError if it is invalid."""
+    return datetime.strptime(date_str, '%Y-%m-%d').date()
+
+
+def parse_time(time_str):
+    """Validate an HH:MM time, raising ValueError if it is invalid."""
+    return datetime.strptime(time_str, '%H:%M').time()
+
+
+def invalid_days(days):
+    """Return the entries of `days` that are not day codes like 'Mo'."""
+    return [day for day in days if day not in VALID_DAYS]
+
+
+def parse_minute(time_str):
+    """Convert an 'HH:MM' string to minutes since midnight."""
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class Task:
+    """Compact in-memory reminder.
+
+    The time is stored as minute of day, the date as a proleptic ordinal and
+    the weekdays as a bit mask, so checking whether a task is due is a couple
+    of integer operations. `from_dict`/`to_dict` convert to and from the JSON
+    shape used in storage.
+
+    `id` is assigned once by the task store and never reused. `chat_id` is
+    set by the store too and is not serialized, since tasks are stored under
+    their chat. `user_id` is the user who created the task, if known.
+
+    Cron tasks have a `rule` (a cron expression) instead of a time and days.
+    """
+
+    __slots__ = (
+        'id', 'chat_id', 'user_id', 'message', 'type', 'frequency', 'minute', 'days', 'date',
+        'thread_id', 'rule'
+    )
+
+    def __init__(self, message, type, minute, frequency=Frequency.NONE, days=0,
+                 date=None, thread_id=None, id=None, user_id=None, rule=None):
+        self.id = id
+        self.chat_id = None
+        self.user_id = user_id
+        self.message = message
+        self.type = type
+        self.frequency = frequency
+        self.minute = minute
+        # Everyday tasks fire on every weekday
+        self.days = ALL_DAYS if frequency == Frequency.EVERYDAY else days
+        self.date = date
+        self.thread_id = thread_id
+        self.rule = rule
+
+    @classmethod
+    def from_dict(cls, data):
+        task_type = TaskType.from_code(data['type'])
+        frequency = Frequency.NONE
+        days = 0
+        task_date = None
+        if task_type == TaskType.CRON:
+            return cls(
+                data['message'],
+                task_type,
+                None,
+                thread_id=data.get('message_thread_id'),
+                id=data.get('id'),
+                user_id=data.get('user_id'),
+                rule=data['rule'],
+            )
+        if task_type == TaskType.ONE_TIME:
+            task_date = date.fromisoformat(data['date']).toordinal()
+        else:
+            frequency = Frequency.from_code(data['frequency'])
+            if frequency == Frequency.CUSTOM:
+                days = days_to_mask(data['days'])
+        return cls(
+            data['message'],
+            task_type,
+            parse_minute(data['time']),
+            frequency=frequency,
+            days=days,
+            date=task_date,
+            thread_id=data.get('message_thread_id'),
+            id=data.get('id'),
+            user_id=data.get('user_id'),
+        )
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'message': self.message,
+            'type': self.type.code,
+        }
+        if self.type == TaskType.CRON:
+            data['rule'] = self.rule
+        else:
+            data['time'] = self.time
+        if self.user_id is not None:
+            data['user_id'] = self.user_id
+        if self.thread_id is not None:
+            data['message_thread_id'] = self.thread_id
+        if self.type == TaskType.ONE_TIME:
+            data['date'] = self.date_str
+        elif self.type == TaskType.DAILY:
+            data['frequency'] = self.frequency.code
+            if self.frequency == Frequency.CUSTOM:
+                data['days'] = self.day_codes
+        return data
+
+    @property
+    def time(self):
+        if self.minute is None:
+            return None
+        return f"{self.minute // 60:02d}:{self.minute % 60:02d}"
+
+    @property
+    def recurrence(self):
+        """The compiled rule of a cron task."""
+        return compile_rule(self.rule)
+
+    @property
+    def date_str(self):
+        return date.fromordinal(self.date).isoformat() if self.date is not None else None
+
+    @property
+    def day_codes(self):
+        return mask_to_days(self.days)
+
+    def __repr__(self):
+        return f"Task({self.to_dict()!r})"
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+import metrics
+from storage import fsync_dir
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Finished keys are remembered this long (seconds), so a restart can't send them again
+KEY_RETENTION = 3600
+# Dead chats get another delivery attempt after this many seconds
+DEAD_CHAT_RETRY = 24 * 3600
+# Records appended before the outbox file is rewritten without finished entries
+OUTBOX_COMPACT_EVERY = 10000
+
+
+class OutboxEntry:
+    """A fired reminder that has not been delivered or given up on yet."""
+
+    __slots__ = ('key', 'chat_id', 'text', 'thread_id', 'due_at')
+
+    def __init__(self, key, chat_id, text, thread_id=None, due_at=None):
+        self.key = key
+        self.chat_id = chat_id
+        self.text = text
+        self.thread_id = thread_id
+        self.due_at = due_at
+
+    def to_record(self):
+        return {
+            'op': 'put', 'key': self.key, 'chat': self.chat_id, 'text': self.text,
+            'thread': self.thread_id, 'due_at': self.due_at,
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record['key'], record['chat'], record['text'], record['thread'], record['due_at'])
+
+
+class Outbox:
+    """Durable queue of fired reminders between the scheduler and the dispatcher.
+
+    The scheduler `put`s each fired reminder under an idempotency key (task
+    id and fire minute) and `flush`es before handing it to the dispatcher,
+    which `complete`s the key once the reminder is sent or given up on.
+    Entries still pending after a crash or restart are delivered again
+    (at least once), and keys finished in the last KEY_RETENTION seconds
+    are refused, so a tick repeated after a restart sends nothing twice.
+
+    Chats that can never be delivered to (bot blocked, chat deleted) are
+    marked dead. The scheduler skips them until they show activity again,
+    or for DEAD_CHAT_RETRY seconds, after which one reminder probes them.
+
+    The outbox also keeps the scheduler's cursor, the last minute it
+    processed, so reminders missed while the process was down can be
+    caught up on after a restart.
+
+    Records are JSON lines appended to one file per sending process and
+    fsynced on `flush`; the file is rewritten with only the live state on
+    load and after every OUTBOX_COMPACT_EVERY appended records. Without `load` the outbox
+    only lives in memory.
+    """
+
+    def __init__(self):
+        self.path = None
+        self._pending = {}
+        # Key -> time it was finished
+        self._done = {}
+        # Chat id -> time it was marked dead
+        self._dead = {}
+        # UTC timestamp of the last minute the scheduler processed
+        self.cursor = None
+        self._records = []
+        self._file = None
+        # Records in the file, and how many of them the last rewrite left
+        self._written = 0
+        self._compacted = 0
+        self._lock = None
+
+    def load(self, path):
+        """Read the outbox file and compact it."""
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            self._read(path)
+        self._prune(time.time())
+        self._rewrite(self._state_records())
+        if self._pending:
+            logger.info(f"Outbox has {len(self._pending)} undelivered reminders")
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete record")
+                    self._apply(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Discarding incomplete record at end of {path}")
+                    break
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'put':
+            self._pending[record['key']] = OutboxEntry.from_record(record)
+        elif op == 'done':
+            self._pending.pop(record['key'], None)
+            self._done[record['key']] = record['at']
+        elif op == 'drop':
+            self._pending.pop(record['key'], None)
+        elif op == 'dead':
+            self._dead[record['chat']] = record['at']
+        elif op == 'revive':
+            self._dead.pop(record['chat'], None)
+        elif op == 'cursor':
+            self.cursor = record['at']
+
+    def _prune(self, now):
+        cutoff = now - KEY_RETENTION
+        self._done = {key: at for key, at in self._done.items() if at >= cutoff}
+
+    def _state_records(self):
+        records = [entry.to_record() for entry in self._pending.values()]
+        records.extend({'op': 'done', 'key': key, 'at': at} for key, at in self._done.items())
+        records.extend({'op': 'dead', 'chat': chat_id, 'at': at} for chat_id, at in self._dead.items())
+        if self.cursor is not None:
+            records.append({'op': 'cursor', 'at': self.cursor})
+        return records
+
+    def _rewrite(self, records):
+        """Replace the file with the given records and reopen it for appending."""
+        if self._file is not None:
+            self._file.close()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        fsync_dir(os.path.dirname(self.path) or '.')
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._written = self._compacted = len(records)
+
+    def put(self, key, chat_id, text, thread_id=None, due_at=None):
+        """Record a fired reminder; return its entry, or None if the key is known already."""
+        if key in self._pending or key in self._done:
+            return None
+        entry = OutboxEntry(key, chat_id, text, thread_id, due_at)
+        self._pending[key] = entry
+        self._records.append(entry.to_record())
+        return entry
+
+    def complete(self, key):
+        """Mark a reminder as sent or given up on."""
+        if self._pending.pop(key, None) is None:
+            return
+        now = time.time()
+        self._done[key] = now
+        self._records.append({'op': 'done', 'key': key, 'at': now})
+
+    def discard(self, key):
+        """Forget a pending reminder without finishing its key, e.g. one another worker sends."""
+        if self._pending.pop(key, None) is not None:
+            self._records.append({'op': 'drop', 'key': key})
+
+    def mark_dead(self, chat_id):
+        """Stop delivering to a chat that can't receive messages."""
+        now = time.time()
+        self._dead[chat_id] = now
+        self._records.append({'op': 'dead', 'chat': chat_id, 'at': now})
+
+    def revive(self, chat_id):
+        """Deliver to a dead chat again, e.g. after it sent the bot a message."""
+        if self._dead.pop(chat_id, None) is not None:
+            self._records.append({'op': 'revive', 'chat': chat_id})
+
+    def set_cursor(self, at):
+        """Record the last minute the scheduler processed, as a UTC timestamp."""
+        self.cursor = at
+        self._records.append({'op': 'cursor', 'at': at})
+
+    def is_dead(self, chat_id):
+        since = self._dead.get(chat_id)
+        return since is not None and time.time() - since < DEAD_CHAT_RETRY
+
+    @property
+    def dead_count(self):
+        return len(self._dead)
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def pending_entries(self):
+        return list(self._pending.values())
+
+    async def flush(self):
+        """Durably write the records queued since the last flush."""
+        if self._file is None:
+            self._records = []
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            records, self._records = self._records, []
+            if not records:
+                return
+            try:
+                await asyncio.to_thread(self._write, records)
+            except Exception:
+                self._records[:0] = records
+                raise
+            if self._written - self._compacted >= OUTBOX_COMPACT_EVERY:
+                self._prune(time.time())
+                # The state is captured on the loop; later records go to the new file
+                await asyncio.to_thread(self._rewrite, self._state_records())
+
+    def _write(self, records):
+        self._file.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._written += len(records)
+
+    async def close(self):
+        await self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_entries(path):
+    """Undelivered entries of an outbox file, leaving the file as it is."""
+    other = Outbox()
+    other._read(path)
+    return other.pending_entries()
+
+
+# Shared outbox, loaded by the process that sends reminders
+outbox = Outbox()
+metrics.registry.register(metrics.Gauge(
+    'outbox_pending', 'Fired reminders not yet delivered or given up on.',
+    callback=lambda: outbox.pending_count
+))
+metrics.registry.register(metrics.Gauge(
+    'dead_chats', 'Chats reminders are not sent to because they cannot receive messages.',
+    callback=lambda: outbox.dead_count
+))
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton
+
+from constants import PAGE_SIZE
+from dispatcher import message_length
+
+# Chats whose rendered pages are kept; the least recently used are dropped first
+MAX_CACHED_CHATS = 10000
+
+
+def page_count(total):
+    """Number of pages needed for `total` items (at least one)."""
+    return max(1, -(-total // PAGE_SIZE))
+
+
+def page_bounds(page):
+    """Slice bounds of the items on a page."""
+    start = page * PAGE_SIZE
+    return start, start + PAGE_SIZE
+
+
+def preview(text, limit):
+    """Cut a text to at most `limit` UTF-16 code units, as Telegram counts them, marking the cut with '...'."""
+    if message_length(text) <= limit:
+        return text
+    # A surrogate pair split at the cut is dropped by errors='ignore'
+    return text.encode('utf-16-le')[:(limit - 3) * 2].decode('utf-16-le', errors='ignore') + "..."
+
+
+def navigation_row(kind, page, pages):
+    """Prev/next buttons for a paginated view, or an empty row for a single page."""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️ Prev", callback_data=f"page_{kind}_{page - 1}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("Next ▶️", callback_data=f"page_{kind}_{page + 1}"))
+    return row
+
+
+class RenderCache:
+    """Rendered /list and /delete pages per chat.
+
+    A chat's pages are dropped whenever its tasks change, so pressing
+    through pages of an unchanged chat never re-renders anything.
+    """
+
+    def __init__(self, max_chats=MAX_CACHED_CHATS):
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+
+    def get(self, chat_id, key):
+        pages = self._chats.get(chat_id)
+        if pages is None:
+            return None
+        self._chats.move_to_end(chat_id)
+        return pages.get(key)
+
+    def put(self, chat_id, key, value):
+        pages = self._chats.get(chat_id)
+        if pages is None:
+            pages = self._chats[chat_id] = {}
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        pages[key] = value
+
+    def invalidate(self, chat_id):
+        self._chats.pop(chat_id, None)
+
+
+render_cache = RenderCache()
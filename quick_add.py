@@ -0,0 +1,96 @@
+import re
+
+from constants import VALID_DAYS, DAY_NAMES
+from models import parse_minute, parse_time
+from recurrence import MACROS, NTH_WORDS, interval_rule, nth_weekday_rule
+from transfer import task_from_fields
+
+_DAY = '|'.join(VALID_DAYS)
+_DAY_NAME = '|'.join(DAY_NAMES.values())
+_MACRO = '|'.join(MACROS)
+
+# <when> <HH:MM> <message>, where <when> is a date, a list of days or "daily"
+QUICK_ADD_PATTERN = re.compile(
+    rf'''
+    ^\s*
+    (?:
+        (?P<date>\d{{4}}-\d{{2}}-\d{{2}})
+      | (?P<days>(?:{_DAY})(?:\s*,\s*(?:{_DAY}))*)
+      | (?P<everyday>daily|everyday|every\s+day)
+    )
+    \s+(?P<time>\d{{1,2}}:\d{{2}})
+    \s+(?P<message>\S.*?)
+    \s*$
+    ''',
+    re.VERBOSE | re.DOTALL | re.IGNORECASE,
+)
+
+# <rule> <message>: an interval, an nth weekday of the month, or a cron
+# expression or @macro
+RULE_PATTERN = re.compile(
+    rf'''
+    ^\s*
+    (?:
+        every\s+(?P<every>\d+)\s*(?:(?P<minutes>minutes?|mins?|m)|(?P<hours>hours?|h))
+        (?:\s+between\s+(?P<start>\d{{1,2}})(?::00)?\s+and\s+(?P<end>\d{{1,2}})(?::00)?)?
+      | (?P<nth>{'|'.join(NTH_WORDS)}|last)\s+(?P<weekday>{_DAY_NAME}|{_DAY})
+        (?:\s+of\s+(?:the|each|every)\s+month)?
+        \s+(?P<time>\d{{1,2}}:\d{{2}})
+      | cron\s+(?P<cron>(?:{_MACRO})(?=\s)|\S+(?:\s+\S+){{4}})
+    )
+    \s+(?P<message>\S.*?)
+    \s*$
+    ''',
+    re.VERBOSE | re.DOTALL | re.IGNORECASE,
+)
+
+QUICK_ADD_USAGE = (
+    "/add 2025-03-15 11:50 Pay rent\n"
+    "/add Mo,We,Fr 09:00 Standup\n"
+    "/add daily 08:00 Take vitamins\n"
+    "/add every 15 minutes Stretch\n"
+    "/add every 2 hours between 9 and 18 Drink water\n"
+    "/add first Monday of the month 10:00 Team sync\n"
+    "/add cron 0 9 * * 1-5 Check the inbox\n"
+    "/add cron @daily Back up the laptop"
+)
+
+
+def parse_rule(match):
+    """Convert a RULE_PATTERN match to a cron expression."""
+    if match['every']:
+        start = int(match['start']) if match['start'] else None
+        end = int(match['end']) if match['end'] else None
+        return interval_rule(int(match['every']), 'minute' if match['minutes'] else 'hour', start, end)
+    if match['nth']:
+        weekday = match['weekday'].capitalize()[:2]
+        try:
+            parse_time(match['time'])
+        except ValueError:
+            raise ValueError(f"invalid time {match['time']!r}, use HH:MM") from None
+        return nth_weekday_rule(match['nth'].lower(), weekday, parse_minute(match['time']))
+    if match['cron'].startswith('@'):
+        return match['cron'].lower()
+    return match['cron']
+
+
+def parse_quick_add(text):
+    """Parse '<when> <HH:MM> <message>' or '<rule> <message>' into a Task.
+
+    Raises ValueError with a user-facing reason when the text doesn't match
+    or fails the same validation as the guided /add conversation.
+    """
+    match = QUICK_ADD_PATTERN.match(text)
+    if match is None:
+        rule_match = RULE_PATTERN.match(text)
+        if rule_match is None:
+            raise ValueError("expected a date, days, 'daily' or a rule, then a time and the message")
+        return task_from_fields({'message': rule_match['message'], 'rule': parse_rule(rule_match)})
+
+    fields = {'message': match['message'], 'time': match['time'].zfill(5)}
+    if match['date']:
+        fields['date'] = match['date']
+    elif match['days']:
+        # Day codes are matched case-insensitively but stored as in VALID_DAYS
+        fields['days'] = ','.join(day.strip().capitalize() for day in match['days'].split(','))
+    return task_from_fields(fields)
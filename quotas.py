@@ -0,0 +1,144 @@
+import os
+import logging
+from collections import Counter
+
+import metrics
+from constants import (
+    MAX_TASKS_PER_CHAT, MAX_TASKS, MAX_TASKS_PER_CHAT_SLOT, MAX_TASKS_PER_SLOT,
+    MAX_RULE_FIRES_PER_CHAT, MAX_RULE_FIRES, CREATE_RATE, CREATE_BURST
+)
+from models import TaskType
+from dispatcher import TokenBucket
+from task_manager import tasks
+from scheduler import index
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Idle per-chat creation buckets are pruned once this many are tracked
+MAX_TRACKED_CHATS = 10000
+
+
+class QuotaExceeded(Exception):
+    """A reminder can't be created; the message is meant for the user."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+class CreationQuota:
+    """Limits on how many reminders chats have and how fast they add them.
+
+    Counts come from the task store and from the per-chat counts the
+    scheduler index keeps for every UTC minute, so checking a reminder
+    costs a few lookups per minute it fires at. A limit of 0 is no limit.
+    Refused reminders and commands are counted by reason.
+
+    Cron rules have no fixed minute, so the slot limits can't see them.
+    They are limited by how many times a day they can fire instead, added
+    up per chat and over all chats.
+    """
+
+    def __init__(self, max_per_chat, max_total, max_per_chat_slot, max_per_slot,
+                 max_rule_fires_per_chat, max_rule_fires, rate, burst):
+        self.max_per_chat = max_per_chat
+        self.max_total = max_total
+        self.max_per_chat_slot = max_per_chat_slot
+        self.max_per_slot = max_per_slot
+        self.max_rule_fires_per_chat = max_rule_fires_per_chat
+        self.max_rule_fires = max_rule_fires
+        # Commands per minute, as tokens per second
+        self.rate = rate / 60
+        self.burst = burst
+        self._buckets = {}
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_CHATS:
+                self._buckets = {key: value for key, value in self._buckets.items() if not value.idle}
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def allow_command(self, chat_id):
+        """Take a token for a creation command, returning False if the chat is throttled."""
+        if not self.rate:
+            return True
+        bucket = self._bucket(str(chat_id))
+        if bucket.wait_time() > 0:
+            commands_throttled.inc()
+            return False
+        bucket.consume()
+        return True
+
+    def check(self, chat_id, new_tasks):
+        """Raise QuotaExceeded if adding `new_tasks` to a chat would break a limit."""
+        try:
+            self._check(chat_id, new_tasks)
+        except QuotaExceeded as e:
+            reminders_rejected.inc(e.reason, amount=len(new_tasks))
+            logger.info("Refused %d reminders for chat %s: %s", len(new_tasks), chat_id, e.reason)
+            raise
+
+    def _check(self, chat_id, new_tasks):
+        count = tasks.chat_task_count(chat_id)
+        if self.max_per_chat and count + len(new_tasks) > self.max_per_chat:
+            raise QuotaExceeded('chat', (
+                f"⚠️ A chat can have at most {self.max_per_chat} reminders and this one has {count}. "
+                f"Delete some with /delete to make room."
+            ))
+        if self.max_total and tasks.task_count() + len(new_tasks) > self.max_total:
+            raise QuotaExceeded('total', "⚠️ I can't take any more reminders right now. Please try again later.")
+
+        self._check_rules(chat_id, new_tasks)
+        if not (self.max_per_chat_slot or self.max_per_slot):
+            return
+        added = Counter(slot for task in new_tasks for slot in index.slots(chat_id, task))
+        for slot, extra in added.items():
+            total, in_chat = index.slot_load(chat_id, slot)
+            if self.max_per_chat_slot and in_chat + extra > self.max_per_chat_slot:
+                raise QuotaExceeded('chat_slot', (
+                    f"⚠️ A chat can have at most {self.max_per_chat_slot} reminders at the same minute. "
+                    f"Please pick another time."
+                ))
+            if self.max_per_slot and total + extra > self.max_per_slot:
+                raise QuotaExceeded('slot', (
+                    "⚠️ Too many reminders are already set for that minute. Please pick another time."
+                ))
+
+    def _check_rules(self, chat_id, new_tasks):
+        fires = sum(task.recurrence.fires_per_day for task in new_tasks if task.type == TaskType.CRON)
+        if not fires or not (self.max_rule_fires_per_chat or self.max_rule_fires):
+            return
+        total, in_chat = index.rule_load(chat_id)
+        if self.max_rule_fires_per_chat and in_chat + fires > self.max_rule_fires_per_chat:
+            raise QuotaExceeded('chat_rule_fires', (
+                f"⚠️ Reminders on a schedule can fire at most {self.max_rule_fires_per_chat} times a day "
+                f"in a chat, all together, and this would make {in_chat + fires}. "
+                f"Pick a longer interval or delete some with /delete."
+            ))
+        if self.max_rule_fires and total + fires > self.max_rule_fires:
+            raise QuotaExceeded('rule_fires', (
+                "⚠️ Too many reminders on a schedule are already set. Please pick a longer interval."
+            ))
+
+
+quota = CreationQuota(
+    int(os.getenv('MAX_TASKS_PER_CHAT', MAX_TASKS_PER_CHAT)),
+    int(os.getenv('MAX_TASKS', MAX_TASKS)),
+    int(os.getenv('MAX_TASKS_PER_CHAT_SLOT', MAX_TASKS_PER_CHAT_SLOT)),
+    int(os.getenv('MAX_TASKS_PER_SLOT', MAX_TASKS_PER_SLOT)),
+    int(os.getenv('MAX_RULE_FIRES_PER_CHAT', MAX_RULE_FIRES_PER_CHAT)),
+    int(os.getenv('MAX_RULE_FIRES', MAX_RULE_FIRES)),
+    float(os.getenv('CREATE_RATE', CREATE_RATE)),
+    int(os.getenv('CREATE_BURST', CREATE_BURST)),
+)
+
+reminders_rejected = metrics.registry.register(metrics.Counter(
+    'reminders_rejected_total', 'Reminders not created because of a quota, by limit.', ('limit',)
+))
+commands_throttled = metrics.registry.register(metrics.Counter(
+    'creation_commands_throttled_total', 'Creation commands refused by the per-chat rate limit.'
+))
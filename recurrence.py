@@ -0,0 +1,286 @@
+import re
+import functools
+from datetime import datetime, date, time, timedelta, timezone
+
+from constants import VALID_DAYS, DAY_NAMES
+
+# Bit of the nth-weekday masks meaning "last <weekday> of the month"; bits 0-4 are 1st-5th
+LAST_WEEK_BIT = 1 << 5
+# Longest gap between two fires searched for, covers rules that only fire on Feb 29
+MAX_SEARCH_DAYS = 8 * 366
+
+MONTH_NAMES = {
+    name: number for number, name in enumerate(
+        ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'), 1
+    )
+}
+# Cron weekday numbers: 0 (and 7) = Sunday
+WEEKDAY_NAMES = {name: number for number, name in enumerate(('SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT'))}
+
+MACROS = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+}
+
+NTH_WORDS = ('first', 'second', 'third', 'fourth', 'fifth')
+
+
+def _next_bit(mask, start):
+    """Lowest set bit of `mask` at or above `start`, or None."""
+    rest = mask >> start
+    if not rest:
+        return None
+    return start + (rest & -rest).bit_length() - 1
+
+
+def _parse_value(text, low, high, names):
+    value = names.get(text.upper()) if names else None
+    if value is None:
+        if not text.isdigit():
+            raise ValueError(f"invalid value {text!r}")
+        value = int(text)
+    if not low <= value <= high:
+        raise ValueError(f"{value} is out of range {low}-{high}")
+    return value
+
+
+def _parse_field(text, low, high, names=None):
+    """Convert one cron field like '*/15' or '1-5,7' to a bit mask of its values."""
+    mask = 0
+    for part in text.split(','):
+        spec, slash, step = part.partition('/')
+        if slash and not (step.isdigit() and int(step) > 0):
+            raise ValueError(f"invalid step in {part!r}")
+        step = int(step) if slash else 1
+        if spec in ('*', '?'):
+            start, end = low, high
+        elif '-' in spec:
+            first, last = spec.split('-', 1)
+            start, end = _parse_value(first, low, high, names), _parse_value(last, low, high, names)
+        else:
+            start = _parse_value(spec, low, high, names)
+            end = high if slash else start
+        if start > end:
+            raise ValueError(f"invalid range {part!r}")
+        for value in range(start, end + 1, step):
+            mask |= 1 << value
+    return mask
+
+
+def _cron_to_weekday(value):
+    """Convert a cron weekday (0 or 7 = Sunday) to datetime.weekday() (0 = Monday)."""
+    return (value - 1) % 7
+
+
+class Recurrence:
+    """Compiled cron rule: minute, hour, day, month and weekday bit masks.
+
+    The next fire time is found by jumping straight to the next set bit of
+    each field, so it costs a few integer operations per day skipped rather
+    than a check per minute. Besides the usual cron syntax, weekdays accept
+    'MON#1' (first Monday of the month) and 'MONL' or '1L' (last Monday).
+    As in cron, a rule restricting both the day of month and the weekday
+    fires on days matching either.
+    """
+
+    __slots__ = (
+        'expression', 'minutes', 'hours', 'days', 'months', 'weekdays', 'nth', 'any_day', 'any_weekday'
+    )
+
+    def __init__(self, expression):
+        fields = MACROS.get(expression.lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError("a cron rule has 5 fields: minute hour day month weekday")
+        minute, hour, day, month, weekday = fields
+        self.expression = ' '.join(expression.split())
+        self.minutes = _parse_field(minute, 0, 59)
+        self.hours = _parse_field(hour, 0, 23)
+        # Bit n is day n of the month, bit 0 is unused
+        self.days = _parse_field(day, 1, 31)
+        self.months = _parse_field(month, 1, 12, MONTH_NAMES)
+        self.weekdays, self.nth = self._parse_weekdays(weekday)
+        self.any_day = day.startswith(('*', '?'))
+        self.any_weekday = weekday.startswith(('*', '?'))
+
+    @staticmethod
+    def _parse_weekdays(text):
+        """Return the weekday mask (Monday = bit 0) and the nth-weekday masks per weekday."""
+        nth = [0] * 7
+        plain = []
+        for part in text.split(','):
+            if '#' in part:
+                day, _, n = part.partition('#')
+                if not (n.isdigit() and 1 <= int(n) <= 5):
+                    raise ValueError(f"invalid week number in {part!r}, use 1-5")
+                nth[_cron_to_weekday(_parse_value(day, 0, 7, WEEKDAY_NAMES))] |= 1 << (int(n) - 1)
+            elif len(part) > 1 and part.upper().endswith('L'):
+                nth[_cron_to_weekday(_parse_value(part[:-1], 0, 7, WEEKDAY_NAMES))] |= LAST_WEEK_BIT
+            else:
+                plain.append(part)
+
+        mask = 0
+        if plain:
+            cron_mask = _parse_field(','.join(plain), 0, 7, WEEKDAY_NAMES)
+            for value in range(8):
+                if cron_mask >> value & 1:
+                    mask |= 1 << _cron_to_weekday(value)
+        return mask, tuple(nth)
+
+    @property
+    def fires_per_day(self):
+        """Most times the rule fires in one day."""
+        return self.minutes.bit_count() * self.hours.bit_count()
+
+    def matches_day(self, day):
+        if not self.months >> day.month & 1:
+            return False
+        if self.any_day and self.any_weekday:
+            return True
+
+        weekday = day.weekday()
+        weekday_ok = bool(self.weekdays >> weekday & 1)
+        nth = self.nth[weekday]
+        if not weekday_ok and nth:
+            weekday_ok = bool(nth >> ((day.day - 1) // 7) & 1) or bool(
+                nth & LAST_WEEK_BIT and (day + timedelta(days=7)).month != day.month
+            )
+        if self.any_day:
+            return weekday_ok
+        day_ok = bool(self.days >> day.day & 1)
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def matches(self, day, minute):
+        """Check whether the rule fires on a date at a minute of the day."""
+        return (
+            bool(self.hours >> (minute // 60) & 1 and self.minutes >> (minute % 60) & 1)
+            and self.matches_day(day)
+        )
+
+    def next_after(self, after):
+        """First naive local datetime strictly after `after` the rule fires at, or None."""
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day, hour, minute = start.date(), start.hour, start.minute
+        first_minute = _next_bit(self.minutes, 0)
+
+        for _ in range(MAX_SEARCH_DAYS):
+            if not self.months >> day.month & 1:
+                # Skip to the first day of the next month in the rule
+                month = _next_bit(self.months, day.month + 1)
+                if month is None:
+                    day = date(day.year + 1, _next_bit(self.months, 1), 1)
+                else:
+                    day = date(day.year, month, 1)
+                hour = minute = 0
+                continue
+
+            if self.matches_day(day):
+                fire_hour = _next_bit(self.hours, hour)
+                if fire_hour is not None:
+                    fire_minute = _next_bit(self.minutes, minute) if fire_hour == hour else first_minute
+                    if fire_minute is None:
+                        fire_hour = _next_bit(self.hours, hour + 1)
+                        fire_minute = first_minute
+                    if fire_hour is not None:
+                        return datetime.combine(day, time(fire_hour, fire_minute))
+
+            day += timedelta(days=1)
+            hour = minute = 0
+        return None
+
+    def next_fire(self, after_utc, zone):
+        """First aware UTC datetime after `after_utc` the rule fires at in `zone`, or None.
+
+        Times skipped by a DST change fire at the same offset after it; times
+        repeated by one fire once.
+        """
+        local = after_utc.astimezone(zone).replace(tzinfo=None)
+        while True:
+            local = self.next_after(local)
+            if local is None:
+                return None
+            fire_at = local.replace(tzinfo=zone).astimezone(timezone.utc)
+            if fire_at > after_utc:
+                return fire_at
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_rule(expression):
+    """Compile a cron expression, raising ValueError with a user-facing reason if it is invalid.
+
+    Compiled rules are shared by every task using the same expression.
+    """
+    rule = Recurrence(expression)
+    if rule.next_after(datetime(2000, 1, 1)) is None:
+        raise ValueError(f"{rule.expression!r} never fires")
+    return rule
+
+
+def interval_rule(every, unit, start=None, end=None):
+    """Cron expression for 'every N minutes/hours', optionally between two hours of the day.
+
+    Intervals restart at the top of each hour (minutes) or at midnight or
+    `start` (hours), so without a window they must divide the hour or day.
+    """
+    hours_window = f"{start}-{end}" if start is not None else '*'
+    if start is not None and not 0 <= start < end <= 23:
+        raise ValueError("the window must be between two hours from 0 to 23, earliest first")
+
+    if unit == 'minute':
+        if not 1 <= every <= 60 or 60 % every:
+            raise ValueError("the number of minutes must divide 60, e.g. 5, 15 or 30")
+        if start is not None:
+            # Up to but not past the end of the window
+            hours_window = f"{start}-{end - 1}" if end - 1 > start else str(start)
+        return f"*/{every} {hours_window} * * *" if every < 60 else f"0 {hours_window} * * *"
+
+    if not 1 <= every <= 23 or (start is None and 24 % every):
+        raise ValueError("the number of hours must divide 24, e.g. 2, 6 or 12, unless a window is given")
+    return f"0 {hours_window}/{every} * * *"
+
+
+def nth_weekday_rule(nth, day_code, minute):
+    """Cron expression for e.g. the first Monday of every month at a minute of the day."""
+    weekday = (VALID_DAYS.index(day_code) + 1) % 7
+    week = 'L' if nth == 'last' else f"#{NTH_WORDS.index(nth) + 1}"
+    return f"{minute % 60} {minute // 60} * * {weekday}{week}"
+
+
+# Shapes produced by interval_rule and nth_weekday_rule, for describe_rule
+_MINUTES_RULE = re.compile(r'^\*/(\d+) (\*|\d+|\d+-\d+) \* \* \*$')
+_HOURS_RULE = re.compile(r'^0 (\*|\d+-\d+)/(\d+) \* \* \*$')
+_NTH_RULE = re.compile(r'^(\d+) (\d+) \* \* (\d)(?:#(\d)|L)$')
+
+
+def describe_rule(expression):
+    """Describe a rule in words if it has one of the shapes /add creates, e.g. 'every 15 minutes'."""
+    match = _MINUTES_RULE.match(expression)
+    if match:
+        every, window = match.groups()
+        if window == '*':
+            return f"every {every} minutes"
+        first, _, last = window.partition('-')
+        return f"every {every} minutes from {int(first):02d}:00 to {int(last or first) + 1:02d}:00"
+
+    match = _HOURS_RULE.match(expression)
+    if match:
+        window, every = match.groups()
+        if window == '*':
+            return f"every {every} hours"
+        first, last = window.split('-')
+        return f"every {every} hours from {int(first):02d}:00 to {int(last):02d}:00"
+
+    match = _NTH_RULE.match(expression)
+    if match:
+        minute, hour, weekday, week = match.groups()
+        day_name = DAY_NAMES[VALID_DAYS[_cron_to_weekday(int(weekday))]]
+        nth = NTH_WORDS[int(week) - 1] if week else 'last'
+        return f"on the {nth} {day_name} of the month at {int(hour):02d}:{int(minute):02d}"
+
+    return f"on schedule {expression}"
@@ -1,56 +1,155 @@
+import os
+import time
 import logging
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timedelta, timezone
 from telegram.ext import ContextTypes
 
-from constants import ONE_TIME, DAILY, WEEKDAY_MAP
-from task_manager import tasks, save_tasks
+from constants import (
+    CLAIM_WINDOW, CATCH_UP_ALL, CATCH_UP_LATEST, CATCH_UP_DROP, CATCH_UP_MAX_AGE, CATCH_UP_BURST
+)
+from models import TaskType
+from task_manager import remove_task_record
+from scheduler import index
+from dispatcher import dispatcher
+from outbox import outbox
+from metrics import tick_duration, reminders_skipped
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
+CATCH_UP_POLICY = os.getenv('CATCH_UP_POLICY', CATCH_UP_ALL)
+if CATCH_UP_POLICY not in (CATCH_UP_ALL, CATCH_UP_LATEST, CATCH_UP_DROP):
+    raise ValueError(f"CATCH_UP_POLICY must be {CATCH_UP_ALL}, {CATCH_UP_LATEST} or {CATCH_UP_DROP}")
+CATCH_UP_MAX_AGE = int(os.getenv('CATCH_UP_MAX_AGE', CATCH_UP_MAX_AGE))
+CATCH_UP_BURST = int(os.getenv('CATCH_UP_BURST', CATCH_UP_BURST))
+
+# Missed reminders in the outbox not handed to the dispatcher yet, oldest first
+backlog = deque()
+
+def outbox_key(task, fire_at):
+    """Idempotency key of one firing of a task."""
+    return f"{task.id}:{fire_at:%Y%m%d%H%M}"
+
+def remove_one_time_task(chat_id, task):
+    """Drop a fired one-time task from the index and the store."""
+    index.remove(chat_id, task)
+    remove_task_record(task.id)
+
+def replay_start(current):
+    """First minute the tick at `current` processes: the one after the cursor, within the catch-up window."""
+    if outbox.cursor is None:
+        return current
+    start = datetime.fromtimestamp(outbox.cursor, timezone.utc) + timedelta(minutes=1)
+    if CATCH_UP_POLICY == CATCH_UP_DROP:
+        return max(start, current)
+    return max(start, current - timedelta(minutes=CATCH_UP_MAX_AGE))
+
+def resume_reminders():
+    """Rewind the index to the first minute missed while the bot was down."""
+    current = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    start = replay_start(current)
+    if start < current:
+        logger.info("Catching up on reminders missed since %s UTC", f"{start:%Y-%m-%d %H:%M}")
+        index.rewind(start)
+
+def fire(chat_id, task, minute):
+    """Put one firing of a task in the outbox, returning its entry or None."""
+    if outbox.is_dead(chat_id):
+        reminders_skipped.inc('dead_chat')
+        return None
+    return outbox.put(outbox_key(task, minute), chat_id, task.message, task.thread_id, minute.timestamp())
+
 async def check_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Check for reminders to send."""
-    now = datetime.now()
-    current_time = now.strftime('%H:%M')
-    current_date = now.strftime('%Y-%m-%d')
-    weekday = now.weekday()
-    current_day = WEEKDAY_MAP[weekday]
-
-    logger.info(f"Checking reminders at {current_time}")
-
-    # Iterate through tasks for each chat (group or private)
-    for chat_id, user_tasks in list(tasks.items()):
-        for i, task in enumerate(list(user_tasks)):
-            # Check if time matches
-            if task['time'] == current_time:
-                # Check if task should run today
-                should_run = False
-                
-                if task['type'] == ONE_TIME:
-                    if task['date'] == current_date:
-                        should_run = True
-                        # Remove one-time task after sending
-                        user_tasks.pop(i)
-                        save_tasks(tasks)
-                
-                elif task['type'] == DAILY:
-                    if task['frequency'] == 'everyday':
-                        should_run = True
-                    elif task['frequency'] == 'custom':
-                        if current_day in task['days']:
-                            should_run = True
-                
-                # Send reminder if conditions match
-                if should_run:
-                    thread_id = task.get('message_thread_id')
-                    await send_reminder(context, chat_id, task['message'], thread_id)
-
-async def send_reminder(context, chat_id, message, thread_id=None):
-    try:
-        kwargs = {}
-        if thread_id is not None:
-            kwargs["message_thread_id"] = thread_id
-        await context.bot.send_message(chat_id=chat_id, text=message, **kwargs)
-        logger.info(f"Sent reminder to {chat_id} (thread: {thread_id}): {message}")
-    except Exception as e:
-        logger.error(f"Error sending reminder to {chat_id}: {e}")
+    """Check for reminders to send, catching up on minutes missed since the last tick.
+
+    Logs one summary per tick instead of a line per reminder.
+    """
+    started = time.monotonic()
+    now = datetime.now(timezone.utc)
+    current = now.replace(second=0, microsecond=0)
+
+    logger.debug("Checking reminders at %s", current)
+    # Deliveries since the previous tick
+    dispatcher.log_summary()
+
+    # Only the reminders filed under each minute are touched
+    index.refresh_offsets(current)
+    fired = []
+    # Task id (or task id and minute) -> (minute, chat_id, task), oldest first
+    missed = {}
+    one_time = []
+    minute = replay_start(current)
+    while minute <= current:
+        index.advance(minute)
+        for chat_id, task in index.due(minute, refresh=False):
+            if task.type == TaskType.ONE_TIME:
+                one_time.append((chat_id, task))
+            if minute == current:
+                entry = fire(chat_id, task, minute)
+                if entry is not None:
+                    fired.append(entry)
+            elif CATCH_UP_POLICY == CATCH_UP_LATEST:
+                if missed.pop(task.id, None) is not None:
+                    reminders_skipped.inc('superseded')
+                missed[task.id] = (minute, chat_id, task)
+            else:
+                missed[task.id, minute] = (minute, chat_id, task)
+        minute += timedelta(minutes=1)
+
+    for minute, chat_id, task in missed.values():
+        entry = fire(chat_id, task, minute)
+        if entry is not None:
+            backlog.append(entry)
+
+    if outbox.cursor is None or outbox.cursor < current.timestamp():
+        outbox.set_cursor(current.timestamp())
+
+    # Fired reminders are durable before one-time tasks leave the store
+    await outbox.flush()
+    for chat_id, task in one_time:
+        remove_one_time_task(chat_id, task)
+
+    # Hand the reminders to the dispatcher instead of awaiting each send
+    dispatcher.submit_entries(fired)
+    caught_up = min(CATCH_UP_BURST, len(backlog))
+    if caught_up:
+        dispatcher.submit_entries([backlog.popleft() for _ in range(caught_up)])
+
+    duration = time.monotonic() - started
+    tick_duration.observe(duration)
+    if fired or missed or caught_up:
+        logger.info(
+            "Tick %s: %d reminders due, %d missed, %d caught up (%d left), %.3fs",
+            f"{current:%H:%M}", len(fired), len(missed), caught_up, len(backlog), duration
+        )
+
+async def expire_fired_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Remove one-time reminders once shard workers can no longer send them.
+
+    Used by the front process when reminders are sent by shard workers,
+    which only follow the store and never modify it.
+    """
+    expired_minute = datetime.now(timezone.utc) - timedelta(minutes=CLAIM_WINDOW + 1)
+    for chat_id, task in index.due(expired_minute, refresh=False):
+        if task.type == TaskType.ONE_TIME:
+            remove_one_time_task(chat_id, task)
+
+async def sweep_expired_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Remove one-time reminders too old to be sent, e.g. missed during a long outage.
+
+    The job's data is how many minutes back reminders can still be sent.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=context.job.data)
+    expired = index.expired_one_time(cutoff)
+    for chat_id, task in expired:
+        remove_one_time_task(chat_id, task)
+    if expired:
+        reminders_skipped.inc('expired', amount=len(expired))
+        logger.info("Removed %d expired one-time reminders", len(expired))
+
+def expiry_horizon(catch_up):
+    """Minutes after which an unsent one-time reminder is expired."""
+    if not catch_up or CATCH_UP_POLICY == CATCH_UP_DROP:
+        return CLAIM_WINDOW + 1
+    return max(CATCH_UP_MAX_AGE, CLAIM_WINDOW + 1)
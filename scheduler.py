@@ -0,0 +1,301 @@
+import heapq
+import logging
+from collections import Counter, defaultdict, deque
+from datetime import datetime, date, time, timedelta, timezone
+
+from constants import CLAIM_WINDOW
+from models import TaskType
+from task_manager import tasks, get_chat_timezone
+from timezones import get_zone
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def utc_offset_minutes(zone_name, now_utc):
+    """Current UTC offset of a zone in minutes."""
+    return int(now_utc.astimezone(get_zone(zone_name)).utcoffset().total_seconds() // 60)
+
+
+class ReminderIndex:
+    """Next-fire-time index over the task store, normalised to UTC.
+
+    Recurring tasks live in UTC minute-of-week buckets (0 = Monday 00:00),
+    one-time tasks in buckets keyed by UTC (date ordinal, minute of day).
+    Each bucket maps task id -> (chat_id, task), so a tick only touches
+    the reminders that are due in that minute, whatever zones are in use.
+
+    Recurring tasks are converted with their zone's current UTC offset. The
+    offset of every zone in use is checked once per tick and a zone's tasks
+    are only re-filed when it changes, i.e. around DST transitions.
+
+    Cron tasks are kept in a heap ordered by their next UTC fire time, which
+    the compiled rule computes directly. Each tick pops the rules that have
+    come due, files them in the dated bucket of the minute they fire at for
+    CLAIM_WINDOW minutes, and pushes their next fire time, so they cost
+    nothing on the ticks where they don't fire and one-time and daily tasks
+    are looked up as before.
+
+    The number of tasks each chat has filed under each bucket is counted
+    as tasks are filed, for the creation quotas, and so are the most times
+    a day each chat's cron tasks can fire.
+    """
+
+    def __init__(self, zone_name_for):
+        self.zone_name_for = zone_name_for
+        self._weekly = defaultdict(dict)
+        self._dated = defaultdict(dict)
+        # (bucket key, chat_id) -> tasks of the chat in that bucket
+        self._chat_load = Counter()
+        # Task id -> (zone name, [(bucket dict, key)])
+        self._filed = {}
+        # Zone name -> recurring tasks in that zone, and the offset they were filed with
+        self._zones = defaultdict(dict)
+        self._offsets = {}
+        # Heap of (next fire time, task id) of cron tasks; entries not
+        # matching `_rules` are stale and skipped
+        self._heap = []
+        # Task id -> (chat_id, task, zone name, next fire time)
+        self._rules = {}
+        # Chat id -> most fires a day of its cron tasks, and their sum
+        self._rule_fires = Counter()
+        self._rule_fires_total = 0
+        # (fire time, task id, dated key) of fired cron tasks, oldest first
+        self._fired = deque()
+        # Latest UTC minute the cron tasks were advanced to
+        self._cursor = None
+
+    def _keys(self, task, zone_name):
+        """Return the (bucket dict, key) pairs a task is filed under."""
+        if task.type == TaskType.ONE_TIME:
+            local = datetime.combine(
+                date.fromordinal(task.date),
+                time(task.minute // 60, task.minute % 60),
+                tzinfo=get_zone(zone_name),
+            )
+            fire_at = local.astimezone(timezone.utc)
+            return [(self._dated, (fire_at.toordinal(), fire_at.hour * 60 + fire_at.minute))]
+
+        offset = self._offsets.get(zone_name)
+        if offset is None:
+            offset = utc_offset_minutes(zone_name, datetime.now(timezone.utc))
+            self._offsets[zone_name] = offset
+        return [
+            (self._weekly, (weekday * MINUTES_PER_DAY + task.minute - offset) % MINUTES_PER_WEEK)
+            for weekday in range(7) if task.days >> weekday & 1
+        ]
+
+    def _file(self, buckets, key, chat_id, task):
+        bucket = buckets[key]
+        if task.id not in bucket:
+            self._chat_load[key, chat_id] += 1
+        bucket[task.id] = (chat_id, task)
+
+    def _unfile(self, buckets, key, task_id):
+        bucket = buckets.get(key)
+        if bucket is None:
+            return
+        filed = bucket.pop(task_id, None)
+        if filed is not None:
+            load_key = (key, filed[0])
+            self._chat_load[load_key] -= 1
+            if not self._chat_load[load_key]:
+                del self._chat_load[load_key]
+        if not bucket:
+            del buckets[key]
+
+    def _count_rule(self, chat_id, task, sign):
+        fires = sign * task.recurrence.fires_per_day
+        chat_id = str(chat_id)
+        self._rule_fires[chat_id] += fires
+        if not self._rule_fires[chat_id]:
+            del self._rule_fires[chat_id]
+        self._rule_fires_total += fires
+
+    def _schedule_rule(self, chat_id, task, zone_name, after):
+        """Push the first time after `after` a cron task fires."""
+        fire_at = task.recurrence.next_fire(after, get_zone(zone_name))
+        if fire_at is None:
+            self._rules.pop(task.id, None)
+            return
+        self._rules[task.id] = (chat_id, task, zone_name, fire_at)
+        heapq.heappush(self._heap, (fire_at, task.id))
+
+    def add(self, chat_id, task):
+        """File a task under every minute it should fire."""
+        zone_name = self.zone_name_for(chat_id)
+        if task.type == TaskType.CRON:
+            # Filed under the minutes it fires at once they come due
+            if task.id not in self._filed:
+                self._count_rule(chat_id, task, 1)
+            self._filed[task.id] = (zone_name, [])
+            after = self._cursor if self._cursor is not None else datetime.now(timezone.utc)
+            self._schedule_rule(chat_id, task, zone_name, after)
+            return
+        keys = self._keys(task, zone_name)
+        for buckets, key in keys:
+            self._file(buckets, key, chat_id, task)
+        self._filed[task.id] = (zone_name, keys)
+        if task.type != TaskType.ONE_TIME:
+            self._zones[zone_name][task.id] = (chat_id, task)
+
+    def remove(self, chat_id, task):
+        """Drop a task from every bucket it was filed under."""
+        filed = self._filed.pop(task.id, None)
+        zone_name, keys = filed if filed is not None else (None, ())
+        self._rules.pop(task.id, None)
+        if filed is not None and task.type == TaskType.CRON:
+            self._count_rule(chat_id, task, -1)
+        for buckets, key in keys:
+            self._unfile(buckets, key, task.id)
+
+        zone_tasks = self._zones.get(zone_name)
+        if zone_tasks is not None:
+            zone_tasks.pop(task.id, None)
+            if not zone_tasks:
+                del self._zones[zone_name]
+                self._offsets.pop(zone_name, None)
+
+    def slots(self, chat_id, task):
+        """UTC minutes a task not yet added would be filed under.
+
+        Minute-of-week keys for recurring tasks, (date ordinal, minute)
+        for one-time tasks. Cron tasks are only filed once they come due
+        and have none; `rule_load` counts them instead.
+        """
+        if task.type == TaskType.CRON:
+            return []
+        return [key for _, key in self._keys(task, self.zone_name_for(chat_id))]
+
+    def slot_load(self, chat_id, slot):
+        """(all reminders, the chat's reminders) filed under a slot from `slots`.
+
+        A one-time slot also counts the recurring reminders of that minute.
+        """
+        if isinstance(slot, tuple):
+            ordinal, minute = slot
+            weekly_key = date.fromordinal(ordinal).weekday() * MINUTES_PER_DAY + minute
+            keys = ((self._dated, slot), (self._weekly, weekly_key))
+        else:
+            keys = ((self._weekly, slot),)
+        chat_id = str(chat_id)
+        total = sum(len(buckets.get(key, ())) for buckets, key in keys)
+        in_chat = sum(self._chat_load[key, chat_id] for _, key in keys)
+        return total, in_chat
+
+    def rule_load(self, chat_id):
+        """(all cron tasks, the chat's cron tasks) as the most times a day they fire."""
+        return self._rule_fires_total, self._rule_fires[str(chat_id)]
+
+    def reindex_chat(self, chat_id, chat_tasks):
+        """Re-file a chat's tasks, e.g. after its time zone changed."""
+        for task in chat_tasks:
+            self.remove(chat_id, task)
+            self.add(chat_id, task)
+
+    def rebuild(self, all_tasks):
+        """Rebuild the whole index from a chat_id -> [task] mapping."""
+        self._weekly.clear()
+        self._dated.clear()
+        self._chat_load.clear()
+        self._filed.clear()
+        self._zones.clear()
+        self._offsets.clear()
+        self._heap.clear()
+        self._rules.clear()
+        self._rule_fires.clear()
+        self._rule_fires_total = 0
+        self._fired.clear()
+        for chat_id, chat_tasks in all_tasks.items():
+            for task in chat_tasks:
+                self.add(chat_id, task)
+
+    def refresh_offsets(self, now_utc):
+        """Re-file the recurring tasks of zones whose UTC offset changed."""
+        for zone_name, zone_tasks in list(self._zones.items()):
+            offset = utc_offset_minutes(zone_name, now_utc)
+            if offset == self._offsets.get(zone_name):
+                continue
+            logger.info(
+                "UTC offset of %s changed, re-filing %d reminders", zone_name or 'default zone', len(zone_tasks)
+            )
+            zone_tasks = list(zone_tasks.values())
+            for chat_id, task in zone_tasks:
+                self.remove(chat_id, task)
+            self._offsets[zone_name] = offset
+            for chat_id, task in zone_tasks:
+                self.add(chat_id, task)
+
+    def advance(self, now_utc):
+        """File the cron tasks firing up to `now_utc` and drop those fired CLAIM_WINDOW minutes before."""
+        now = now_utc.replace(second=0, microsecond=0)
+        oldest = now - timedelta(minutes=CLAIM_WINDOW)
+        self._cursor = now if self._cursor is None else max(self._cursor, now)
+
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            fire_at, task_id = heapq.heappop(heap)
+            rule = self._rules.get(task_id)
+            if rule is None or rule[3] != fire_at:
+                continue
+            chat_id, task, zone_name, _ = rule
+            if fire_at < oldest:
+                # Asleep or started late: skip to the fires that are still claimable
+                self._schedule_rule(chat_id, task, zone_name, oldest - timedelta(minutes=1))
+                continue
+            key = (fire_at.toordinal(), fire_at.hour * 60 + fire_at.minute)
+            self._file(self._dated, key, chat_id, task)
+            self._filed[task_id][1].append((self._dated, key))
+            self._fired.append((fire_at, task_id, key))
+            self._schedule_rule(chat_id, task, zone_name, fire_at)
+
+        fired = self._fired
+        while fired and fired[0][0] < oldest:
+            _, task_id, key = fired.popleft()
+            filed = self._filed.get(task_id)
+            if filed is None or (self._dated, key) not in filed[1]:
+                continue
+            filed[1].remove((self._dated, key))
+            self._unfile(self._dated, key, task_id)
+
+    def rewind(self, since_utc):
+        """Re-schedule cron tasks from the UTC minute `since_utc`, so the minutes from it can be replayed."""
+        before = since_utc.replace(second=0, microsecond=0) - timedelta(minutes=1)
+        self._cursor = before
+        for chat_id, task, zone_name, _ in list(self._rules.values()):
+            self._schedule_rule(chat_id, task, zone_name, before)
+
+    def expired_one_time(self, before_utc):
+        """Return the (chat_id, task) pairs of one-time tasks filed before the given UTC minute."""
+        cutoff = (before_utc.toordinal(), before_utc.hour * 60 + before_utc.minute)
+        return [
+            (chat_id, task)
+            for key, bucket in self._dated.items() if key < cutoff
+            for chat_id, task in bucket.values() if task.type == TaskType.ONE_TIME
+        ]
+
+    def refresh(self, now_utc):
+        """Bring the index up to date for a tick at `now_utc`."""
+        self.refresh_offsets(now_utc)
+        self.advance(now_utc)
+
+    def due(self, now_utc, refresh=True):
+        """Return the (chat_id, task) pairs that fire at the given UTC minute."""
+        if refresh:
+            self.refresh(now_utc)
+
+        minute = now_utc.hour * 60 + now_utc.minute
+        minute_of_week = now_utc.weekday() * MINUTES_PER_DAY + minute
+        dated_key = (now_utc.toordinal(), minute)
+
+        due_tasks = list(self._weekly.get(minute_of_week, {}).values())
+        due_tasks.extend(self._dated.get(dated_key, {}).values())
+        return due_tasks
+
+
+# Initialize index
+index = ReminderIndex(get_chat_timezone)
+index.rebuild(tasks)
@@ -0,0 +1,85 @@
+import os
+import logging
+import secrets
+
+from telegram import Update
+from telegram.ext import (
+    CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, TypeHandler
+)
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Update types each handler class needs from Telegram
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: Update.MESSAGE,
+    MessageHandler: Update.MESSAGE,
+    CallbackQueryHandler: Update.CALLBACK_QUERY,
+}
+
+
+def _handler_update_types(handler):
+    if isinstance(handler, ConversationHandler):
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        types = set()
+        for nested_handler in nested:
+            types |= _handler_update_types(nested_handler)
+        return types
+
+    if isinstance(handler, TypeHandler) and handler.type is Update:
+        # Sees whatever the other handlers ask for, needs nothing of its own
+        return set()
+
+    for handler_class, update_type in HANDLER_UPDATE_TYPES.items():
+        if isinstance(handler, handler_class):
+            return {update_type}
+
+    # Unknown handler type: don't risk filtering out what it needs
+    return set(Update.ALL_TYPES)
+
+
+def allowed_updates_for(application):
+    """Update types the registered handlers can actually handle.
+
+    Telegram is asked for these only, instead of every update type.
+    """
+    types = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            types |= _handler_update_types(handler)
+    return sorted(types)
+
+
+def run(application):
+    """Serve updates through a webhook if WEBHOOK_URL is set, else by long polling.
+
+    In webhook mode an embedded HTTP server listens on WEBHOOK_LISTEN and
+    WEBHOOK_PORT, and requests without the WEBHOOK_SECRET token are rejected.
+    On SIGINT/SIGTERM the server stops accepting requests first, updates
+    already received are processed, and the webhook is left registered so
+    Telegram holds new updates until the next start instead of dropping them.
+    """
+    allowed_updates = allowed_updates_for(application)
+    webhook_url = os.getenv('WEBHOOK_URL')
+
+    if not webhook_url:
+        logger.info(f"Starting long polling for {', '.join(allowed_updates)}")
+        application.run_polling(allowed_updates=allowed_updates)
+        return
+
+    # Without a configured secret, a fresh one is registered on every start
+    secret_token = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+    url_path = os.getenv('WEBHOOK_PATH', 'webhook')
+
+    logger.info(f"Starting webhook at {webhook_url} for {', '.join(allowed_updates)}")
+    application.run_webhook(
+        listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+        port=int(os.getenv('WEBHOOK_PORT', '8443')),
+        url_path=url_path,
+        webhook_url=webhook_url,
+        secret_token=secret_token,
+        allowed_updates=allowed_updates,
+        drop_pending_updates=False,
+    )
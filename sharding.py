@@ -0,0 +1,386 @@
+import os
+import time
+import socket
+import shutil
+import signal
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+
+from telegram import Bot
+
+from constants import (
+    GLOBAL_SEND_RATE, HEARTBEAT_INTERVAL, WORKER_TTL, SHARD_TICK_INTERVAL, CLAIM_WINDOW
+)
+from task_manager import tasks, journal, load_tasks
+from scheduler import index
+from dispatcher import dispatcher
+from outbox import outbox, read_entries
+from reminder import outbox_key
+from metrics import tick_duration, reminders_skipped, metrics_server
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Claim directories older than this many minutes are removed
+CLAIM_RETENTION = 60
+
+
+def _hash(value):
+    """Stable 64-bit hash, identical in every process (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def owner_of(chat_id, workers):
+    """Rendezvous hashing: the live worker with the highest score owns the chat.
+
+    When a worker joins or leaves, only the chats it wins or held move.
+    """
+    return max(workers, key=lambda worker_id: _hash(f"{worker_id}:{chat_id}"))
+
+
+class Membership:
+    """Worker membership through heartbeat files in a shared directory."""
+
+    def __init__(self, directory, worker_id):
+        self.directory = directory
+        self.worker_id = worker_id
+        self.path = os.path.join(directory, worker_id)
+        os.makedirs(directory, exist_ok=True)
+
+    def heartbeat(self):
+        with open(self.path, 'a'):
+            os.utime(self.path)
+
+    def live_workers(self):
+        """Workers whose heartbeat is younger than WORKER_TTL, sorted by id."""
+        cutoff = time.time() - WORKER_TTL
+        workers = []
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    workers.append(entry.name)
+            except FileNotFoundError:
+                continue
+        return sorted(workers)
+
+    def leave(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ClaimStore:
+    """Exactly-once claims on (fire minute, reminder) shared by all workers.
+
+    A claim is a file created with O_EXCL, so only one process can win it
+    however ownership shifts while workers join and leave. The file holds
+    the id of the worker that won it, so the reminder can be handed over
+    with that worker's outbox when it dies.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, minute_key, key):
+        name = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, minute_key, name)
+
+    def claim(self, minute_key, key, owner=''):
+        path = self._path(minute_key, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        try:
+            os.write(fd, owner.encode())
+        finally:
+            os.close(fd)
+        return True
+
+    def owner(self, minute_key, key):
+        """Id of the worker holding a claim, '' if unknown, or None if it isn't claimed."""
+        try:
+            with open(self._path(minute_key, key), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def take(self, minute_key, key, owner, previous=None):
+        """Claim a reminder for `owner`, also if `owner` or `previous` holds it already.
+
+        Returns False if another worker holds it. A claim written without an
+        owner by a crashed worker counts as free.
+        """
+        if self.claim(minute_key, key, owner):
+            return True
+        holder = self.owner(minute_key, key)
+        if holder == owner:
+            return True
+        if holder not in ('', previous):
+            return False
+        path = self._path(minute_key, key)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(owner)
+        os.replace(path + '.tmp', path)
+        return True
+
+    def prune(self, now_utc):
+        cutoff = (now_utc - timedelta(minutes=CLAIM_RETENTION)).strftime('%Y%m%d%H%M')
+        for entry in os.scandir(self.directory):
+            if entry.name < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class ShardWorker:
+    """Scheduler and dispatch for the chats hashed to this worker.
+
+    The worker follows the task store written by the front process, keeps
+    the scheduler index in sync with it, and every SHARD_TICK_INTERVAL
+    seconds looks at the last CLAIM_WINDOW minutes. Each reminder it owns
+    is put in the outbox, flushed, and then claimed before being queued on
+    the dispatcher, so a reminder is sent once even when ownership changes,
+    and a claimed reminder is never only in memory. A dead worker's
+    reminders are picked up by the new owner within the window instead of
+    being skipped, and the ones it claimed but didn't deliver are taken
+    over with its outbox file.
+    """
+
+    def __init__(self, worker_id, directory='data'):
+        self.worker_id = worker_id
+        self.membership = Membership(os.path.join(directory, 'workers'), worker_id)
+        self.claims = ClaimStore(os.path.join(directory, 'claims'))
+        self.workers = [worker_id]
+        # Minute key -> reminder keys already handled, to avoid repeated claim attempts
+        self._seen = {}
+
+    def _rebalance(self):
+        self.membership.heartbeat()
+        workers = self.membership.live_workers()
+        if self.worker_id not in workers:
+            workers = sorted(workers + [self.worker_id])
+        if workers != self.workers:
+            logger.info(f"Shard membership changed: {', '.join(workers)}")
+            self.workers = workers
+            # Split the global send limit between the live workers
+            dispatcher.set_global_rate(GLOBAL_SEND_RATE / len(workers))
+
+    def _sync_store(self):
+        """Apply the records the front process appended since the last tick."""
+        records = journal.poll()
+        if records is None:
+            logger.info("Task store was compacted, reloading")
+            tasks.load(load_tasks())
+            index.rebuild(tasks)
+            return
+
+        for record in records:
+            chat_id = record['chat']
+            if record['op'] == 'add':
+                task = journal.decode(record['task'])
+                tasks.add(chat_id, task)
+                index.add(task.chat_id, task)
+                # A chat adding reminders can receive them again
+                outbox.revive(chat_id)
+            elif record['op'] == 'add_batch':
+                for task_data in record['tasks']:
+                    task = journal.decode(task_data)
+                    tasks.add(chat_id, task)
+                    index.add(task.chat_id, task)
+                outbox.revive(chat_id)
+            elif record['op'] == 'del':
+                task = tasks.remove(record['id'])
+                if task is not None:
+                    index.remove(task.chat_id, task)
+            elif record['op'] == 'set':
+                journal.chats[chat_id] = {**journal.chats.get(chat_id, {}), **record['settings']}
+                index.reindex_chat(chat_id, tasks.chat_tasks(chat_id))
+
+    def _tick(self, now_utc):
+        """Put the due reminders this worker owns in the outbox.
+
+        Returns the new outbox entries, to claim once the outbox is flushed.
+        """
+        current = now_utc.replace(second=0, microsecond=0)
+        index.refresh(current)
+        entries = []
+
+        for minutes_ago in range(CLAIM_WINDOW, -1, -1):
+            minute = current - timedelta(minutes=minutes_ago)
+            minute_key = minute.strftime('%Y%m%d%H%M')
+            seen = self._seen.setdefault(minute_key, set())
+
+            for chat_id, task in index.due(minute, refresh=False):
+                if owner_of(chat_id, self.workers) != self.worker_id:
+                    continue
+                # Task ids are the same in every process following the store
+                key = str(task.id)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if outbox.is_dead(chat_id):
+                    reminders_skipped.inc('dead_chat')
+                    continue
+                entry = outbox.put(
+                    outbox_key(task, minute), chat_id, task.message, task.thread_id, minute.timestamp()
+                )
+                if entry is not None:
+                    entries.append(entry)
+
+        oldest = (current - timedelta(minutes=CLAIM_WINDOW)).strftime('%Y%m%d%H%M')
+        for minute_key in [key for key in self._seen if key < oldest]:
+            del self._seen[minute_key]
+        return entries
+
+    def _claim(self, entries):
+        """Claim flushed outbox entries, dropping the ones another worker won."""
+        fired = []
+        for entry in entries:
+            if self.claims.claim(*claim_of(entry.key), self.worker_id):
+                fired.append(entry)
+            else:
+                outbox.discard(entry.key)
+        return fired
+
+    async def reclaim(self):
+        """Check the claims of the entries this worker's outbox was loaded with.
+
+        A worker that crashed between flushing an entry and claiming it may
+        have lost the claim to another worker, which sends it instead.
+        """
+        for entry in outbox.pending_entries():
+            if not self.claims.take(*claim_of(entry.key), self.worker_id):
+                outbox.discard(entry.key)
+        await outbox.flush()
+
+    async def _take_over_outboxes(self):
+        """Move the undelivered reminders of dead workers' outbox files into this one.
+
+        A file is first renamed to <worker>.journal.taken-by-<this worker>, so
+        only one live worker takes it. Its entries are flushed here and their
+        claims moved to this worker before the file is removed, so a crash
+        part way leaves the renamed file to be finished later. Returns the
+        entries to submit.
+        """
+        if outbox.path is None:
+            return []
+        directory = os.path.dirname(outbox.path) or '.'
+        own = os.path.basename(outbox.path)
+        fired = []
+        for dir_entry in sorted(os.scandir(directory), key=lambda e: e.name):
+            name = dir_entry.name
+            origin, journal_suffix, rest = name.partition('.journal')
+            if not journal_suffix or name == own or rest.endswith('.tmp'):
+                continue
+            holder = rest[len('.taken-by-'):] if rest.startswith('.taken-by-') else origin
+            if holder != self.worker_id and holder in self.workers:
+                continue
+            taken = os.path.join(directory, f"{origin}.journal.taken-by-{self.worker_id}")
+            if dir_entry.path != taken:
+                if os.path.exists(taken):
+                    # Finish the earlier takeover of the same worker's file first
+                    continue
+                try:
+                    os.rename(dir_entry.path, taken)
+                except FileNotFoundError:
+                    # Another worker took it first
+                    continue
+
+            entries = []
+            for entry in read_entries(taken):
+                entry = outbox.put(entry.key, entry.chat_id, entry.text, entry.thread_id, entry.due_at)
+                if entry is not None:
+                    entries.append(entry)
+            await outbox.flush()
+            for entry in entries:
+                if self.claims.take(*claim_of(entry.key), self.worker_id, previous=origin):
+                    fired.append(entry)
+                else:
+                    outbox.discard(entry.key)
+            os.remove(taken)
+            logger.info(f"Took over {len(entries)} undelivered reminders from worker {origin}")
+        return fired
+
+    async def run(self, stop_event):
+        """Run until stop_event is set."""
+        last_heartbeat = 0
+        last_prune = 0
+        while not stop_event.is_set():
+            now = time.monotonic()
+            if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                self._rebalance()
+                last_heartbeat = now
+                try:
+                    dispatcher.submit_entries(await self._take_over_outboxes())
+                except Exception as e:
+                    logger.error("Error taking over outbox files: %s", e)
+            if now - last_prune >= 60:
+                self.claims.prune(datetime.now(timezone.utc))
+                dispatcher.log_summary()
+                last_prune = now
+
+            try:
+                started = time.monotonic()
+                self._sync_store()
+                entries = self._tick(datetime.now(timezone.utc))
+                # The entries are durable before they are claimed
+                await outbox.flush()
+                fired = self._claim(entries)
+                dispatcher.submit_entries(fired)
+                tick_duration.observe(time.monotonic() - started)
+                if fired:
+                    logger.debug("Claimed %d reminders", len(fired))
+            except Exception as e:
+                logger.error("Error in shard worker tick: %s", e)
+
+            try:
+                await asyncio.wait_for(stop_event.wait(), SHARD_TICK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+        self.membership.leave()
+
+
+def claim_of(key):
+    """Minute key and claim key of an outbox key."""
+    task_id, _, minute_key = key.rpartition(':')
+    return minute_key, task_id
+
+
+def default_worker_id():
+    return os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def run_worker(token, base_url=None):
+    """Run a shard worker process until SIGINT/SIGTERM."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    bot_kwargs = {'base_url': base_url} if base_url else {}
+    worker = ShardWorker(default_worker_id())
+    logger.info(f"Starting shard worker {worker.worker_id}")
+
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        await metrics_server.start(os.getenv('METRICS_HOST', '127.0.0.1'), int(metrics_port))
+
+    # Announce the worker before its outbox file exists, so no live worker takes it over.
+    # With a stable WORKER_ID a restarted worker resumes its own file; otherwise
+    # another worker takes it over once the old heartbeat has expired.
+    worker.membership.heartbeat()
+    outbox.load(os.path.join('data', 'outbox', f"{worker.worker_id}.journal"))
+    await worker.reclaim()
+
+    async with Bot(token, **bot_kwargs) as bot:
+        dispatcher.start(bot, outbox)
+        await worker.run(stop_event)
+        await dispatcher.stop()
+
+    await outbox.close()
+    await metrics_server.stop()
@@ -0,0 +1,418 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+import metrics
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Journal records written before the store is compacted into a new snapshot
+COMPACT_EVERY = 1000
+
+# Upper bound, in seconds, between a mutation and its journal write
+FLUSH_INTERVAL = 1.0
+
+
+def fsync_dir(path):
+    """Make a rename inside the directory durable."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def apply_record(tasks, chats, record, decode=None):
+    """Apply one journal record to the task and chat settings mappings.
+
+    `tasks` maps chat_id -> {task_id: task}.
+    """
+    op = record['op']
+    chat_id = record['chat']
+    if op == 'add':
+        task = record['task']
+        tasks.setdefault(chat_id, {})[task['id']] = decode(task) if decode else task
+    elif op == 'add_batch':
+        chat_tasks = tasks.setdefault(chat_id, {})
+        for task in record['tasks']:
+            chat_tasks[task['id']] = decode(task) if decode else task
+    elif op == 'del':
+        chat_tasks = tasks.get(chat_id, {})
+        if 'id' in record:
+            chat_tasks.pop(record['id'], None)
+        elif 0 <= record['index'] < len(chat_tasks):
+            # Records from before task ids address the task by position
+            del chat_tasks[list(chat_tasks)[record['index']]]
+    elif op == 'set':
+        # Settings dicts are replaced, never mutated, so snapshots can share them
+        chats[chat_id] = {**chats.get(chat_id, {}), **record['settings']}
+    else:
+        raise ValueError(f"Unknown journal operation: {op}")
+
+
+class TaskJournal:
+    """Append-only journal plus snapshot storage for the task store.
+
+    Every mutation is queued as one record tagged with a sequence number
+    and appended to `tasks.journal` as a JSON line on the next write. Every
+    COMPACT_EVERY records the whole store is written to `tasks.snapshot.json`
+    through a temporary file and an atomic rename, and the journal is
+    truncated. The snapshot remembers the last sequence number it contains,
+    so records that survive a crash between the rename and the truncation
+    are skipped on replay rather than applied twice.
+
+    Tasks are JSON objects with a unique integer 'id', kept in memory as
+    chat_id -> {task_id: task}. Ids come from `allocate_id` and are never
+    reused, so a stale reference can't hit a newer task. Tasks from stores
+    written before ids existed are numbered on load in file order, which
+    gives every process reading the same files the same ids.
+
+    Per-chat settings (such as the time zone) are kept in `chats` and
+    journaled the same way.
+
+    `encode` and `decode` convert between in-memory tasks and their JSON
+    form; by default tasks are stored as they are.
+
+    A `read_only` journal never writes, migrates or repairs files. Other
+    processes use it to follow the store through `poll`.
+    """
+
+    def __init__(self, directory='data', encode=None, decode=None, read_only=False):
+        self.directory = directory
+        self.encode = encode
+        self.decode = decode
+        self.read_only = read_only
+        self.snapshot_path = os.path.join(directory, 'tasks.snapshot.json')
+        self.journal_path = os.path.join(directory, 'tasks.journal')
+        self.legacy_path = os.path.join(directory, 'tasks.json')
+        self.chats = {}
+        self.seq = 0
+        self.next_id = 1
+        self.records_since_snapshot = 0
+        self._pending = []
+        self._journal = None
+        self._offset = 0
+        self._snapshot_id = None
+
+    @property
+    def needs_compaction(self):
+        return self.records_since_snapshot >= COMPACT_EVERY
+
+    def load(self):
+        """Rebuild the store from the snapshot and the journal tail."""
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.seq = 0
+        self.next_id = 1
+        self.chats = {}
+        self._snapshot_id = self._snapshot_stat()
+        if self._snapshot_id is not None:
+            stored = self._read_snapshot()
+        elif os.path.exists(self.legacy_path):
+            stored = self._read_legacy() if self.read_only else self._migrate_legacy()
+        else:
+            stored = {}
+
+        self._number_tasks(stored)
+        decode = self.decode or (lambda task: task)
+        tasks = {
+            chat_id: {task['id']: decode(task) for task in chat_tasks}
+            for chat_id, chat_tasks in stored.items()
+        }
+
+        self._replay(tasks)
+        if not self.read_only:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        return tasks
+
+    def _number_tasks(self, stored):
+        """Give stored tasks without an id one, and move next_id past every id."""
+        for chat_tasks in stored.values():
+            for task in chat_tasks:
+                if task.get('id') is None:
+                    task['id'] = self.next_id
+                self.next_id = max(self.next_id, task['id'] + 1)
+
+    def allocate_id(self):
+        """Return a new task id."""
+        task_id = self.next_id
+        self.next_id += 1
+        return task_id
+
+    def _snapshot_stat(self):
+        """Identify the current snapshot file, which compaction replaces."""
+        try:
+            stat = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read_snapshot(self):
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            try:
+                snapshot = json.load(f)
+            except json.JSONDecodeError as e:
+                # Snapshots are only ever replaced atomically, so this is not a torn write
+                raise RuntimeError(f"Corrupted snapshot {self.snapshot_path}: {e}") from e
+        self.seq = snapshot['seq']
+        self.next_id = snapshot.get('next_id', 1)
+        self.chats = snapshot.get('chats', {})
+        return snapshot['tasks']
+
+    def _read_legacy(self):
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError as e:
+                raise RuntimeError(
+                    f"Cannot migrate {self.legacy_path}, it is not valid JSON: {e}"
+                ) from e
+
+    def _migrate_legacy(self):
+        """Import an old tasks.json into a first snapshot."""
+        tasks = self._read_legacy()
+        self._number_tasks(tasks)
+        self._write_snapshot(tasks)
+        os.replace(self.legacy_path, self.legacy_path + '.migrated')
+        logger.info(f"Migrated {self.legacy_path} to {self.snapshot_path}")
+        return tasks
+
+    def _read_records(self, offset=0):
+        """Return (records newer than self.seq, end offset of the last complete line)."""
+        records = []
+        valid_bytes = offset
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete record")
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash mid-append leaves a torn last line; a follower may
+                    # also just be reading while the writer appends
+                    if not self.read_only:
+                        logger.warning(f"Discarding incomplete record at end of {self.journal_path}")
+                    break
+                valid_bytes += len(line)
+                if record['seq'] > self.seq:
+                    records.append(record)
+        return records, valid_bytes
+
+    def _replay(self, tasks):
+        if not os.path.exists(self.journal_path):
+            return
+
+        records, valid_bytes = self._read_records()
+        for record in records:
+            self._track(record)
+            apply_record(tasks, self.chats, record, self.decode)
+        replayed = len(records)
+        self._offset = valid_bytes
+
+        if not self.read_only and valid_bytes < os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+
+        self.records_since_snapshot = replayed
+        logger.info(f"Replayed {replayed} journal records")
+
+    def poll(self):
+        """Return records appended by the writer since the last load or poll.
+
+        Returns None when the snapshot was replaced or the journal truncated
+        by a compaction, in which case the caller should `load` again.
+        """
+        if self._snapshot_stat() != self._snapshot_id:
+            return None
+        try:
+            size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            size = 0
+        if size < self._offset:
+            return None
+        if size == self._offset:
+            return []
+
+        records, self._offset = self._read_records(self._offset)
+        for record in records:
+            self._track(record)
+        return records
+
+    def _track(self, record):
+        """Advance seq and next_id past a record read from the journal.
+
+        Tasks added by records written before ids existed are numbered
+        here, in file order, like the tasks of such a snapshot.
+        """
+        self.seq = record['seq']
+        if record['op'] == 'add':
+            added = [record['task']]
+        elif record['op'] == 'add_batch':
+            added = record['tasks']
+        else:
+            return
+        for task in added:
+            if task.get('id') is None:
+                task['id'] = self.next_id
+            self.next_id = max(self.next_id, task['id'] + 1)
+
+    def append(self, record):
+        """Queue one mutation record; it reaches disk on the next write."""
+        if self.read_only:
+            raise RuntimeError("Cannot modify a read-only task journal")
+        self.seq += 1
+        record['seq'] = self.seq
+        self._pending.append(record)
+        self.records_since_snapshot += 1
+
+    def take_pending(self):
+        """Hand over the records queued since the last call."""
+        records, self._pending = self._pending, []
+        return records
+
+    def restore(self, records):
+        """Put records back at the front of the queue after a failed write."""
+        self._pending[:0] = records
+
+    def write(self, records):
+        """Durably append records to the journal file."""
+        if not records:
+            return
+        self._journal.write(''.join(
+            json.dumps(record, separators=(',', ':'), default=self.encode) + '\n'
+            for record in records
+        ))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def flush(self):
+        """Write every queued record now."""
+        self.write(self.take_pending())
+
+    def _write_snapshot(self, tasks, seq=None, chats=None, next_id=None):
+        """Write chat_id -> [task] to a new snapshot."""
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            snapshot = {
+                'seq': self.seq if seq is None else seq,
+                'next_id': self.next_id if next_id is None else next_id,
+                'tasks': tasks,
+                'chats': self.chats if chats is None else chats,
+            }
+            json.dump(snapshot, f, separators=(',', ':'), default=self.encode)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        fsync_dir(self.directory)
+
+    def compact(self, tasks, seq=None, chats=None, next_id=None):
+        """Write the whole store (chat_id -> [task]) to a new snapshot and truncate the journal.
+
+        Records still queued in memory are newer than the snapshot and are
+        written after the truncation, so nothing is lost.
+        """
+        self._write_snapshot(tasks, seq, chats, next_id)
+        if self._journal is not None:
+            self._journal.truncate(0)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def close(self):
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+class BackgroundWriter:
+    """Flush journal records from a worker thread instead of the event loop.
+
+    Mutations only mark the store dirty. The writer waits at most
+    FLUSH_INTERVAL after the first dirty mark, then writes everything queued
+    since then in one append and fsync. Snapshots are serialized in the same
+    thread from a shallow copy of the store taken on the loop.
+
+    Only one flush writes at a time. A write can't be interrupted once it
+    is in the thread, so stopping waits for it instead of cancelling it.
+    """
+
+    def __init__(self, journal, copy_tasks, interval=FLUSH_INTERVAL):
+        self.journal = journal
+        self.copy_tasks = copy_tasks
+        self.interval = interval
+        self._dirty = None
+        self._task = None
+        self._lock = None
+        self._stopping = False
+
+    def start(self):
+        """Start the writer on the running event loop."""
+        self._dirty = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    def mark_dirty(self):
+        if self._dirty is not None:
+            self._dirty.set()
+
+    async def _run(self):
+        while not self._stopping:
+            await self._dirty.wait()
+            await asyncio.sleep(self.interval)
+            self._dirty.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error writing task journal: {e}")
+                self._dirty.set()
+
+    async def flush(self):
+        """Write queued records, compacting into a snapshot when due."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._flush()
+
+    async def _flush(self):
+        records = self.journal.take_pending()
+        snapshot = None
+        if self.journal.needs_compaction:
+            snapshot = (self.copy_tasks(), dict(self.journal.chats), self.journal.next_id)
+            self.journal.records_since_snapshot = 0
+        seq = self.journal.seq
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(self._write, records, snapshot, seq)
+            metrics.save_duration.observe(time.monotonic() - started)
+        except Exception:
+            self.journal.restore(records)
+            if snapshot is not None:
+                self.journal.records_since_snapshot = COMPACT_EVERY
+            raise
+
+    def _write(self, records, snapshot, seq):
+        self.journal.write(records)
+        if snapshot is not None:
+            tasks, chats, next_id = snapshot
+            self.journal.compact(tasks, seq, chats, next_id)
+
+    async def stop(self):
+        """Stop the writer and durably flush whatever is still queued."""
+        if self._task is not None:
+            self._stopping = True
+            if self._lock.locked():
+                # Let the writer finish the write in progress, then exit
+                self._dirty.set()
+            else:
+                # Idle, waiting for a mutation or the flush interval
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
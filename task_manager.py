@@ -1,6 +1,12 @@
 import os
-import json
 import logging
+from collections import defaultdict
+
+from storage import TaskJournal, BackgroundWriter
+from models import Task, intern_chat_id
+from constants import ROLE_ALL, ROLE_WORKER
+from metrics import registry, ChatSizeGauge
+from pagination import render_cache
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -8,21 +14,188 @@ logger = logging.getLogger(__name__)
 # Ensure data directory exists
 os.makedirs('data', exist_ok=True)
 
+# Shard workers only follow the store; the front process owns all writes
+journal = TaskJournal(
+    'data', encode=Task.to_dict, decode=Task.from_dict,
+    read_only=os.getenv('BOT_ROLE', ROLE_ALL) == ROLE_WORKER
+)
+
+class TaskStore:
+    """In-memory tasks with O(1) lookup and removal by task id.
+
+    Secondary indexes group the same tasks by chat, by creating user and by
+    (chat, forum thread). Each index maps to an insertion-ordered
+    {task_id: task} dict, so listing keeps creation order and removing a
+    task never shifts the others.
+
+    Every method is synchronous and only called on the event loop, so
+    updates handled concurrently can't interleave inside a mutation.
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_chat = {}
+        self._by_user = defaultdict(dict)
+        self._by_thread = defaultdict(dict)
+
+    def load(self, chat_tasks):
+        """Replace the contents with a chat_id -> {task_id: task} mapping."""
+        self._by_id.clear()
+        self._by_chat.clear()
+        self._by_user.clear()
+        self._by_thread.clear()
+        for chat_id, chat_task_map in chat_tasks.items():
+            for task in chat_task_map.values():
+                self.add(chat_id, task)
+
+    def add(self, chat_id, task):
+        chat_id = intern_chat_id(chat_id)
+        task.chat_id = chat_id
+        self._by_id[task.id] = task
+        self._by_chat.setdefault(chat_id, {})[task.id] = task
+        if task.user_id is not None:
+            self._by_user[task.user_id][task.id] = task
+        if task.thread_id is not None:
+            self._by_thread[chat_id, task.thread_id][task.id] = task
+
+    def remove(self, task_id):
+        """Remove a task by id and return it, or None if there is no such task."""
+        task = self._by_id.pop(task_id, None)
+        if task is None:
+            return None
+        self._discard(self._by_chat, task.chat_id, task_id)
+        if task.user_id is not None:
+            self._discard(self._by_user, task.user_id, task_id)
+        if task.thread_id is not None:
+            self._discard(self._by_thread, (task.chat_id, task.thread_id), task_id)
+        return task
+
+    @staticmethod
+    def _discard(index, key, task_id):
+        group = index.get(key)
+        if group is not None:
+            group.pop(task_id, None)
+            if not group:
+                del index[key]
+
+    def get(self, task_id):
+        return self._by_id.get(task_id)
+
+    def chat_tasks(self, chat_id):
+        """A chat's tasks in creation order."""
+        return list(self._by_chat.get(str(chat_id), {}).values())
+
+    def chat_task_count(self, chat_id):
+        return len(self._by_chat.get(str(chat_id), ()))
+
+    def thread_tasks(self, chat_id, thread_id):
+        """Tasks of one forum topic in creation order."""
+        return list(self._by_thread.get((str(chat_id), thread_id), {}).values())
+
+    def user_tasks(self, user_id):
+        """Tasks created by a user, in any chat."""
+        return list(self._by_user.get(user_id, {}).values())
+
+    def items(self):
+        """(chat_id, tasks) pairs for every chat."""
+        return ((chat_id, chat_tasks.values()) for chat_id, chat_tasks in self._by_chat.items())
+
+    def values(self):
+        return (chat_tasks.values() for chat_tasks in self._by_chat.values())
+
+    def __len__(self):
+        """Number of chats with tasks."""
+        return len(self._by_chat)
+
+    def task_count(self):
+        return len(self._by_id)
+
 def load_tasks():
-    """Load tasks from JSON file."""
-    if os.path.exists('data/tasks.json'):
-        with open('data/tasks.json', 'r') as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                logger.error("Error decoding tasks.json, returning empty dict")
-                return {}
-    return {}
-
-def save_tasks(tasks):
-    """Save tasks to JSON file."""
-    with open('data/tasks.json', 'w') as f:
-        json.dump(tasks, f, indent=2)
+    """Load tasks from the snapshot and replay the journal on top of it.
+
+    Returns chat_id -> {task_id: task}, for `TaskStore.load`.
+    """
+    return {
+        intern_chat_id(chat_id): chat_tasks
+        for chat_id, chat_tasks in journal.load().items()
+    }
+
+def save_tasks(store):
+    """Compact the whole store into a new snapshot (blocking)."""
+    journal.compact({chat_id: list(chat_tasks) for chat_id, chat_tasks in store.items()})
+
+def _copy_tasks():
+    """Shallow copy of the store for the background writer to serialize."""
+    return {chat_id: list(chat_tasks) for chat_id, chat_tasks in tasks.items()}
+
+writer = BackgroundWriter(journal, _copy_tasks)
+
+def add_task_record(chat_id, task):
+    """Give a task a new id, add it to a chat and journal the change."""
+    task.id = journal.allocate_id()
+    tasks.add(chat_id, task)
+    journal.append({'op': 'add', 'chat': task.chat_id, 'task': task})
+    writer.mark_dirty()
+    render_cache.invalidate(task.chat_id)
+
+def add_task_records(chat_id, new_tasks):
+    """Add many tasks to a chat as one journal record, e.g. for an import."""
+    for task in new_tasks:
+        task.id = journal.allocate_id()
+        tasks.add(chat_id, task)
+    chat_id = intern_chat_id(chat_id)
+    journal.append({'op': 'add_batch', 'chat': chat_id, 'tasks': new_tasks})
+    writer.mark_dirty()
+    render_cache.invalidate(chat_id)
+
+def remove_task_record(task_id):
+    """Remove a task by id, journal the change and return the task (None if it is gone)."""
+    task = tasks.remove(task_id)
+    if task is None:
+        return None
+    journal.append({'op': 'del', 'chat': task.chat_id, 'id': task_id})
+    writer.mark_dirty()
+    render_cache.invalidate(task.chat_id)
+    return task
+
+def move_chat_records(old_chat_id, new_chat_id):
+    """Move a chat's tasks and settings to a new chat id, journaling the change.
+
+    Used when a group is upgraded to a supergroup. Tasks keep their ids.
+    Returns the moved tasks.
+    """
+    old_chat_id = intern_chat_id(old_chat_id)
+    new_chat_id = intern_chat_id(new_chat_id)
+    moved = tasks.chat_tasks(old_chat_id)
+    for task in moved:
+        tasks.remove(task.id)
+        journal.append({'op': 'del', 'chat': old_chat_id, 'id': task.id})
+    if moved:
+        for task in moved:
+            tasks.add(new_chat_id, task)
+        journal.append({'op': 'add_batch', 'chat': new_chat_id, 'tasks': moved})
+    settings = journal.chats.get(old_chat_id)
+    if settings:
+        journal.chats[new_chat_id] = {**settings, **journal.chats.get(new_chat_id, {})}
+        journal.append({'op': 'set', 'chat': new_chat_id, 'settings': journal.chats[new_chat_id]})
+    writer.mark_dirty()
+    render_cache.invalidate(old_chat_id)
+    render_cache.invalidate(new_chat_id)
+    return moved
+
+def get_chat_timezone(chat_id):
+    """Return the chat's time zone name, or None to use the default zone."""
+    return journal.chats.get(str(chat_id), {}).get('timezone')
+
+def set_chat_timezone(chat_id, timezone_name):
+    """Set the chat's time zone and journal the change."""
+    chat_id = intern_chat_id(chat_id)
+    settings = {'timezone': timezone_name}
+    journal.chats[chat_id] = {**journal.chats.get(chat_id, {}), **settings}
+    journal.append({'op': 'set', 'chat': chat_id, 'settings': settings})
+    writer.mark_dirty()
 
 # Initialize tasks
-tasks = load_tasks()
\ No newline at end of file
+tasks = TaskStore()
+tasks.load(load_tasks())
+registry.register(ChatSizeGauge(lambda: tasks))
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Modules are imported from the repository root, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# task_manager loads the store from ./data on import; keep it away from a real one
+os.chdir(tempfile.mkdtemp(prefix='remindme-tests-'))
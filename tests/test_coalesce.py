@@ -0,0 +1,55 @@
+from dispatcher import COALESCED_HEADER, coalesce_entries, message_length
+from outbox import OutboxEntry
+
+
+def entry(key, text, chat_id='42', thread_id=None, due_at=100.0):
+    return OutboxEntry(key, chat_id, text, thread_id, due_at)
+
+
+def test_a_lone_reminder_keeps_its_text():
+    assert list(coalesce_entries([entry('1', 'Stretch')])) == [('42', None, 'Stretch', 100.0, ('1',))]
+
+
+def test_reminders_are_grouped_per_chat_and_thread():
+    messages = list(coalesce_entries([
+        entry('1', 'Stretch', due_at=120.0),
+        entry('2', 'Drink water', due_at=60.0),
+        entry('3', 'Standup', thread_id=5),
+        entry('4', 'Call mom', chat_id='43'),
+    ]))
+    assert messages == [
+        ('42', None, COALESCED_HEADER + '• Stretch\n• Drink water\n', 60.0, ('1', '2')),
+        ('42', 5, 'Standup', 100.0, ('3',)),
+        ('43', None, 'Call mom', 100.0, ('4',)),
+    ]
+
+
+def test_groups_are_split_to_fit_the_limit():
+    entries = [entry(str(i), 'x' * 20) for i in range(10)]
+    limit = message_length(COALESCED_HEADER) + 3 * len('• ' + 'x' * 20 + '\n')
+    messages = list(coalesce_entries(entries, limit))
+
+    assert [keys for *_, keys in messages] == [
+        ('0', '1', '2'), ('3', '4', '5'), ('6', '7', '8'), ('9',)
+    ]
+    assert all(message_length(text) <= limit for _, _, text, _, _ in messages)
+    # The last message of a split group still carries the header
+    assert messages[-1][2] == COALESCED_HEADER + '• ' + 'x' * 20 + '\n'
+
+
+def test_limit_is_counted_in_utf16_units():
+    # Each emoji is two UTF-16 units, so only one line fits
+    line = '• ' + '😀' * 10 + '\n'
+    limit = message_length(COALESCED_HEADER) + message_length(line) + 5
+    messages = list(coalesce_entries([entry('1', '😀' * 10), entry('2', '😀' * 10)], limit))
+    assert [keys for *_, keys in messages] == [('1',), ('2',)]
+
+
+def test_an_oversized_reminder_is_sent_alone():
+    limit = message_length(COALESCED_HEADER) + 50
+    big = 'y' * 60
+    messages = list(coalesce_entries([entry('1', 'Stretch'), entry('2', big), entry('3', 'Standup')], limit))
+    assert messages == [
+        ('42', None, big, 100.0, ('2',)),
+        ('42', None, COALESCED_HEADER + '• Stretch\n• Standup\n', 100.0, ('1', '3')),
+    ]
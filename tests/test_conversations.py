@@ -0,0 +1,111 @@
+import asyncio
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+from telegram.ext import ConversationHandler
+
+import conversations
+from conversations import DraftTracker, clear_draft, get_draft, sweep, track_draft
+
+
+class FakeApplication:
+    def __init__(self):
+        self.user_data = defaultdict(dict)
+
+    def drop_user_data(self, user_id):
+        self.user_data.pop(user_id, None)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(conversations.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    tracker = DraftTracker(ttl=60, cap=2)
+    monkeypatch.setattr(conversations, 'drafts', tracker)
+    return tracker
+
+
+def update_in(chat_id, user_id):
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id),
+        effective_user=SimpleNamespace(id=user_id),
+        effective_message=SimpleNamespace(reply_text=reply_text),
+        replies=replies,
+    )
+
+
+def context_for(application, user_id):
+    return SimpleNamespace(application=application, user_data=application.user_data[user_id])
+
+
+def test_expired_returns_idle_keys_oldest_first(clock, tracker):
+    tracker.touch((1, 1))
+    clock.now += 30
+    tracker.touch((2, 2))
+    clock.now += 40
+    assert tracker.expired() == [(1, 1)]
+    tracker.touch((1, 1))
+    clock.now += 30
+    assert tracker.expired() == [(2, 2)]
+
+
+def test_sweep_clears_only_the_expired_conversation_draft(clock, tracker):
+    application = FakeApplication()
+    get_draft(update_in(-5, 1), context_for(application, 1))['message'] = 'group'
+    tracker.touch((-5, 1))
+    clock.now += 50
+    get_draft(update_in(1, 1), context_for(application, 1))['message'] = 'dm'
+    tracker.touch((1, 1))
+    clock.now += 20
+
+    assert sweep(application) == 1
+    assert application.user_data[1] == {1: {'message': 'dm'}}
+    assert (1, 1) in tracker and (-5, 1) not in tracker
+
+
+def test_clearing_the_last_draft_drops_the_user_data():
+    application = FakeApplication()
+    get_draft(update_in(1, 1), context_for(application, 1))['message'] = 'dm'
+    clear_draft(application, (1, 1))
+    assert 1 not in application.user_data
+
+
+def test_new_conversations_are_refused_past_the_cap(clock, tracker):
+    application = FakeApplication()
+
+    @track_draft
+    async def step(update, context):
+        return 'NEXT'
+
+    def run(chat_id, user_id):
+        update = update_in(chat_id, user_id)
+        return asyncio.run(step(update, context_for(application, user_id))), update.replies
+
+    assert run(1, 1)[0] == 'NEXT'
+    assert run(2, 2)[0] == 'NEXT'
+    state, replies = run(3, 3)
+    assert state == ConversationHandler.END
+    assert len(replies) == 1
+    # Conversations in progress go on, and room is made once one is abandoned
+    assert run(1, 1)[0] == 'NEXT'
+    clock.now += 61
+    assert run(3, 3)[0] == 'NEXT'
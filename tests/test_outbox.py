@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+import sharding
+from outbox import Outbox, read_entries
+from sharding import ClaimStore, ShardWorker, claim_of
+
+
+def loaded(path):
+    outbox = Outbox()
+    outbox.load(str(path))
+    return outbox
+
+
+def test_pending_entries_are_replayed_after_reload(tmp_path):
+    path = tmp_path / 'w.journal'
+    outbox = loaded(path)
+    outbox.put('1:202601010800', '42', 'Stretch', 7, 1767254400.0)
+    outbox.put('2:202601010800', '42', 'Drink water')
+    outbox.complete('2:202601010800')
+    asyncio.run(outbox.close())
+
+    reloaded = loaded(path)
+    [entry] = reloaded.pending_entries()
+    assert (entry.key, entry.chat_id, entry.text, entry.thread_id, entry.due_at) == (
+        '1:202601010800', '42', 'Stretch', 7, 1767254400.0
+    )
+
+
+def test_finished_and_pending_keys_are_refused(tmp_path):
+    path = tmp_path / 'w.journal'
+    outbox = loaded(path)
+    assert outbox.put('1:202601010800', '42', 'Stretch') is not None
+    assert outbox.put('1:202601010800', '42', 'Stretch') is None
+    outbox.complete('1:202601010800')
+    asyncio.run(outbox.close())
+
+    assert loaded(path).put('1:202601010800', '42', 'Stretch') is None
+
+
+def test_discarded_entries_are_not_replayed_and_can_be_put_again(tmp_path):
+    path = tmp_path / 'w.journal'
+    outbox = loaded(path)
+    outbox.put('1:202601010800', '42', 'Stretch')
+    outbox.discard('1:202601010800')
+    asyncio.run(outbox.close())
+
+    reloaded = loaded(path)
+    assert reloaded.pending_entries() == []
+    assert reloaded.put('1:202601010800', '42', 'Stretch') is not None
+
+
+def test_torn_last_line_is_discarded(tmp_path):
+    path = tmp_path / 'w.journal'
+    outbox = loaded(path)
+    outbox.put('1:202601010800', '42', 'Stretch')
+    asyncio.run(outbox.close())
+    with open(path, 'a') as f:
+        f.write('{"op":"put","key":"2:2026')
+
+    assert [entry.key for entry in loaded(path).pending_entries()] == ['1:202601010800']
+
+
+def test_dead_chats_and_cursor_survive_a_restart(tmp_path):
+    path = tmp_path / 'w.journal'
+    outbox = loaded(path)
+    outbox.mark_dead('42')
+    outbox.mark_dead('43')
+    outbox.revive('43')
+    outbox.set_cursor(1767254400.0)
+    asyncio.run(outbox.close())
+
+    reloaded = loaded(path)
+    assert reloaded.is_dead('42')
+    assert not reloaded.is_dead('43')
+    assert reloaded.cursor == 1767254400.0
+
+
+def test_read_entries_leaves_the_file_alone(tmp_path):
+    path = tmp_path / 'w.journal'
+    outbox = loaded(path)
+    outbox.put('1:202601010800', '42', 'Stretch')
+    asyncio.run(outbox.close())
+    before = path.read_bytes()
+
+    assert [entry.key for entry in read_entries(str(path))] == ['1:202601010800']
+    assert path.read_bytes() == before
+
+
+def test_claims_record_their_owner(tmp_path):
+    claims = ClaimStore(str(tmp_path))
+    assert claim_of('17:202601010800') == ('202601010800', '17')
+    assert claims.claim('202601010800', '17', 'a')
+    assert not claims.claim('202601010800', '17', 'b')
+    assert claims.owner('202601010800', '17') == 'a'
+    assert claims.owner('202601010800', '18') is None
+
+
+def test_take_moves_only_claims_of_the_previous_owner(tmp_path):
+    claims = ClaimStore(str(tmp_path))
+    claims.claim('202601010800', '1', 'dead')
+    claims.claim('202601010800', '2', 'live')
+    claims.claim('202601010800', '3', '')
+
+    assert claims.take('202601010800', '1', 'me', previous='dead')
+    assert claims.owner('202601010800', '1') == 'me'
+    assert not claims.take('202601010800', '2', 'me', previous='dead')
+    assert claims.take('202601010800', '3', 'me')
+    assert claims.take('202601010800', '4', 'me')
+    assert claims.take('202601010800', '4', 'me')
+
+
+@pytest.fixture
+def worker_outbox(tmp_path, monkeypatch):
+    outbox = loaded(tmp_path / 'outbox' / 'me.journal')
+    monkeypatch.setattr(sharding, 'outbox', outbox)
+    return outbox
+
+
+def test_entries_are_flushed_before_they_are_claimed(tmp_path, worker_outbox):
+    worker = ShardWorker('me', str(tmp_path))
+    won = worker_outbox.put('1:202601010800', '42', 'Stretch')
+    lost = worker_outbox.put('2:202601010800', '42', 'Drink water')
+    worker.claims.claim('202601010800', '2', 'other')
+    asyncio.run(worker_outbox.flush())
+
+    assert worker._claim([won, lost]) == [won]
+    assert worker.claims.owner('202601010800', '1') == 'me'
+    assert [entry.key for entry in worker_outbox.pending_entries()] == ['1:202601010800']
+
+
+def test_reclaim_drops_entries_another_worker_claimed(tmp_path, worker_outbox):
+    worker = ShardWorker('me', str(tmp_path))
+    worker_outbox.put('1:202601010800', '42', 'Stretch')
+    worker_outbox.put('2:202601010800', '42', 'Drink water')
+    worker.claims.claim('202601010800', '2', 'other')
+
+    asyncio.run(worker.reclaim())
+    assert [entry.key for entry in worker_outbox.pending_entries()] == ['1:202601010800']
+    assert worker.claims.owner('202601010800', '1') == 'me'
+
+
+def test_dead_workers_outbox_is_taken_over(tmp_path, worker_outbox):
+    worker = ShardWorker('me', str(tmp_path))
+    worker.workers = ['live', 'me']
+    for name in ('dead', 'live'):
+        other = loaded(tmp_path / 'outbox' / f'{name}.journal')
+        other.put(f'{name}-1:202601010800', '42', 'Stretch')
+        other.put(f'{name}-2:202601010800', '42', 'Drink water')
+        asyncio.run(other.close())
+    worker.claims.claim('202601010800', 'dead-1', 'dead')
+    worker.claims.claim('202601010800', 'dead-2', 'live')
+
+    fired = asyncio.run(worker._take_over_outboxes())
+    assert [entry.key for entry in fired] == ['dead-1:202601010800']
+    assert worker.claims.owner('202601010800', 'dead-1') == 'me'
+    assert sorted(p.name for p in (tmp_path / 'outbox').iterdir()) == ['live.journal', 'me.journal']
+    asyncio.run(worker_outbox.flush())
+    assert [entry.key for entry in loaded(tmp_path / 'outbox' / 'me.journal').pending_entries()] == [
+        'dead-1:202601010800'
+    ]
@@ -0,0 +1,30 @@
+from constants import PAGE_SIZE, LIST_PREVIEW_LENGTH
+from dispatcher import message_length
+from handlers import render_list_page
+from models import Task
+from pagination import preview
+
+
+def test_preview_counts_utf16_units():
+    text = '😀' * 200
+    cut = preview(text, 30)
+    assert cut.endswith('...')
+    assert message_length(cut) <= 30
+    assert preview('short', 30) == 'short'
+
+
+def test_preview_never_splits_a_surrogate_pair():
+    cut = preview('a' + '😀' * 50, 10)
+    assert '�' not in cut
+    assert cut == 'a' + '😀' * 3 + '...'
+
+
+def test_full_list_page_of_emoji_fits_in_one_message():
+    tasks = [
+        Task.from_dict({'id': i, 'message': '🎉' * 1000, 'type': 'daily', 'frequency': 'custom',
+                        'days': ['Mo', 'Tu', 'We', 'Th', 'Fr', 'Sa', 'Su'], 'time': '09:00'})
+        for i in range(PAGE_SIZE)
+    ]
+    text, _ = render_list_page(tasks, 0)
+    assert message_length(text) <= 4096
+    assert message_length(text) > PAGE_SIZE * LIST_PREVIEW_LENGTH
@@ -0,0 +1,54 @@
+import pytest
+
+from models import TaskType, Frequency
+from quick_add import parse_quick_add
+
+
+def test_one_time_reminder():
+    task = parse_quick_add('2027-03-15 9:05 Pay rent, then call mum')
+    assert task.type == TaskType.ONE_TIME
+    assert task.date_str == '2027-03-15'
+    assert task.time == '09:05'
+    assert task.message == 'Pay rent, then call mum'
+
+
+def test_days_are_matched_case_insensitively():
+    task = parse_quick_add('mo, WE,Fr 09:00 Standup')
+    assert task.frequency == Frequency.CUSTOM
+    assert task.day_codes == ['Mo', 'We', 'Fr']
+
+
+def test_daily_reminder_keeps_multiline_message():
+    task = parse_quick_add('every day 08:00 Take vitamins\nwith water')
+    assert task.frequency == Frequency.EVERYDAY
+    assert task.message == 'Take vitamins\nwith water'
+
+
+@pytest.mark.parametrize('text, rule', [
+    ('every 15 minutes Stretch', '*/15 * * * *'),
+    ('every 2 hours between 9 and 18 Drink water', '0 9-18/2 * * *'),
+    ('first Monday of the month 10:00 Team sync', '0 10 * * 1#1'),
+    ('last Fr 17:30 Timesheets', '30 17 * * 5L'),
+    ('cron 0 9 * * 1-5 Check the inbox', '0 9 * * 1-5'),
+    ('cron @daily Check the inbox now', '@daily'),
+    ('cron @Weekly Review', '@weekly'),
+])
+def test_rules(text, rule):
+    task = parse_quick_add(text)
+    assert task.type == TaskType.CRON
+    assert task.rule == rule
+
+
+@pytest.mark.parametrize('text', [
+    'tomorrow 09:00 Something',
+    '2027-02-30 09:00 No such day',
+    'Mo,Xx 09:00 Bad day',
+    'daily 25:00 Bad time',
+    'every 7 minutes Uneven',
+    'cron 0 0 31 2 * Never fires',
+    'cron @sometimes Unknown macro',
+    '09:00',
+])
+def test_invalid_input_raises_value_error(text):
+    with pytest.raises(ValueError):
+        parse_quick_add(text)
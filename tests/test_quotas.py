@@ -0,0 +1,136 @@
+import pytest
+
+import dispatcher
+import quotas
+from models import Task
+from quotas import CreationQuota, QuotaExceeded
+from scheduler import ReminderIndex
+from task_manager import TaskStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = TaskStore()
+    index = ReminderIndex(lambda chat_id: 'UTC')
+    monkeypatch.setattr(quotas, 'tasks', store)
+    monkeypatch.setattr(quotas, 'index', index)
+
+    def add(chat_id, task):
+        store.add(chat_id, task)
+        index.add(chat_id, task)
+    return add
+
+
+@pytest.fixture
+def rejected(monkeypatch):
+    counter = quotas.metrics.Counter('test_rejected_total', 'Rejected in a test.', ('limit',))
+    monkeypatch.setattr(quotas, 'reminders_rejected', counter)
+    return counter
+
+
+def make_quota(**limits):
+    settings = dict(
+        max_per_chat=0, max_total=0, max_per_chat_slot=0, max_per_slot=0,
+        max_rule_fires_per_chat=0, max_rule_fires=0, rate=0, burst=1,
+    )
+    settings.update(limits)
+    return CreationQuota(**settings)
+
+
+def daily(task_id, time='08:00'):
+    return Task.from_dict({'id': task_id, 'message': 'a', 'type': 'daily', 'frequency': 'everyday', 'time': time})
+
+
+def once(task_id, day='2026-10-19', time='08:00'):
+    return Task.from_dict({'id': task_id, 'message': 'b', 'type': 'one_time', 'date': day, 'time': time})
+
+
+def cron(task_id, rule):
+    return Task.from_dict({'id': task_id, 'message': 'c', 'type': 'cron', 'rule': rule})
+
+
+def refused(quota, chat_id, new_tasks):
+    with pytest.raises(QuotaExceeded) as info:
+        quota.check(chat_id, new_tasks)
+    return info.value.reason
+
+
+def test_chat_and_total_limits(store, rejected):
+    store('1', daily(1))
+    store('2', daily(2, '09:00'))
+    quota = make_quota(max_per_chat=2, max_total=3)
+
+    quota.check('1', [daily(3, '10:00')])
+    assert refused(quota, '1', [daily(3, '10:00'), daily(4, '11:00')]) == 'chat'
+    store('1', daily(3, '10:00'))
+    assert refused(quota, '2', [daily(4, '11:00')]) == 'total'
+    assert rejected._values == {('chat',): 2, ('total',): 1}
+
+
+def test_slot_limits_count_the_same_utc_minute(store, rejected):
+    store('1', daily(1))
+    store('2', daily(2))
+    quota = make_quota(max_per_chat_slot=2, max_per_slot=3)
+
+    quota.check('1', [daily(3)])
+    assert refused(quota, '1', [daily(3), daily(4)]) == 'chat_slot'
+    # A one-time reminder at that minute shares the slot with the daily ones
+    store('3', once(3))
+    assert refused(quota, '3', [once(4)]) == 'slot'
+    quota.check('3', [once(4, time='08:01')])
+
+
+def test_cron_rules_count_their_fires_per_day(store, rejected):
+    quota = make_quota(max_rule_fires_per_chat=24 * 60, max_rule_fires=4000)
+
+    quota.check('1', [cron(1, '* * * * *')])
+    store('1', cron(1, '* * * * *'))
+    assert refused(quota, '1', [cron(2, '* * * * *')]) == 'chat_rule_fires'
+    assert refused(quota, '1', [cron(2, '0 9 * * *')]) == 'chat_rule_fires'
+
+    store('2', cron(2, '* * * * *'))
+    store('3', cron(3, '*/2 * * * *'))
+    assert refused(quota, '4', [cron(4, '*/2 * * * *')]) == 'rule_fires'
+    quota.check('4', [cron(4, '0 9-17 * * MON-FRI')])
+    assert rejected._values == {('chat_rule_fires',): 2, ('rule_fires',): 1}
+
+
+def test_removed_cron_rules_free_their_fires(store):
+    quota = make_quota(max_rule_fires_per_chat=100)
+    rule = cron(1, '*/15 * * * *')
+    store('1', rule)
+    assert refused(quota, '1', [cron(2, '*/15 * * * *')]) == 'chat_rule_fires'
+
+    quotas.index.remove('1', rule)
+    quota.check('1', [cron(2, '*/15 * * * *')])
+
+
+def test_rate_limit_allows_a_burst_then_refills(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dispatcher.time, 'monotonic', clock)
+    quota = make_quota(rate=6, burst=2)
+
+    assert quota.allow_command('1')
+    assert quota.allow_command('1')
+    assert not quota.allow_command('1')
+    # Other chats have their own bucket
+    assert quota.allow_command('2')
+    # 6 a minute is one every 10 seconds
+    clock.now += 10
+    assert quota.allow_command('1')
+    assert not quota.allow_command('1')
+
+
+def test_zero_means_no_limit(store):
+    store('1', daily(1))
+    quota = make_quota()
+    quota.check('1', [daily(2), cron(3, '* * * * *'), cron(4, '* * * * *')])
+    assert all(quota.allow_command('1') for _ in range(100))
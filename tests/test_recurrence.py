@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from recurrence import compile_rule
+
+BERLIN = ZoneInfo('Europe/Berlin')
+
+
+def brute_force_next(rule, after, limit_days=400):
+    moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    end = moment + timedelta(days=limit_days)
+    while moment < end:
+        if rule.matches(moment.date(), moment.hour * 60 + moment.minute):
+            return moment
+        moment += timedelta(minutes=1)
+    return None
+
+
+@pytest.mark.parametrize('expression', [
+    '*/15 * * * *',
+    '0 9 * * MON-FRI',
+    '30 8 1,15 * *',
+    '0 9 * * MON#1',
+    '0 18 * * 5L',
+    '0 12 13 * FRI',
+    '45 23 28-31 * *',
+    '0 0 * FEB,AUG SUN',
+    '@daily',
+])
+def test_next_after_matches_brute_force(expression):
+    rule = compile_rule(expression)
+    after = datetime(2026, 10, 17, 13, 7)
+    for _ in range(5):
+        expected = brute_force_next(rule, after)
+        assert rule.next_after(after) == expected
+        after = expected
+
+
+def test_nth_and_last_weekday():
+    assert compile_rule('0 9 * * MON#1').next_after(datetime(2026, 10, 17)) == datetime(2026, 11, 2, 9, 0)
+    assert compile_rule('0 9 * * 5L').next_after(datetime(2026, 10, 17)) == datetime(2026, 10, 30, 9, 0)
+
+
+def test_leap_day():
+    assert compile_rule('0 0 29 2 *').next_after(datetime(2026, 1, 1)) == datetime(2028, 2, 29, 0, 0)
+
+
+def test_rule_that_never_fires_is_rejected():
+    with pytest.raises(ValueError):
+        compile_rule('0 0 31 2 *')
+
+
+def test_next_fire_in_dst_gap_fires_after_it():
+    # 02:30 doesn't exist in Berlin on 2027-03-28; it fires at 03:30 CEST
+    rule = compile_rule('30 2 * * *')
+    fire_at = rule.next_fire(datetime(2027, 3, 28, 0, 0, tzinfo=timezone.utc), BERLIN)
+    assert fire_at == datetime(2027, 3, 28, 1, 30, tzinfo=timezone.utc)
+
+
+def test_next_fire_in_repeated_hour_fires_once():
+    # 02:30 happens twice in Berlin on 2027-10-31
+    rule = compile_rule('30 2 * * *')
+    first = rule.next_fire(datetime(2027, 10, 31, 0, 0, tzinfo=timezone.utc), BERLIN)
+    assert first == datetime(2027, 10, 31, 0, 30, tzinfo=timezone.utc)
+    assert rule.next_fire(first, BERLIN) == datetime(2027, 11, 1, 1, 30, tzinfo=timezone.utc)
+
+
+def test_next_fire_keeps_local_time_across_dst():
+    rule = compile_rule('0 9 * * *')
+    summer = rule.next_fire(datetime(2027, 10, 29, 12, 0, tzinfo=timezone.utc), BERLIN)
+    winter = rule.next_fire(summer, BERLIN)
+    assert summer == datetime(2027, 10, 30, 7, 0, tzinfo=timezone.utc)
+    assert winter == datetime(2027, 10, 31, 8, 0, tzinfo=timezone.utc)
+    assert winter.astimezone(BERLIN).hour == 9
+
+
+def test_fires_per_day():
+    assert compile_rule('* * * * *').fires_per_day == 24 * 60
+    assert compile_rule('*/15 9-17 * * MON-FRI').fires_per_day == 4 * 9
+    assert compile_rule('@daily').fires_per_day == 1
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+from constants import CLAIM_WINDOW
+from models import Task
+from scheduler import ReminderIndex
+
+START = datetime(2026, 10, 19, 8, 0, tzinfo=timezone.utc)
+
+
+def make_index():
+    return ReminderIndex(lambda chat_id: 'UTC')
+
+
+def cron_task(task_id, rule):
+    return Task.from_dict({'id': task_id, 'message': 'cron', 'type': 'cron', 'rule': rule})
+
+
+def due_ids(index, moment):
+    return sorted(task.id for _, task in index.due(moment, refresh=False))
+
+
+def test_daily_and_one_time_tasks_are_due_at_their_minute():
+    index = make_index()
+    daily = Task.from_dict({'id': 1, 'message': 'a', 'type': 'daily', 'frequency': 'everyday', 'time': '08:05'})
+    once = Task.from_dict({'id': 2, 'message': 'b', 'type': 'one_time', 'date': '2026-10-19', 'time': '08:05'})
+    index.add('1', daily)
+    index.add('1', once)
+    assert due_ids(index, START + timedelta(minutes=5)) == [1, 2]
+    assert due_ids(index, START + timedelta(days=1, minutes=5)) == [1]
+    index.remove('1', daily)
+    assert due_ids(index, START + timedelta(days=1, minutes=5)) == []
+
+
+def test_advance_files_cron_tasks_for_the_claim_window():
+    index = make_index()
+    index.advance(START)
+    index.add('1', cron_task(1, '*/10 * * * *'))
+    fire_at = START + timedelta(minutes=10)
+
+    index.advance(fire_at - timedelta(minutes=1))
+    assert due_ids(index, fire_at) == []
+    index.advance(fire_at)
+    assert due_ids(index, fire_at) == [1]
+    # Still claimable for CLAIM_WINDOW minutes, then dropped
+    index.advance(fire_at + timedelta(minutes=CLAIM_WINDOW))
+    assert due_ids(index, fire_at) == [1]
+    index.advance(fire_at + timedelta(minutes=CLAIM_WINDOW + 1))
+    assert due_ids(index, fire_at) == []
+
+
+def test_advance_skips_fires_older_than_the_claim_window():
+    index = make_index()
+    index.advance(START)
+    index.add('1', cron_task(1, '* * * * *'))
+    now = START + timedelta(hours=3)
+    index.advance(now)
+    assert due_ids(index, START + timedelta(minutes=1)) == []
+    for minutes_ago in range(CLAIM_WINDOW + 1):
+        assert due_ids(index, now - timedelta(minutes=minutes_ago)) == [1]
+
+
+def test_rewind_replays_missed_fires():
+    index = make_index()
+    index.advance(START)
+    index.add('1', cron_task(1, '*/5 * * * *'))
+    now = START + timedelta(minutes=30)
+    index.advance(now)
+
+    index.rewind(START + timedelta(minutes=1))
+    fired = []
+    minute = START + timedelta(minutes=1)
+    while minute <= now:
+        index.advance(minute)
+        if due_ids(index, minute):
+            fired.append(minute)
+        minute += timedelta(minutes=1)
+    assert fired == [START + timedelta(minutes=offset) for offset in range(5, 31, 5)]
+
+
+def test_removed_cron_task_is_not_filed():
+    index = make_index()
+    index.advance(START)
+    task = cron_task(1, '* * * * *')
+    index.add('1', task)
+    index.remove('1', task)
+    index.advance(START + timedelta(minutes=1))
+    assert due_ids(index, START + timedelta(minutes=1)) == []
+
+
+def test_slot_load_counts_per_chat_as_tasks_come_and_go():
+    index = make_index()
+    daily = Task.from_dict({'id': 1, 'message': 'a', 'type': 'daily', 'frequency': 'everyday', 'time': '08:05'})
+    once = Task.from_dict({'id': 2, 'message': 'b', 'type': 'one_time', 'date': '2026-10-19', 'time': '08:05'})
+    other = Task.from_dict({'id': 3, 'message': 'c', 'type': 'one_time', 'date': '2026-10-19', 'time': '08:05'})
+    index.add('1', daily)
+    index.add('1', once)
+    index.add('2', other)
+    [slot] = index.slots('1', once)
+    # The dated slot also counts the daily task firing that minute
+    assert index.slot_load('1', slot) == (3, 2)
+    assert index.slot_load('2', slot) == (3, 1)
+    assert index.slot_load('3', slot) == (3, 0)
+
+    index.remove('1', once)
+    assert index.slot_load('1', slot) == (2, 1)
+    index.rebuild({'2': [other]})
+    assert index.slot_load('1', slot) == (1, 0)
+    assert index.slot_load('2', slot) == (1, 1)
+    index.remove('2', other)
+    assert index._chat_load == {}
@@ -0,0 +1,109 @@
+import json
+
+from storage import TaskJournal
+
+
+def task(task_id, message='x'):
+    return {'id': task_id, 'message': message}
+
+
+def write_records(journal, *records):
+    for record in records:
+        journal.append(record)
+    journal.flush()
+
+
+def test_reload_replays_the_journal(tmp_path):
+    journal = TaskJournal(str(tmp_path))
+    journal.load()
+    write_records(
+        journal,
+        {'op': 'add', 'chat': '1', 'task': task(1)},
+        {'op': 'add_batch', 'chat': '2', 'tasks': [task(2), task(3)]},
+        {'op': 'del', 'chat': '2', 'id': 2},
+        {'op': 'set', 'chat': '1', 'settings': {'timezone': 'Europe/Berlin'}},
+    )
+    journal.close()
+
+    reloaded = TaskJournal(str(tmp_path))
+    assert reloaded.load() == {'1': {1: task(1)}, '2': {3: task(3)}}
+    assert reloaded.chats == {'1': {'timezone': 'Europe/Berlin'}}
+    assert reloaded.seq == 4
+    assert reloaded.next_id == 4
+
+
+def test_torn_last_line_is_discarded_and_truncated(tmp_path):
+    journal = TaskJournal(str(tmp_path))
+    journal.load()
+    write_records(journal, {'op': 'add', 'chat': '1', 'task': task(1)})
+    journal.close()
+    with open(journal.journal_path, 'a') as f:
+        f.write('{"op":"add","chat":"1","task":{"id":2')
+
+    reloaded = TaskJournal(str(tmp_path))
+    assert reloaded.load() == {'1': {1: task(1)}}
+    # Records appended after recovery are not glued to the torn line
+    write_records(reloaded, {'op': 'add', 'chat': '1', 'task': task(2)})
+    reloaded.close()
+    assert TaskJournal(str(tmp_path)).load() == {'1': {1: task(1), 2: task(2)}}
+
+
+def test_compaction_keeps_records_queued_after_the_snapshot(tmp_path):
+    journal = TaskJournal(str(tmp_path))
+    journal.load()
+    write_records(journal, {'op': 'add', 'chat': '1', 'task': task(1)})
+    journal.compact({'1': [task(1)]})
+    write_records(journal, {'op': 'add', 'chat': '1', 'task': task(2)})
+    journal.close()
+
+    reloaded = TaskJournal(str(tmp_path))
+    assert reloaded.load() == {'1': {1: task(1), 2: task(2)}}
+    assert reloaded.records_since_snapshot == 1
+
+
+def test_records_in_the_snapshot_are_skipped_after_a_crash(tmp_path):
+    journal = TaskJournal(str(tmp_path))
+    journal.load()
+    write_records(
+        journal,
+        {'op': 'add', 'chat': '1', 'task': task(1)},
+        {'op': 'add', 'chat': '1', 'task': task(2)},
+    )
+    # Crash between the snapshot rename and the journal truncation
+    journal._write_snapshot({'1': [task(1), task(2)]})
+    write_records(journal, {'op': 'del', 'chat': '1', 'id': 1})
+    journal.close()
+
+    reloaded = TaskJournal(str(tmp_path))
+    assert reloaded.load() == {'1': {2: task(2)}}
+    assert reloaded.records_since_snapshot == 1
+
+
+def test_records_without_ids_are_numbered_in_file_order(tmp_path):
+    with open(tmp_path / 'tasks.json', 'w') as f:
+        json.dump({'1': [{'message': 'a'}]}, f)
+    with open(tmp_path / 'tasks.journal', 'w') as f:
+        for record in (
+            {'op': 'add', 'chat': '1', 'task': {'message': 'b'}, 'seq': 1},
+            {'op': 'add_batch', 'chat': '2', 'tasks': [{'message': 'c'}], 'seq': 2},
+        ):
+            f.write(json.dumps(record) + '\n')
+
+    journal = TaskJournal(str(tmp_path))
+    loaded = journal.load()
+    assert {chat_id: sorted(chat_tasks) for chat_id, chat_tasks in loaded.items()} == {'1': [1, 2], '2': [3]}
+    assert journal.next_id == 4
+
+
+def test_follower_polls_appended_records_until_compaction(tmp_path):
+    writer = TaskJournal(str(tmp_path))
+    writer.load()
+    follower = TaskJournal(str(tmp_path), read_only=True)
+    follower.load()
+
+    write_records(writer, {'op': 'add', 'chat': '1', 'task': task(1)})
+    assert [record['op'] for record in follower.poll()] == ['add']
+    assert follower.poll() == []
+    writer.compact({'1': [task(1)]})
+    assert follower.poll() is None
+    writer.close()
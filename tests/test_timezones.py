@@ -0,0 +1,12 @@
+from timezones import is_valid_timezone
+
+
+def test_known_zone_is_valid():
+    assert is_valid_timezone('Europe/Berlin')
+
+
+def test_unknown_names_and_regions_are_invalid():
+    assert not is_valid_timezone('Mars/Olympus')
+    assert not is_valid_timezone('Europe')
+    assert not is_valid_timezone('America')
+    assert not is_valid_timezone('../etc')
@@ -0,0 +1,69 @@
+from models import Task
+from transfer import build_tasks, parse_csv, parse_ical, export_csv, export_ical
+
+
+def make_tasks():
+    return [
+        Task.from_dict({'message': 'Dentist, 2nd floor', 'type': 'one_time', 'date': '2027-01-15', 'time': '09:00'}),
+        Task.from_dict({'message': 'Stand-up', 'type': 'daily', 'frequency': 'custom',
+                        'days': ['Mo', 'We', 'Fr'], 'time': '10:30'}),
+        Task.from_dict({'message': 'Water plants', 'type': 'daily', 'frequency': 'everyday', 'time': '08:00'}),
+        Task.from_dict({'message': 'Rent', 'type': 'cron', 'rule': '0 9 1 * *'}),
+    ]
+
+
+def imported(rows):
+    errors = []
+    return [task.to_dict() for task in build_tasks(rows, errors)], errors
+
+
+def lines_of(chunks):
+    return ''.join(chunks).splitlines(keepends=True)
+
+
+def test_csv_round_trip():
+    tasks = make_tasks()
+    result, errors = imported(parse_csv(lines_of(export_csv(tasks))))
+    assert errors == []
+    assert result == [task.to_dict() for task in tasks]
+
+
+def test_ical_round_trip_leaves_out_cron_rules():
+    tasks = make_tasks()
+    result, errors = imported(parse_ical(lines_of(export_ical(tasks, 'Europe/Berlin')), 'Europe/Berlin'))
+    assert errors == []
+    assert result == [task.to_dict() for task in tasks if task.rule is None]
+
+
+def test_invalid_csv_rows_are_reported_with_their_line():
+    lines = [
+        'message,time,days\n',
+        'ok,09:00,\n',
+        'bad time,9am,\n',
+        'bad day,09:00,Xx\n',
+    ]
+    result, errors = imported(parse_csv(lines))
+    assert len(result) == 1
+    assert [line for line, _ in errors] == [3, 4]
+
+
+def test_oversized_csv_field_is_a_row_error():
+    lines = ['message,time\n', 'x' * 200000 + ',09:00\n', 'ok,10:00\n']
+    result, errors = imported(parse_csv(lines))
+    assert [task['message'] for task in result] == ['ok']
+    assert errors[0][0] == 2
+    assert 'unreadable row' in errors[0][1]
+
+
+def test_ical_event_with_a_region_as_zone_is_a_row_error():
+    lines = [
+        'BEGIN:VCALENDAR\r\n',
+        'BEGIN:VEVENT\r\n',
+        'SUMMARY:Call\r\n',
+        'DTSTART;TZID=Europe:20270115T090000\r\n',
+        'END:VEVENT\r\n',
+        'END:VCALENDAR\r\n',
+    ]
+    result, errors = imported(parse_ical(lines))
+    assert result == []
+    assert errors == [(2, "unknown time zone 'Europe'")]
@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update
+
+from update_processor import ChatOrderedUpdateProcessor, ordering_key
+
+
+def update(update_id, chat_id):
+    chat = Chat(chat_id, Chat.PRIVATE)
+    return Update(update_id, message=Message(update_id, datetime.now(timezone.utc), chat, text='hi'))
+
+
+class Recorder:
+    """Coroutines that log their start and end and finish when released."""
+
+    def __init__(self):
+        self.log = []
+        self.gates = {}
+
+    async def handle(self, name):
+        self.log.append(('start', name))
+        await self.gates.setdefault(name, asyncio.Event()).wait()
+        self.log.append(('end', name))
+
+    def release(self, name):
+        self.gates.setdefault(name, asyncio.Event()).set()
+
+    def started(self):
+        return [name for event, name in self.log if event == 'start']
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_ordering_key_is_the_chat():
+    assert ordering_key(update(1, 42)) == ('chat', 42)
+    assert ordering_key('not an update') is None
+
+
+def test_updates_of_one_chat_run_in_order():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(workers=4, max_pending=16)
+        recorder = Recorder()
+        tasks = [
+            asyncio.create_task(processor.process_update(update(i, 42), recorder.handle(i)))
+            for i in range(3)
+        ]
+        await settle()
+        assert recorder.started() == [0]
+        assert processor.running == 1 and processor.waiting == 2
+
+        for i in range(3):
+            recorder.release(i)
+        await asyncio.gather(*tasks)
+        return recorder.log
+
+    assert asyncio.run(scenario()) == [
+        ('start', 0), ('end', 0), ('start', 1), ('end', 1), ('start', 2), ('end', 2)
+    ]
+
+
+def test_different_chats_run_concurrently_up_to_the_worker_cap():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(workers=2, max_pending=16)
+        recorder = Recorder()
+        tasks = [
+            asyncio.create_task(processor.process_update(update(i, 100 + i), recorder.handle(i)))
+            for i in range(3)
+        ]
+        await settle()
+        assert recorder.started() == [0, 1]
+        assert processor.running == 2
+
+        recorder.release(0)
+        await settle()
+        assert recorder.started() == [0, 1, 2]
+        recorder.release(1)
+        recorder.release(2)
+        await asyncio.gather(*tasks)
+        await settle()
+        assert processor._tails == {}
+
+    asyncio.run(scenario())
+
+
+def test_a_busy_chat_does_not_hold_workers():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(workers=2, max_pending=16)
+        recorder = Recorder()
+        tasks = [
+            asyncio.create_task(processor.process_update(update(i, 42), recorder.handle(i)))
+            for i in range(3)
+        ]
+        tasks.append(asyncio.create_task(processor.process_update(update(3, 43), recorder.handle(3))))
+        await settle()
+        # Updates 1 and 2 wait for update 0 without taking the second worker
+        assert recorder.started() == [0, 3]
+
+        for i in range(4):
+            recorder.release(i)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiting_update_keeps_the_chat_in_order():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(workers=4, max_pending=16)
+        recorder = Recorder()
+        first = asyncio.create_task(processor.process_update(update(0, 42), recorder.handle(0)))
+        second = asyncio.create_task(processor.process_update(update(1, 42), recorder.handle(1)))
+        await settle()
+        second.cancel()
+        await settle()
+        assert second.cancelled()
+
+        third = asyncio.create_task(processor.process_update(update(2, 42), recorder.handle(2)))
+        await settle()
+        # The cancelled update never runs, and the next one still waits for the first
+        assert recorder.started() == [0]
+
+        recorder.release(0)
+        recorder.release(2)
+        await asyncio.gather(first, third)
+        await settle()
+        assert recorder.started() == [0, 2]
+        assert processor._tails == {}
+
+    asyncio.run(scenario())
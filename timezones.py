@@ -0,0 +1,67 @@
+import os
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Where the host's zone is configured when TZ is not set
+LOCALTIME_PATH = '/etc/localtime'
+TIMEZONE_PATH = '/etc/timezone'
+
+
+def _zone_key(value):
+    """IANA name from a TZ value or a path into a zoneinfo directory, if it is one."""
+    value = (value or '').strip().lstrip(':')
+    if 'zoneinfo/' in value:
+        value = value.split('zoneinfo/', 1)[1]
+    if not value or not is_valid_timezone(value):
+        return None
+    return value
+
+
+@lru_cache(maxsize=None)
+def host_timezone_name():
+    """IANA name of the server's zone, from TZ or /etc/localtime, or None if unknown."""
+    name = _zone_key(os.getenv('TZ'))
+    if name:
+        return name
+    if os.path.islink(LOCALTIME_PATH):
+        name = _zone_key(os.path.realpath(LOCALTIME_PATH))
+        if name:
+            return name
+    try:
+        with open(TIMEZONE_PATH) as file:
+            return _zone_key(file.read())
+    except OSError:
+        return None
+
+
+def default_timezone_name():
+    """Name of the zone used by chats that haven't picked one."""
+    return os.getenv('DEFAULT_TIMEZONE') or host_timezone_name() or 'UTC'
+
+
+@lru_cache(maxsize=None)
+def get_zone(name=None):
+    """Return the tzinfo for a zone name, or the default zone for None.
+
+    Without DEFAULT_TIMEZONE the server's zone is used, as before per-chat
+    time zones existed. It is looked up as a ZoneInfo so its DST rules
+    apply, not as the UTC offset in effect at startup.
+    """
+    if name is None:
+        name = os.getenv('DEFAULT_TIMEZONE') or host_timezone_name()
+        if not name:
+            if os.path.exists(LOCALTIME_PATH):
+                with open(LOCALTIME_PATH, 'rb') as file:
+                    return ZoneInfo.from_file(file, key='localtime')
+            return ZoneInfo('UTC')
+    return ZoneInfo(name)
+
+
+def is_valid_timezone(name):
+    """Check whether a name is a known IANA time zone (e.g. Europe/Berlin)."""
+    try:
+        get_zone(name)
+    except (ZoneInfoNotFoundError, ValueError, OSError):
+        # Region names like 'Europe' are directories of the zone database
+        return False
+    return True
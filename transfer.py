@@ -0,0 +1,266 @@
+import csv
+import logging
+from datetime import datetime, date, timedelta, timezone
+
+from constants import ONE_TIME, DAILY, CRON, VALID_DAYS
+from models import Task, TaskType, Frequency, parse_date, parse_time, invalid_days
+from recurrence import compile_rule
+from timezones import get_zone
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Columns written by /export and understood by /import
+CSV_FIELDS = ('message', 'type', 'date', 'frequency', 'days', 'time', 'rule')
+
+# iCalendar weekday codes, in VALID_DAYS order
+ICAL_DAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def task_from_fields(fields):
+    """Build a Task from imported fields, validated like the /add conversation.
+
+    `type` and `frequency` may be left out: rows with a cron rule follow it,
+    rows with a date are one-time reminders, rows with days recur on those
+    days, others recur every day. Raises ValueError with a user-facing
+    reason for invalid rows.
+    """
+    message = (fields.get('message') or '').strip()
+    if not message:
+        raise ValueError("missing message")
+
+    rule = ' '.join((fields.get('rule') or '').split())
+    if rule or (fields.get('type') or '').strip() == CRON:
+        try:
+            rule = compile_rule(rule).expression
+        except ValueError as e:
+            raise ValueError(f"invalid rule {rule!r}: {e}") from None
+        return Task.from_dict({'message': message, 'type': CRON, 'rule': rule})
+
+    time_str = (fields.get('time') or '').strip()
+    try:
+        parse_time(time_str)
+    except ValueError:
+        raise ValueError(f"invalid time {time_str!r}, use HH:MM") from None
+
+    date_str = (fields.get('date') or '').strip()
+    days_str = (fields.get('days') or '').strip()
+    task_type = (fields.get('type') or '').strip() or (ONE_TIME if date_str else DAILY)
+    task_data = {'message': message, 'type': task_type, 'time': time_str}
+
+    if task_type == ONE_TIME:
+        try:
+            parse_date(date_str)
+        except ValueError:
+            raise ValueError(f"invalid date {date_str!r}, use YYYY-MM-DD") from None
+        task_data['date'] = date_str
+    elif task_type == DAILY:
+        frequency = (fields.get('frequency') or '').strip() or ('custom' if days_str else 'everyday')
+        if frequency == 'custom':
+            days = [day.strip() for day in days_str.split(',')]
+            invalid = invalid_days(days)
+            if invalid:
+                raise ValueError(f"invalid day(s) {', '.join(invalid)}, use Mo, Tu, We, Th, Fr, Sa, Su")
+            task_data['days'] = days
+        elif frequency != 'everyday':
+            raise ValueError(f"invalid frequency {frequency!r}, use everyday or custom")
+        task_data['frequency'] = frequency
+    else:
+        raise ValueError(f"invalid type {task_type!r}, use {ONE_TIME}, {DAILY} or {CRON}")
+
+    return Task.from_dict(task_data)
+
+
+def build_tasks(rows, errors):
+    """Turn (line number, fields) rows into Tasks, collecting invalid rows in `errors`."""
+    for line_number, fields in rows:
+        try:
+            if isinstance(fields, Exception):
+                raise fields
+            yield task_from_fields(fields)
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+
+
+def parse_csv(lines):
+    """Yield (line number, fields) for each row of a CSV file with a header row.
+
+    Rows the csv module can't read, e.g. with a field over its size limit,
+    are yielded as the ValueError explaining why.
+    """
+    reader = csv.DictReader(lines)
+    rows = iter(reader)
+    while True:
+        try:
+            fields = next(rows)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # The reader moves on to the next line; line_num isn't advanced for the bad one
+            yield reader.line_num + 1, ValueError(f"unreadable row: {e}")
+            continue
+        yield reader.line_num, fields
+
+
+def _unfold(lines):
+    """Join iCalendar continuation lines, yielding (line number, content line)."""
+    current = None
+    start = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, line_number
+    if current:
+        yield start, current
+
+
+def _split_property(line):
+    """Split 'NAME;PARAM=x:value' into (NAME, {PARAM: x}, value)."""
+    head, _, value = line.partition(':')
+    name, *params = head.split(';')
+    return name.upper(), dict(param.partition('=')[::2] for param in params), value
+
+
+def _unescape(text):
+    return (text.replace('\\n', '\n').replace('\\N', '\n')
+            .replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\'))
+
+
+def _event_fields(event, zone_name):
+    """Convert a VEVENT's SUMMARY, DTSTART and RRULE to import fields."""
+    if 'DTSTART' not in event:
+        raise ValueError("event has no DTSTART")
+    params, value = event['DTSTART']
+    if 'T' not in value:
+        raise ValueError("all-day events have no time to remind at")
+
+    start = datetime.strptime(value.rstrip('Z')[:15], '%Y%m%dT%H%M%S')
+    if value.endswith('Z'):
+        start = start.replace(tzinfo=timezone.utc)
+    elif 'TZID' in params:
+        try:
+            start = start.replace(tzinfo=get_zone(params['TZID'].strip('"')))
+        except (KeyError, ValueError, OSError):
+            raise ValueError(f"unknown time zone {params['TZID']!r}") from None
+    local = start.astimezone(get_zone(zone_name)) if start.tzinfo else start
+    # Weekdays move with the start when the zone conversion crosses midnight
+    day_shift = (local.date() - start.date()).days
+
+    fields = {'message': _unescape(event.get('SUMMARY', '')), 'time': local.strftime('%H:%M')}
+    rrule = event.get('RRULE')
+    if rrule is None:
+        fields['date'] = local.date().isoformat()
+        return fields
+
+    rule = dict(part.partition('=')[::2] for part in rrule.upper().split(';'))
+    if rule.get('INTERVAL', '1') != '1' or 'COUNT' in rule or 'UNTIL' in rule:
+        raise ValueError(f"unsupported recurrence {rrule!r}")
+    if rule.get('FREQ') == 'DAILY':
+        fields['frequency'] = 'everyday'
+    elif rule.get('FREQ') == 'WEEKLY':
+        by_day = rule.get('BYDAY')
+        weekdays = [ICAL_DAYS.index(day) for day in by_day.split(',')] if by_day else [start.weekday()]
+        fields['days'] = ','.join(VALID_DAYS[(weekday + day_shift) % 7] for weekday in weekdays)
+    else:
+        raise ValueError(f"unsupported recurrence {rrule!r}")
+    return fields
+
+
+def parse_ical(lines, zone_name=None):
+    """Yield (line number, fields) for each VEVENT of an iCalendar file.
+
+    Times are converted to the chat's zone; floating times are taken as
+    already being in it. Rows that can't be converted are yielded as the
+    ValueError explaining why.
+    """
+    event = None
+    event_line = 0
+    for line_number, line in _unfold(lines):
+        name, params, value = _split_property(line)
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event, event_line = {}, line_number
+        elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+            try:
+                yield event_line, _event_fields(event, zone_name)
+            except (ValueError, IndexError) as e:
+                yield event_line, ValueError(str(e) or "invalid event")
+            event = None
+        elif event is not None and name in ('SUMMARY', 'RRULE'):
+            event[name] = value
+        elif event is not None and name == 'DTSTART':
+            event[name] = (params, value)
+
+
+class _Echo:
+    """File-like object whose write returns the line, so csv.writer rows can be yielded."""
+
+    def write(self, line):
+        return line
+
+
+def export_csv(chat_tasks):
+    """Yield the lines of a CSV file with the given tasks."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for task in chat_tasks:
+        yield writer.writerow((
+            task.message,
+            task.type.code,
+            task.date_str or '',
+            task.frequency.code if task.frequency != Frequency.NONE else '',
+            ','.join(task.day_codes) if task.frequency == Frequency.CUSTOM else '',
+            task.time or '',
+            task.rule or '',
+        ))
+
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\n', '\\n'))
+
+
+def export_ical(chat_tasks, zone_name=None):
+    """Yield the lines of an iCalendar file with the given tasks.
+
+    Times are written in the chat's zone, or as floating times when the chat
+    uses the default zone. Cron reminders have no general RRULE equivalent
+    and are left out.
+    """
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    today = date.today()
+    tzid = f";TZID={zone_name}" if zone_name else ''
+
+    yield 'BEGIN:VCALENDAR\r\n'
+    yield 'VERSION:2.0\r\n'
+    yield 'PRODID:-//remindme-tg-bot//EN\r\n'
+    for task in chat_tasks:
+        if task.type == TaskType.CRON:
+            continue
+        if task.type == TaskType.ONE_TIME:
+            start_date = date.fromordinal(task.date)
+            rrule = None
+        elif task.frequency == Frequency.EVERYDAY:
+            start_date = today
+            rrule = 'FREQ=DAILY'
+        else:
+            # Start on the next day the reminder fires
+            start_date = next(
+                today + timedelta(days=offset) for offset in range(7)
+                if task.days >> (today + timedelta(days=offset)).weekday() & 1
+            )
+            days = ','.join(ICAL_DAYS[VALID_DAYS.index(day)] for day in task.day_codes)
+            rrule = f'FREQ=WEEKLY;BYDAY={days}'
+
+        yield 'BEGIN:VEVENT\r\n'
+        yield f'UID:task-{task.id}@remindme-tg-bot\r\n'
+        yield f'DTSTAMP:{stamp}\r\n'
+        yield f'DTSTART{tzid}:{start_date:%Y%m%d}T{task.minute // 60:02d}{task.minute % 60:02d}00\r\n'
+        if rrule:
+            yield f'RRULE:{rrule}\r\n'
+        yield f'SUMMARY:{_escape(task.message)}\r\n'
+        yield 'END:VEVENT\r\n'
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,118 @@
+import os
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+from constants import UPDATE_WORKERS, MAX_PENDING_UPDATES
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+def ordering_key(update):
+    """Updates with the same key are processed one at a time, in order.
+
+    That is the chat, which covers every conversation in it, or the user
+    for updates without a chat. Other updates have no ordering (None).
+    """
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return ('chat', update.effective_chat.id)
+    if update.effective_user is not None:
+        return ('user', update.effective_user.id)
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently, but one at a time and in order per chat.
+
+    At most `workers` updates run at once. Updates waiting for an earlier
+    update of their chat don't hold a worker, so one busy chat can't stall
+    the others. At most `max_pending` updates are accepted, running or
+    waiting, before new ones wait to be accepted in arrival order.
+
+    Updates reach `do_process_update` in the order they were received, and
+    each one is chained behind the previous update of its chat before the
+    first await, so the chain follows that order.
+    """
+
+    __slots__ = ('workers', '_workers', '_tails', '_running')
+
+    def __init__(self, workers, max_pending):
+        super().__init__(max_pending)
+        self.workers = workers
+        self._workers = asyncio.Semaphore(workers)
+        # Ordering key -> future resolved when its latest accepted update is done
+        self._tails = {}
+        self._running = 0
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def waiting(self):
+        return self.current_concurrent_updates - self._running
+
+    async def do_process_update(self, update, coroutine):
+        key = ordering_key(update)
+        if key is None:
+            async with self._workers:
+                await self._run(coroutine)
+            return
+
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        done.add_done_callback(lambda _: self._release(key, done))
+        started = False
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            async with self._workers:
+                started = True
+                await self._run(coroutine)
+        finally:
+            if not started:
+                coroutine.close()
+            if previous is not None and not previous.done():
+                # Cancelled while waiting: later updates still wait for the earlier one
+                previous.add_done_callback(lambda _: done.done() or done.set_result(None))
+            else:
+                done.set_result(None)
+
+    def _release(self, key, done):
+        # Only once the chain is resolved, or a later update could overtake an earlier one
+        if self._tails.get(key) is done:
+            del self._tails[key]
+
+    async def _run(self, coroutine):
+        self._running += 1
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+update_processor = ChatOrderedUpdateProcessor(
+    int(os.getenv('UPDATE_WORKERS', UPDATE_WORKERS)),
+    int(os.getenv('MAX_PENDING_UPDATES', MAX_PENDING_UPDATES)),
+)
+
+metrics.registry.register(metrics.Gauge(
+    'updates_running', 'Updates being handled.', callback=lambda: update_processor.running
+))
+metrics.registry.register(metrics.Gauge(
+    'updates_waiting', 'Updates waiting for an earlier update of their chat or a free worker.',
+    callback=lambda: update_processor.waiting
+))